@@ -2,14 +2,18 @@
 pragma solidity ^0.8.20;
 
 import "./EnergyToken.sol";
+import "@openzeppelin/contracts/access/Ownable.sol";
 
-contract Consumer {
+contract Consumer is Ownable {
     EnergyToken public energyToken;
     mapping(address => bool) public authorizedManagers;
+    // Accounts that settle on behalf of other participants, managed by the owner only
+    mapping(address => bool) public settlementOperators;
 
-    constructor(address _energyTokenAddress) {
+    constructor(address _energyTokenAddress) Ownable(msg.sender) {
         energyToken = EnergyToken(_energyTokenAddress);
         authorizedManagers[msg.sender] = true;
+        settlementOperators[msg.sender] = true;
     }
 
     modifier onlyAuthorized() {
@@ -17,10 +21,35 @@ contract Consumer {
         _;
     }
 
+    modifier onlySettlementOperator() {
+        require(settlementOperators[msg.sender], "Not a settlement operator");
+        _;
+    }
+
+    function addSettlementOperators(
+        address[] calldata operators
+    ) external onlyOwner {
+        for (uint256 i = 0; i < operators.length; i++) {
+            settlementOperators[operators[i]] = true;
+        }
+    }
+
+    function removeSettlementOperator(address operator) external onlyOwner {
+        settlementOperators[operator] = false;
+    }
+
     function addAuthorizedManager(address manager) external onlyAuthorized {
         authorizedManagers[manager] = true;
     }
 
+    function addAuthorizedManagers(
+        address[] calldata managers
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < managers.length; i++) {
+            authorizedManagers[managers[i]] = true;
+        }
+    }
+
     function removeAuthorizedManager(address manager) external onlyAuthorized {
         authorizedManagers[manager] = false;
     }
@@ -34,4 +63,26 @@ contract Consumer {
         energyToken.transferFrom(msg.sender, address(this), amount);
         energyToken.burn(amount);
     }
+
+    function consumeEnergyBatch(
+        address[] calldata consumers,
+        uint256[] calldata amounts
+    ) external onlySettlementOperator {
+        require(consumers.length == amounts.length, "Length mismatch");
+        uint256 total = 0;
+        for (uint256 i = 0; i < consumers.length; i++) {
+            require(
+                authorizedManagers[consumers[i]],
+                "Consumer not authorized"
+            );
+            require(
+                energyToken.balanceOf(consumers[i]) >= amounts[i],
+                "Insufficient energy tokens"
+            );
+
+            energyToken.transferFrom(consumers[i], address(this), amounts[i]);
+            total += amounts[i];
+        }
+        energyToken.burn(total);
+    }
 }
@@ -22,6 +22,14 @@ contract Producer {
         authorizedProducers[producer] = true;
     }
 
+    function addAuthorizedProducers(
+        address[] calldata producers
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < producers.length; i++) {
+            authorizedProducers[producers[i]] = true;
+        }
+    }
+
     function removeAuthorizedProducer(
         address producer
     ) external onlyAuthorized {
@@ -34,6 +42,14 @@ contract Producer {
         connectedTransmissionLines[transmissionLine] = true;
     }
 
+    function connectTransmissionLines(
+        address[] calldata transmissionLines
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < transmissionLines.length; i++) {
+            connectedTransmissionLines[transmissionLines[i]] = true;
+        }
+    }
+
     function disconnectTransmissionLine(
         address transmissionLine
     ) external onlyAuthorized {
@@ -50,4 +66,21 @@ contract Producer {
         );
         energyToken.mint(transmissionLine, amount);
     }
+
+    function produceEnergyBatch(
+        address[] calldata transmissionLines,
+        uint256[] calldata amounts
+    ) external onlyAuthorized {
+        require(
+            transmissionLines.length == amounts.length,
+            "Length mismatch"
+        );
+        for (uint256 i = 0; i < transmissionLines.length; i++) {
+            require(
+                connectedTransmissionLines[transmissionLines[i]],
+                "TransmissionLine not connected"
+            );
+            energyToken.mint(transmissionLines[i], amounts[i]);
+        }
+    }
 }
@@ -22,6 +22,14 @@ contract Substation {
         authorizedOperators[operator] = true;
     }
 
+    function addAuthorizedOperators(
+        address[] calldata operators
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < operators.length; i++) {
+            authorizedOperators[operators[i]] = true;
+        }
+    }
+
     function removeAuthorizedOperator(
         address operator
     ) external onlyAuthorized {
@@ -32,6 +40,14 @@ contract Substation {
         registeredConsumers[consumer] = true;
     }
 
+    function registerConsumers(
+        address[] calldata consumers
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < consumers.length; i++) {
+            registeredConsumers[consumers[i]] = true;
+        }
+    }
+
     function unregisterConsumer(address consumer) external onlyAuthorized {
         registeredConsumers[consumer] = false;
     }
@@ -46,4 +62,21 @@ contract Substation {
             "Transfer failed"
         );
     }
+
+    function distributeEnergyBatch(
+        address[] calldata consumers,
+        uint256[] calldata amounts
+    ) external onlyAuthorized {
+        require(consumers.length == amounts.length, "Length mismatch");
+        for (uint256 i = 0; i < consumers.length; i++) {
+            require(
+                registeredConsumers[consumers[i]],
+                "Consumer not registered"
+            );
+            require(
+                energyToken.transferFrom(msg.sender, consumers[i], amounts[i]),
+                "Transfer failed"
+            );
+        }
+    }
 }
@@ -2,14 +2,18 @@
 pragma solidity ^0.8.20;
 
 import "./EnergyToken.sol";
+import "@openzeppelin/contracts/access/Ownable.sol";
 
-contract TransmissionLine {
+contract TransmissionLine is Ownable {
     EnergyToken public energyToken;
     mapping(address => bool) public authorizedOperators;
+    // Accounts that settle on behalf of other participants, managed by the owner only
+    mapping(address => bool) public settlementOperators;
 
-    constructor(address _energyTokenAddress) {
+    constructor(address _energyTokenAddress) Ownable(msg.sender) {
         energyToken = EnergyToken(_energyTokenAddress);
         authorizedOperators[msg.sender] = true;
+        settlementOperators[msg.sender] = true;
     }
 
     modifier onlyAuthorized() {
@@ -17,10 +21,35 @@ contract TransmissionLine {
         _;
     }
 
+    modifier onlySettlementOperator() {
+        require(settlementOperators[msg.sender], "Not a settlement operator");
+        _;
+    }
+
+    function addSettlementOperators(
+        address[] calldata operators
+    ) external onlyOwner {
+        for (uint256 i = 0; i < operators.length; i++) {
+            settlementOperators[operators[i]] = true;
+        }
+    }
+
+    function removeSettlementOperator(address operator) external onlyOwner {
+        settlementOperators[operator] = false;
+    }
+
     function addAuthorizedOperator(address operator) external onlyAuthorized {
         authorizedOperators[operator] = true;
     }
 
+    function addAuthorizedOperators(
+        address[] calldata operators
+    ) external onlyAuthorized {
+        for (uint256 i = 0; i < operators.length; i++) {
+            authorizedOperators[operators[i]] = true;
+        }
+    }
+
     function removeAuthorizedOperator(
         address operator
     ) external onlyAuthorized {
@@ -36,4 +65,19 @@ contract TransmissionLine {
             "Transfer failed"
         );
     }
+
+    function transmitEnergyBatch(
+        address[] calldata lines,
+        address to,
+        uint256[] calldata amounts
+    ) external onlySettlementOperator {
+        require(lines.length == amounts.length, "Length mismatch");
+        for (uint256 i = 0; i < lines.length; i++) {
+            require(authorizedOperators[lines[i]], "Line not authorized");
+            require(
+                energyToken.transferFrom(lines[i], to, amounts[i]),
+                "Transfer failed"
+            );
+        }
+    }
 }
@@ -3,6 +3,12 @@ import "@nomicfoundation/hardhat-toolbox";
 
 const config: HardhatUserConfig = {
   solidity: "0.8.24",
+  networks: {
+    hardhat: {
+      // Large simulated grids need one funded account per participant
+      accounts: { count: Number(process.env.GRID_ACCOUNTS ?? 20) },
+    },
+  },
 };
 
 export default config;
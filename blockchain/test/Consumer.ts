@@ -89,4 +89,111 @@ describe("Consumer", function () {
       ).to.be.revertedWith("Insufficient energy tokens");
     });
   });
+
+  describe("Batch energy consumption", function () {
+    it("Should consume energy tokens for several consumers", async function () {
+      await consumer.addAuthorizedManager(
+        await unauthorizedAccount.getAddress()
+      );
+      await energyToken.mint(
+        await unauthorizedAccount.getAddress(),
+        ethers.parseEther("1000")
+      );
+      await energyToken
+        .connect(unauthorizedAccount)
+        .approve(await consumer.getAddress(), ethers.parseEther("1000"));
+
+      const supply = await energyToken.totalSupply();
+
+      await consumer.consumeEnergyBatch(
+        [
+          await authorizedManager.getAddress(),
+          await unauthorizedAccount.getAddress(),
+        ],
+        [ethers.parseEther("10"), ethers.parseEther("20")]
+      );
+
+      expect(
+        await energyToken.balanceOf(await authorizedManager.getAddress())
+      ).to.equal(ethers.parseEther("990"));
+      expect(
+        await energyToken.balanceOf(await unauthorizedAccount.getAddress())
+      ).to.equal(ethers.parseEther("980"));
+      expect(await energyToken.totalSupply()).to.equal(
+        supply - ethers.parseEther("30")
+      );
+    });
+
+    it("Should fail if a consumer is not authorized", async function () {
+      await expect(
+        consumer.consumeEnergyBatch(
+          [await unauthorizedAccount.getAddress()],
+          [ethers.parseEther("10")]
+        )
+      ).to.be.revertedWith("Consumer not authorized");
+    });
+
+    it("Should fail when a participant consumes for other consumers", async function () {
+      await consumer.addAuthorizedManager(
+        await unauthorizedAccount.getAddress()
+      );
+
+      await expect(
+        consumer
+          .connect(unauthorizedAccount)
+          .consumeEnergyBatch(
+            [await authorizedManager.getAddress()],
+            [ethers.parseEther("10")]
+          )
+      ).to.be.revertedWith("Not a settlement operator");
+    });
+
+    it("Should let a settlement operator added by the owner consume", async function () {
+      await consumer.addSettlementOperators([
+        await unauthorizedAccount.getAddress(),
+      ]);
+
+      await consumer
+        .connect(unauthorizedAccount)
+        .consumeEnergyBatch(
+          [await authorizedManager.getAddress()],
+          [ethers.parseEther("10")]
+        );
+
+      expect(
+        await energyToken.balanceOf(await authorizedManager.getAddress())
+      ).to.equal(ethers.parseEther("990"));
+    });
+
+    it("Should fail when a participant adds settlement operators", async function () {
+      await expect(
+        consumer
+          .connect(authorizedManager)
+          .addSettlementOperators([await authorizedManager.getAddress()])
+      ).to.be.revertedWithCustomError(consumer, "OwnableUnauthorizedAccount");
+    });
+  });
+
+  describe("Batch onboarding", function () {
+    it("Should authorize several managers", async function () {
+      const addresses = [
+        await owner.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await consumer.addAuthorizedManagers(addresses);
+
+      for (const address of addresses) {
+        expect(await consumer.authorizedManagers(address)).to.be.true;
+      }
+    });
+
+    it("Should fail when unauthorized account tries to add managers", async function () {
+      await expect(
+        consumer
+          .connect(unauthorizedAccount)
+          .addAuthorizedManagers([await unauthorizedAccount.getAddress()])
+      ).to.be.revertedWith("Not authorized");
+    });
+  });
 });
@@ -120,4 +120,100 @@ describe("Producer", function () {
       ).to.be.revertedWith("Not authorized");
     });
   });
+
+  describe("Batch energy production", function () {
+    it("Should produce energy tokens for several transmission lines", async function () {
+      await producer.connectTransmissionLine(
+        await transmissionLine.getAddress()
+      );
+      await producer.connectTransmissionLine(
+        await unauthorizedAccount.getAddress()
+      );
+
+      await producer
+        .connect(authorizedProducer)
+        .produceEnergyBatch(
+          [
+            await transmissionLine.getAddress(),
+            await unauthorizedAccount.getAddress(),
+          ],
+          [ethers.parseEther("10"), ethers.parseEther("20")]
+        );
+
+      expect(
+        await energyToken.balanceOf(await transmissionLine.getAddress())
+      ).to.equal(ethers.parseEther("10"));
+      expect(
+        await energyToken.balanceOf(await unauthorizedAccount.getAddress())
+      ).to.equal(ethers.parseEther("20"));
+    });
+
+    it("Should fail if any transmission line is not connected", async function () {
+      await producer.connectTransmissionLine(
+        await transmissionLine.getAddress()
+      );
+
+      await expect(
+        producer
+          .connect(authorizedProducer)
+          .produceEnergyBatch(
+            [
+              await transmissionLine.getAddress(),
+              await unauthorizedAccount.getAddress(),
+            ],
+            [ethers.parseEther("10"), ethers.parseEther("20")]
+          )
+      ).to.be.revertedWith("TransmissionLine not connected");
+    });
+
+    it("Should fail if the array lengths differ", async function () {
+      await expect(
+        producer
+          .connect(authorizedProducer)
+          .produceEnergyBatch([await transmissionLine.getAddress()], [])
+      ).to.be.revertedWith("Length mismatch");
+    });
+  });
+
+  describe("Batch onboarding", function () {
+    it("Should authorize several producers", async function () {
+      const addresses = [
+        await transmissionLine.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await producer.addAuthorizedProducers(addresses);
+
+      for (const address of addresses) {
+        expect(await producer.authorizedProducers(address)).to.be.true;
+      }
+    });
+
+    it("Should connect several transmission lines", async function () {
+      const addresses = [
+        await transmissionLine.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await producer.connectTransmissionLines(addresses);
+
+      for (const address of addresses) {
+        expect(await producer.connectedTransmissionLines(address)).to.be.true;
+      }
+    });
+
+    it("Should fail when unauthorized account tries to onboard in batch", async function () {
+      await expect(
+        producer
+          .connect(unauthorizedAccount)
+          .addAuthorizedProducers([await unauthorizedAccount.getAddress()])
+      ).to.be.revertedWith("Not authorized");
+
+      await expect(
+        producer
+          .connect(unauthorizedAccount)
+          .connectTransmissionLines([await transmissionLine.getAddress()])
+      ).to.be.revertedWith("Not authorized");
+    });
+  });
 });
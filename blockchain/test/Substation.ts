@@ -133,4 +133,86 @@ describe("Substation", function () {
       );
     });
   });
+
+  describe("Batch energy distribution", function () {
+    it("Should distribute energy tokens to several consumers", async function () {
+      const consumerAddress = await consumer.getAddress();
+      const otherConsumerAddress = await unauthorizedAccount.getAddress();
+
+      await substation
+        .connect(authorizedOperator)
+        .registerConsumer(consumerAddress);
+      await substation
+        .connect(authorizedOperator)
+        .registerConsumer(otherConsumerAddress);
+
+      await substation
+        .connect(authorizedOperator)
+        .distributeEnergyBatch(
+          [consumerAddress, otherConsumerAddress],
+          [ethers.parseEther("10"), ethers.parseEther("20")]
+        );
+
+      expect(await energyToken.balanceOf(consumerAddress)).to.equal(
+        ethers.parseEther("10")
+      );
+      expect(await energyToken.balanceOf(otherConsumerAddress)).to.equal(
+        ethers.parseEther("20")
+      );
+    });
+
+    it("Should fail if any consumer is not registered", async function () {
+      await substation
+        .connect(authorizedOperator)
+        .registerConsumer(await consumer.getAddress());
+
+      await expect(
+        substation
+          .connect(authorizedOperator)
+          .distributeEnergyBatch(
+            [
+              await consumer.getAddress(),
+              await unauthorizedAccount.getAddress(),
+            ],
+            [ethers.parseEther("10"), ethers.parseEther("20")]
+          )
+      ).to.be.revertedWith("Consumer not registered");
+    });
+  });
+
+  describe("Batch onboarding", function () {
+    it("Should authorize several operators", async function () {
+      const addresses = [
+        await consumer.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await substation.addAuthorizedOperators(addresses);
+
+      for (const address of addresses) {
+        expect(await substation.authorizedOperators(address)).to.be.true;
+      }
+    });
+
+    it("Should register several consumers", async function () {
+      const addresses = [
+        await consumer.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await substation.connect(authorizedOperator).registerConsumers(addresses);
+
+      for (const address of addresses) {
+        expect(await substation.registeredConsumers(address)).to.be.true;
+      }
+    });
+
+    it("Should fail when unauthorized account tries to register consumers", async function () {
+      await expect(
+        substation
+          .connect(unauthorizedAccount)
+          .registerConsumers([await consumer.getAddress()])
+      ).to.be.revertedWith("Not authorized");
+    });
+  });
 });
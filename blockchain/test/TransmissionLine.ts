@@ -103,4 +103,116 @@ describe("TransmissionLine", function () {
       ).to.be.revertedWith("Not authorized");
     });
   });
+
+  describe("Batch energy transmission", function () {
+    it("Should transmit energy tokens from several lines", async function () {
+      await transmissionLine.addAuthorizedOperator(
+        await unauthorizedAccount.getAddress()
+      );
+      await energyToken.mint(
+        await unauthorizedAccount.getAddress(),
+        ethers.parseEther("1000")
+      );
+      await energyToken
+        .connect(unauthorizedAccount)
+        .approve(
+          await transmissionLine.getAddress(),
+          ethers.parseEther("1000")
+        );
+
+      await transmissionLine.transmitEnergyBatch(
+        [
+          await authorizedOperator.getAddress(),
+          await unauthorizedAccount.getAddress(),
+        ],
+        await to.getAddress(),
+        [ethers.parseEther("10"), ethers.parseEther("20")]
+      );
+
+      expect(await energyToken.balanceOf(await to.getAddress())).to.equal(
+        ethers.parseEther("30")
+      );
+      expect(
+        await energyToken.balanceOf(await authorizedOperator.getAddress())
+      ).to.equal(ethers.parseEther("990"));
+    });
+
+    it("Should fail if a line is not an authorized operator", async function () {
+      await expect(
+        transmissionLine.transmitEnergyBatch(
+          [await unauthorizedAccount.getAddress()],
+          await to.getAddress(),
+          [ethers.parseEther("10")]
+        )
+      ).to.be.revertedWith("Line not authorized");
+    });
+
+    it("Should fail when a line transmits from other lines", async function () {
+      await transmissionLine.addAuthorizedOperator(
+        await unauthorizedAccount.getAddress()
+      );
+
+      await expect(
+        transmissionLine
+          .connect(unauthorizedAccount)
+          .transmitEnergyBatch(
+            [await authorizedOperator.getAddress()],
+            await unauthorizedAccount.getAddress(),
+            [ethers.parseEther("10")]
+          )
+      ).to.be.revertedWith("Not a settlement operator");
+    });
+
+    it("Should let a settlement operator added by the owner transmit", async function () {
+      await transmissionLine.addSettlementOperators([
+        await unauthorizedAccount.getAddress(),
+      ]);
+
+      await transmissionLine
+        .connect(unauthorizedAccount)
+        .transmitEnergyBatch(
+          [await authorizedOperator.getAddress()],
+          await to.getAddress(),
+          [ethers.parseEther("10")]
+        );
+
+      expect(await energyToken.balanceOf(await to.getAddress())).to.equal(
+        ethers.parseEther("10")
+      );
+    });
+
+    it("Should fail when a line adds settlement operators", async function () {
+      await expect(
+        transmissionLine
+          .connect(authorizedOperator)
+          .addSettlementOperators([await authorizedOperator.getAddress()])
+      ).to.be.revertedWithCustomError(
+        transmissionLine,
+        "OwnableUnauthorizedAccount"
+      );
+    });
+  });
+
+  describe("Batch onboarding", function () {
+    it("Should authorize several operators", async function () {
+      const addresses = [
+        await to.getAddress(),
+        await unauthorizedAccount.getAddress(),
+      ];
+
+      await transmissionLine.addAuthorizedOperators(addresses);
+
+      for (const address of addresses) {
+        expect(await transmissionLine.authorizedOperators(address)).to.be.true;
+      }
+    });
+
+    it("Should fail when unauthorized account tries to add operators", async function () {
+      await expect(
+        transmissionLine
+          .connect(unauthorizedAccount)
+          .addAuthorizedOperators([await unauthorizedAccount.getAddress()])
+      ).to.be.revertedWith("Not authorized");
+    });
+  });
 });
@@ -0,0 +1,207 @@
+import sys
+import json
+import logging
+import argparse
+import platform
+import threading
+import tracemalloc
+from datetime import datetime
+from collections import Counter
+from time import perf_counter
+import numpy as np
+from hexbytes import HexBytes
+from models.ledger import set_ledger
+from models.onboarding import onboard
+from models.grid_simulator import GridSimulator
+from models.memory_ledger import InMemoryLedger
+from models.demand import DemandModel, RandomDemand
+from models.topology import generate_topology, build_topology
+
+logger = logging.getLogger(__name__)
+
+TIME_PERIOD = 5/60
+MAX_IN_FLIGHT = 16
+# Grid sizes as substations x consumers per substation
+SIZES = ['2x4', '10x100', '50x200']
+STEPS = 20
+LEDGERS = ['memory']
+# A scenario whose steps/sec drops by more than this against the baseline is a regression
+REGRESSION_TOLERANCE = 0.10
+
+class RpcRecorder:
+    # web3 middleware next to the provider: counts every JSON-RPC call by method and times
+    # each transaction from eth_sendRawTransaction to the first receipt returned for it
+    def __init__(self):
+        self.calls = Counter()
+        self.latencies = []
+        self._sent_at = {}
+        self._lock = threading.Lock()
+
+    def middleware(self, make_request, web3):
+        def record(method, params):
+            started_at = perf_counter()
+            response = make_request(method, params)
+            with self._lock:
+                self.calls[method] += 1
+                result = response.get('result')
+                if method == 'eth_sendRawTransaction' and result:
+                    self._sent_at[HexBytes(result).hex()] = started_at
+                elif method == 'eth_getTransactionReceipt' and result:
+                    sent_at = self._sent_at.pop(HexBytes(params[0]).hex(), None)
+                    if sent_at is not None:
+                        self.latencies.append(perf_counter() - sent_at)
+            return response
+        return record
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.latencies.clear()
+            self._sent_at.clear()
+
+_recorder = None
+
+def create_ledger(name):
+    global _recorder
+    if name == 'memory':
+        return InMemoryLedger(), None
+
+    from models.web3_ledger import Web3Ledger
+    from models.blockchain import get_blockchain_manager
+    blockchain_manager = get_blockchain_manager()
+    if _recorder is None:
+        _recorder = RpcRecorder()
+        blockchain_manager.web3.middleware_onion.inject(_recorder.middleware, name='benchmark', layer=0)
+    blockchain_manager.pipelined = True
+    blockchain_manager.max_in_flight = MAX_IN_FLIGHT
+    return Web3Ledger(blockchain_manager), _recorder
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+def run_scenario(ledger_name, substations, consumers_per_substation, steps, vectorized=False, parallel=False,
+                 batch_settlement=True, seed=0, trace_memory=True):
+    ledger, recorder = create_ledger(ledger_name)
+    set_ledger(ledger)
+
+    spec = generate_topology(substations, consumers_per_substation, time_period=TIME_PERIOD, seed=seed)
+    grid = build_topology(spec, batch_settlement=batch_settlement)
+    started_at = perf_counter()
+    onboard(grid)
+    onboarding_seconds = perf_counter() - started_at
+    # The same seed draws the same demand, so scenarios compare like with like
+    simulator = GridSimulator(grid, parallel=parallel, vectorized=vectorized, demand=DemandModel(RandomDemand(seed)))
+
+    if recorder:
+        recorder.reset()
+    transactions_before = ledger.transaction_count if recorder is None else 0
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    started_at = perf_counter()
+    try:
+        simulator.simulate(steps=steps)
+    finally:
+        elapsed = perf_counter() - started_at
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    if recorder:
+        transactions = recorder.calls['eth_sendRawTransaction']
+        rpc_calls = sum(recorder.calls.values())
+        latencies = recorder.latencies
+    else:
+        transactions = ledger.transaction_count - transactions_before
+        rpc_calls = 0
+        latencies = []
+
+    return {
+        'ledger': ledger_name,
+        'substations': substations,
+        'consumers_per_substation': consumers_per_substation,
+        'steps': steps,
+        'vectorized': vectorized,
+        'parallel': parallel,
+        'batch_settlement': batch_settlement,
+        'onboarding_seconds': onboarding_seconds,
+        'seconds': elapsed,
+        'steps_per_sec': steps / elapsed,
+        'transactions': transactions,
+        'transactions_per_sec': transactions / elapsed,
+        'rpc_calls_per_step': rpc_calls / steps,
+        'rpc_calls_by_method': dict(recorder.calls) if recorder else {},
+        'latency_p50_seconds': _percentile(latencies, 50),
+        'latency_p99_seconds': _percentile(latencies, 99),
+        'peak_memory_bytes': peak_memory,
+    }
+
+def _scenario_key(result):
+    return tuple(result[field] for field in ('ledger', 'substations', 'consumers_per_substation', 'steps', 'vectorized', 'parallel', 'batch_settlement'))
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # Returns the scenarios slower than the baseline by more than `tolerance`
+    baseline_results = {_scenario_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(_scenario_key(result))
+        if previous is None:
+            continue
+        ratio = result['steps_per_sec'] / previous['steps_per_sec']
+        if ratio < 1 - tolerance:
+            logger.warning(f"Regression in {_scenario_key(result)}: {result['steps_per_sec']:.2f} steps/sec, {ratio:.0%} of baseline")
+            regressions.append(result)
+        else:
+            logger.info(f"{_scenario_key(result)}: {result['steps_per_sec']:.2f} steps/sec, {ratio:.0%} of baseline")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GridSimulator over grid sizes and ledger backends")
+    parser.add_argument('--sizes', default=','.join(SIZES), help="comma separated SUBSTATIONSxCONSUMERS grid sizes")
+    parser.add_argument('--steps', type=int, default=STEPS)
+    parser.add_argument('--ledgers', default=','.join(LEDGERS), help="comma separated ledgers: memory, web3 (local dev node)")
+    parser.add_argument('--vectorized', action='store_true')
+    parser.add_argument('--parallel', action='store_true')
+    parser.add_argument('--per-flow', action='store_true', help="settle each flow in its own transaction")
+    parser.add_argument('--seed', type=int, default=0, help="seeds the generated grid and its demand")
+    parser.add_argument('--no-trace-memory', action='store_true', help="skip tracemalloc, which slows the run down")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help="earlier results file to compare steps/sec against")
+    args = parser.parse_args(argv)
+
+    # Only the benchmark's own records, not the simulator's per-step summaries
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    results = []
+    for ledger_name in args.ledgers.split(','):
+        for size in args.sizes.split(','):
+            substations, consumers_per_substation = map(int, size.split('x'))
+            result = run_scenario(ledger_name, substations, consumers_per_substation, args.steps, vectorized=args.vectorized,
+                                  parallel=args.parallel, batch_settlement=not args.per_flow, seed=args.seed,
+                                  trace_memory=not args.no_trace_memory)
+            logger.info(f"{ledger_name} {size}: {result['steps_per_sec']:.2f} steps/sec, {result['transactions_per_sec']:.1f} tx/sec, "
+                           f"{result['rpc_calls_per_step']:.1f} RPC calls/step")
+            results.append(result)
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, file, indent=2)
+    logger.info(f"Benchmark results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file))
+        if regressions:
+            logger.error(f"{len(regressions)} scenarios regressed by more than {REGRESSION_TOLERANCE:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import logging
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hexbytes import HexBytes
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_IN_FLIGHT = 4
+
+class BlockFetcher:
+    # Fetches blocks with full transactions through JSON-RPC batches sent over the
+    # web3 HTTPProvider endpoint, keeping at most `max_in_flight` batches outstanding
+    def __init__(self, web3: Web3, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT):
+        self.endpoint = web3.provider.endpoint_uri
+        self.request_kwargs = web3.provider.get_request_kwargs()
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.session = requests.Session()
+
+    def blocks(self, first_block: int, last_block: int):
+        # Yields blocks in order; a new batch is only requested once the caller has consumed
+        # the oldest one, so a slow consumer holds back the fetching
+        batches = (
+            range(start, min(start + self.batch_size, last_block + 1))
+            for start in range(first_block, last_block + 1, self.batch_size)
+        )
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(self._fetch_batch, batch))
+                if len(pending) >= self.max_in_flight:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def _fetch_batch(self, block_numbers: range):
+        payload = [
+            {'jsonrpc': '2.0', 'id': number, 'method': 'eth_getBlockByNumber', 'params': [hex(number), True]}
+            for number in block_numbers
+        ]
+        response = self.session.post(self.endpoint, json=payload, **self.request_kwargs)
+        response.raise_for_status()
+        results = response.json()
+        if not isinstance(results, list):
+            raise ValueError(f"Node rejected the JSON-RPC batch: {results}")
+
+        responses = {result['id']: result for result in results}
+        blocks = []
+        for number in block_numbers:
+            result = responses.get(number)
+            if result is None or 'error' in result or result.get('result') is None:
+                raise ValueError(f"Failed to fetch block {number}: {result}")
+            blocks.append(_format_block(result['result']))
+        logger.info(f"Fetched blocks {block_numbers.start} to {block_numbers.stop - 1}")
+        return blocks
+
+def _format_block(block):
+    return {
+        'number': int(block['number'], 16),
+        'hash': HexBytes(block['hash']),
+        'timestamp': int(block['timestamp'], 16),
+        'transactions': [_format_transaction(tx) for tx in block['transactions']],
+    }
+
+def _format_transaction(tx):
+    return {
+        'hash': HexBytes(tx['hash']),
+        'transactionIndex': int(tx['transactionIndex'], 16),
+        'from': Web3.to_checksum_address(tx['from']),
+        'to': Web3.to_checksum_address(tx['to']) if tx['to'] else None,
+        'input': tx['input'],
+    }
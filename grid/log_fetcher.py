@@ -0,0 +1,52 @@
+import logging
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_TOPIC = Web3.keccak(text='Transfer(address,address,uint256)')
+
+INITIAL_RANGE = 1_000
+MIN_RANGE = 1
+MAX_RANGE = 50_000
+
+# Errors nodes return when a single eth_getLogs call would match too much
+RANGE_ERRORS = ('query returned more than', 'too many', 'limit exceeded', 'response size', 'range too large', 'block range', 'timeout')
+
+def is_range_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERRORS)
+
+class LogFetcher:
+    # Reads logs of one contract over block ranges with eth_getLogs. The node answers from
+    # its per-block bloom filters, so blocks without matching logs are never loaded.
+    # The range halves whenever the node refuses a query as too large and grows by a quarter
+    # after each successful one, so it settles just under the node's result cap.
+    def __init__(self, web3: Web3, address: str, topics: list, initial_range=INITIAL_RANGE, max_range=MAX_RANGE):
+        self.web3 = web3
+        self.address = address
+        self.topics = topics
+        self.range = initial_range
+        self.max_range = max_range
+
+    def ranges(self, first_block: int, last_block: int):
+        # Yields (start, end, logs) for consecutive ranges covering first_block..last_block
+        start = first_block
+        while start <= last_block:
+            end = min(start + self.range - 1, last_block)
+            try:
+                logs = self.web3.eth.get_logs({
+                    'address': self.address,
+                    'topics': self.topics,
+                    'fromBlock': start,
+                    'toBlock': end,
+                })
+            except Exception as e:
+                if not is_range_error(e) or self.range <= MIN_RANGE:
+                    raise
+                self.range = max(self.range // 2, MIN_RANGE)
+                logger.warning(f"eth_getLogs over blocks {start} to {end} refused ({e}), retrying with {self.range} blocks")
+                continue
+
+            yield start, end, logs
+            start = end + 1
+            self.range = min(self.range + max(self.range // 4, 1), self.max_range)
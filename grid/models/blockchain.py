@@ -1,60 +1,349 @@
+import os
+import glob
 import json
+import time
+import hashlib
 import logging
+import threading
+from functools import lru_cache
+from contextlib import ExitStack
+from collections import defaultdict, deque
 from web3 import Web3, Account
 from web3.contract.contract import Contract
 from web3.middleware import geth_poa_middleware
-from web3.exceptions import InvalidAddress, ContractLogicError
+from web3.exceptions import InvalidAddress, ContractLogicError, TimeExhausted
+from eth_utils import function_abi_to_4byte_selector, is_checksum_address
+from eth_utils.abi import collapse_if_tuple
+from .nonce_manager import NonceManager, is_nonce_error
+from .metrics import metrics
+from .signer import TransactionSigner
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_IN_FLIGHT = 16
+GAS_PRICE_TTL = 15
+
+# Cached gas limits are the node's estimate raised by this factor
+GAS_MARGIN = 1.25
+
+# Resolved from this file, so scripts work from any working directory
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'blockchain', 'artifacts', 'contracts')
+ABI_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.abi_cache')
+
+CONTRACTS = {
+    'ENERGY_TOKEN': ('0xc5a5C42992dECbae36851359345FE25997F5C42d', 'EnergyToken'),
+    'CONSUMER': ('0x67d269191c92Caf3cD7723F116c85e6E9bf55933', 'Consumer'),
+    'PRODUCER': ('0xE6E340D132b5f46d1e472DebcD681B2aBc16e57E', 'Producer'),
+    'SUBSTATION': ('0xc3e53F4d16Ae77Db1c982e75a937B9f60FE63690', 'Substation'),
+    'TRANSMISSION_LINE': ('0x84eA74d481Ee0A5332c457a4d796187F6Ba67fEB', 'TransmissionLine'),
+}
+
+def load_abi(contract_name):
+    # A Hardhat artifact carries bytecode and link references next to the ABI. The ABI alone
+    # is cached under the artifact's hash, so it is only parsed out again after a recompile.
+    with open(os.path.join(ARTIFACTS_DIR, f"{contract_name}.sol", f"{contract_name}.json"), 'rb') as file:
+        artifact = file.read()
+    cache_path = os.path.join(ABI_CACHE_DIR, f"{contract_name}-{hashlib.sha256(artifact).hexdigest()[:16]}.json")
+    try:
+        with open(cache_path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        pass
+
+    abi = json.loads(artifact)['abi']
+    os.makedirs(ABI_CACHE_DIR, exist_ok=True)
+    for stale_path in glob.glob(os.path.join(ABI_CACHE_DIR, f"{contract_name}-*.json")):
+        os.remove(stale_path)
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(abi, file, separators=(',', ':'))
+    os.replace(temporary_path, cache_path)
+    return abi
+
+class CallTemplate:
+    # Selector and argument types of one contract function, parsed from the ABI once. Calls
+    # taking only static arguments are encoded by splicing 32-byte words after the selector.
+    def __init__(self, contract: Contract, fn_abi: dict, codec):
+        self.to = contract.address
+        self.selector = function_abi_to_4byte_selector(fn_abi)
+        self.types = [collapse_if_tuple(arg) for arg in fn_abi.get('inputs', [])]
+        self.static = all(arg_type in _WORD_ENCODERS for arg_type in self.types)
+        self.codec = codec
+
+    def encode(self, args) -> str:
+        if self.static:
+            data = self.selector + b''.join(_WORD_ENCODERS[arg_type](arg) for arg_type, arg in zip(self.types, args))
+        else:
+            data = self.selector + self.codec.encode(self.types, args)
+        return '0x' + data.hex()
+
+@lru_cache(maxsize=4096)
+def _encode_address(address):
+    # Checked like web3 checks contract call arguments, participants' addresses repeat every step
+    if isinstance(address, bytes) and len(address) == 20:
+        return address.rjust(32, b'\0')
+    if not is_checksum_address(address):
+        raise InvalidAddress(f"Expected a checksummed 20-byte address, got {address!r}")
+    return bytes.fromhex(address[2:]).rjust(32, b'\0')
+
+def _gas_key(template, args):
+    return (template.to, template.selector.hex(), max((len(arg) for arg in args if isinstance(arg, list)), default=0))
+
+_WORD_ENCODERS = {
+    'address': _encode_address,
+    'uint256': lambda value: value.to_bytes(32, 'big'),
+    'bool': lambda value: int(value).to_bytes(32, 'big'),
+}
+
 class BlockchainManager:
-    def __init__(self, provider_url='http://127.0.0.1:8545'):
+    def __init__(self, provider_url='http://127.0.0.1:8545', pipelined=False, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
         self.web3 = self._create_web3(provider_url)
-        self.contracts = {}
-        self._load_contracts()
+        self._contracts = None
+        self._contracts_lock = threading.Lock()
+        # When pipelined, submit_transaction returns as soon as the node accepts the
+        # transaction and receipts are gathered later by collect_receipts.
+        self.pipelined = pipelined
+        self.max_in_flight = max_in_flight
+        self._in_flight = defaultdict(deque)
+        # Window slots taken by transactions being signed and sent, not yet in _in_flight
+        self._reserved = defaultdict(int)
+        self._in_flight_lock = threading.Lock()
+        self._capacity_released = threading.Condition(self._in_flight_lock)
+        self._receipts = []
+        self.nonce_manager = NonceManager(self.web3)
+        # In-process by default, main.py may swap in a pooled signer
+        self.signer = TransactionSigner(workers=0)
+        # Receipts are polled per transaction unless main.py sets a ReceiptTracker
+        self.receipt_tracker = None
+        # Tracker futures of the transactions sent, waited on instead of tracking them again
+        self._receipt_futures = {}
+        self._chain_id = None
+        self._gas_price = None
+        self._gas_price_fetched_at = 0
+        self._function_labels = None
+        # (to, selector), transaction and private key of every transaction awaiting its receipt,
+        # kept to resend a transaction that ran out of gas
+        self._pending_calls = {}
+        self._templates = {}
+        # Gas limit per (to, selector, batch length)
+        self._gas_limits = {}
+        # Called with (tx_hash, resent_hash) when a transaction that ran out of gas is sent again
+        self.resend_listener = None
 
     def _create_web3(self, provider_url):
         web3 = Web3(Web3.HTTPProvider(provider_url))
         web3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        web3.middleware_onion.inject(metrics.rpc_middleware, name='metrics', layer=0)
         return web3
 
-    def _load_contracts(self):
-        contract_info = {
-            'ENERGY_TOKEN': ('0xc5a5C42992dECbae36851359345FE25997F5C42d', "../blockchain/artifacts/contracts/EnergyToken.sol/EnergyToken.json"),
-            'CONSUMER': ('0x67d269191c92Caf3cD7723F116c85e6E9bf55933', "../blockchain/artifacts/contracts/Consumer.sol/Consumer.json"),
-            'PRODUCER': ('0xE6E340D132b5f46d1e472DebcD681B2aBc16e57E', "../blockchain/artifacts/contracts/Producer.sol/Producer.json"),
-            'SUBSTATION': ('0xc3e53F4d16Ae77Db1c982e75a937B9f60FE63690', "../blockchain/artifacts/contracts/Substation.sol/Substation.json"),
-            'TRANSMISSION_LINE': ('0x84eA74d481Ee0A5332c457a4d796187F6Ba67fEB', "../blockchain/artifacts/contracts/TransmissionLine.sol/TransmissionLine.json"),
-        }
-
-        for name, (address, abi_path) in contract_info.items():
-            self.contracts[name] = self._get_contract(address, abi_path)
-
-    def _get_contract(self, address, abi_path) -> Contract:
-        with open(abi_path, 'r') as file:
-            contract_json = json.load(file)
-        abi = contract_json['abi']
-        return self.web3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+    @property
+    def contracts(self) -> dict[str, Contract]:
+        # Loaded on first use, so starting the manager reads no artifacts
+        if self._contracts is None:
+            with self._contracts_lock:
+                if self._contracts is None:
+                    self._contracts = {
+                        name: self.web3.eth.contract(address=Web3.to_checksum_address(address), abi=load_abi(contract_name))
+                        for name, (address, contract_name) in CONTRACTS.items()
+                    }
+        return self._contracts
 
     def get_account(self, private_key) -> Account:
         return self.web3.eth.account.from_key(private_key)
 
+    @property
+    def chain_id(self):
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
+
+    @property
+    def gas_price(self):
+        now = time.monotonic()
+        if self._gas_price is None or now - self._gas_price_fetched_at >= GAS_PRICE_TTL:
+            self._gas_price = self.web3.eth.gas_price
+            self._gas_price_fetched_at = now
+        return self._gas_price
+
     def get_transaction_params(self, address):
+        # The nonce is assigned by the nonce manager when the transaction is signed
         return {
             'from': address,
-            'nonce': self.web3.eth.get_transaction_count(address),
-            'gasPrice': self.web3.eth.gas_price,
-            'chainId': self.web3.eth.chain_id,
+            'gasPrice': self.gas_price,
+            'chainId': self.chain_id,
+        }
+
+    def _template(self, contract_name, function_name) -> CallTemplate:
+        template = self._templates.get((contract_name, function_name))
+        if template is None:
+            contract = self.contracts[contract_name]
+            fn_abi = next(fn_abi for fn_abi in contract.abi if fn_abi.get('type') == 'function' and fn_abi['name'] == function_name)
+            template = self._templates[(contract_name, function_name)] = CallTemplate(contract, fn_abi, self.web3.codec)
+        return template
+
+    def build_call(self, contract_name, function_name, args, sender) -> dict:
+        # Stands in for contract.functions.X(*args).build_transaction(): the calldata comes from
+        # the function's template and the gas limit from the cache, estimated once per function
+        # and batch length. A revert drops the cached limits of the function, see _wait_for_receipt.
+        template = self._template(contract_name, function_name)
+        transaction = {
+            **self.get_transaction_params(sender),
+            'to': template.to,
+            'value': 0,
+            'data': template.encode(args),
         }
+        key = _gas_key(template, args)
+        gas = self._gas_limits.get(key)
+        if gas is None:
+            gas = self._gas_limits[key] = int(self.web3.eth.estimate_gas(transaction) * GAS_MARGIN)
+            logger.debug("Gas limit of %s.%s with %d entries set to %d", contract_name, function_name, key[2], gas)
+        transaction['gas'] = gas
+        return transaction
+
+    def has_gas_limit(self, contract_name, function_name, args) -> bool:
+        # Whether build_call has a cached limit for the call, or would estimate it against the current state
+        return _gas_key(self._template(contract_name, function_name), args) in self._gas_limits
+
+    def _function_label(self, call):
+        # CONTRACT.function of a (to, selector) call, for the per-function gas metrics
+        if self._function_labels is None:
+            self._function_labels = {
+                (contract.address, function_abi_to_4byte_selector(fn_abi).hex()): f"{name}.{fn_abi['name']}"
+                for name, contract in self.contracts.items()
+                for fn_abi in contract.abi if fn_abi.get('type') == 'function'
+            }
+        return self._function_labels.get(call, 'unknown')
+
+    def _track(self, tx_hash, transaction, raw_transaction, private_key):
+        data = transaction.get('data') or '0x'
+        self._pending_calls[tx_hash] = ((transaction.get('to'), data[2:10]), transaction, private_key)
+        if self.receipt_tracker:
+            self._receipt_futures[tx_hash] = self.receipt_tracker.track(tx_hash, raw_transaction)
+
+    def _sign_and_send(self, transaction, private_key):
+        try:
+            return self._send_with_nonce(transaction, private_key)
+        except ValueError as e:
+            if not is_nonce_error(e):
+                raise
+            logger.warning(f"Nonce out of sync for {transaction['from']}, retrying: {e}")
+            return self._send_with_nonce(transaction, private_key)
+
+    def _send_with_nonce(self, transaction, private_key):
+        with self.nonce_manager.reserve(transaction['from']) as nonce:
+            with metrics.time('sign_seconds'):
+                raw_transaction = self.signer.sign({**transaction, 'nonce': nonce}, private_key)
+            with metrics.time('send_seconds'):
+                tx_hash = self._send_raw_transaction(raw_transaction)
+        self._track(tx_hash, transaction, raw_transaction, private_key)
+        return tx_hash
+
+    def _send_raw_transaction(self, raw_transaction):
+        # "already known" is the node holding this very signed transaction, e.g. from a request
+        # that reached it before failing: it was accepted, under its own nonce and hash
+        try:
+            return self.web3.eth.send_raw_transaction(raw_transaction)
+        except ValueError as e:
+            if 'already known' not in str(e).lower():
+                raise
+            return Web3.keccak(raw_transaction)
+
+    def _sign_and_send_many(self, transactions, sent: list):
+        # Appends the hash of every transaction to `sent` as the node accepts it, so a caller
+        # still holds the ones that went out when a later send fails
+        try:
+            self._send_many_with_nonces(transactions, sent)
+        except ValueError as e:
+            if not is_nonce_error(e):
+                raise
+            logger.warning(f"Nonces out of sync after {len(sent)} of {len(transactions)} transactions, retrying the rest: {e}")
+            self._send_many_with_nonces(transactions[len(sent):], sent)
+        return sent
+
+    def _send_many_with_nonces(self, transactions, sent):
+        # Reserves the nonces of every sender (in a fixed order, so concurrent batches cannot
+        # deadlock), signs the whole batch in one signer call and sends in submission order
+        counts = defaultdict(int)
+        for transaction, _ in transactions:
+            counts[transaction['from']] += 1
+
+        with ExitStack() as stack:
+            next_nonces = {sender: stack.enter_context(self.nonce_manager.reserve_many(sender, count)) for sender, count in sorted(counts.items())}
+            prepared = []
+            for transaction, private_key in transactions:
+                prepared.append(({**transaction, 'nonce': next_nonces[transaction['from']]}, private_key))
+                next_nonces[transaction['from']] += 1
+
+            with metrics.time('sign_batch_seconds'):
+                raw_transactions = self.signer.sign_many(prepared)
+            for (transaction, private_key), raw_transaction in zip(transactions, raw_transactions):
+                with metrics.time('send_seconds'):
+                    tx_hash = self._send_raw_transaction(raw_transaction)
+                self._track(tx_hash, transaction, raw_transaction, private_key)
+                sent.append(tx_hash)
+
+    def _wait_for_receipt(self, tx_hash, sender, resend=True):
+        try:
+            with metrics.time('receipt_wait_seconds'):
+                future = self._receipt_futures.pop(tx_hash, None)
+                if future:
+                    receipt = future.result()
+                elif self.receipt_tracker:
+                    receipt = self.receipt_tracker.wait(tx_hash)
+                else:
+                    receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash)
+        except TimeExhausted:
+            # A dropped transaction leaves a gap in the local nonce sequence
+            self._pending_calls.pop(tx_hash, None)
+            self.nonce_manager.resync(sender)
+            raise
+
+        call, transaction, private_key = self._pending_calls.pop(tx_hash, (None, None, None))
+        if receipt['status'] == 0 and call:
+            # Reverted or out of gas, the function's next call is estimated again
+            for key in list(self._gas_limits):
+                if key[:2] == call:
+                    self._gas_limits.pop(key, None)
+        if metrics.enabled:
+            function = self._function_label(call)
+            metrics.observe('gas_used', receipt['gasUsed'], function=function)
+            metrics.inc('transactions_total', function=function, status=receipt['status'])
+
+        if receipt['status'] == 0 and resend and transaction and receipt['gasUsed'] >= transaction['gas']:
+            # A cached limit fell short, e.g. the call now writes storage slots that were set
+            # when it was estimated. Sent once more with a limit estimated for the current state.
+            try:
+                gas = int(self.web3.eth.estimate_gas({key: value for key, value in transaction.items() if key != 'gas'}) * GAS_MARGIN)
+                logger.warning(f"Transaction {tx_hash.hex()} ran out of gas at {transaction['gas']}, resending it with a limit of {gas}")
+                metrics.inc('out_of_gas_resends_total')
+                resent = self._sign_and_send({**transaction, 'gas': gas}, private_key)
+                if self.resend_listener:
+                    self.resend_listener(tx_hash, resent)
+            except Exception as e:
+                logger.error(f"Error resending transaction {tx_hash.hex()} after it ran out of gas: {e}")
+                return receipt
+            return self._wait_for_receipt(resent, sender, resend=False)
+        return receipt
+
+    def rebroadcast(self, tx_hash, raw_transaction):
+        # Resubmit hook of the ReceiptTracker: sends the same signed transaction again, for a
+        # node that dropped it from its pool. Its nonce and hash stay the same.
+        if raw_transaction is None:
+            return None
+        try:
+            self._send_raw_transaction(raw_transaction)
+        except ValueError as e:
+            logger.warning(f"Could not resubmit transaction {tx_hash.hex()}: {e}")
+            return None
+        logger.warning(f"Transaction {tx_hash.hex()} was not mined in time and has been resubmitted")
+        return tx_hash
 
     def send_transaction(self, transaction, private_key):
         try:
-            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key)
-            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            tx_receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash)
-            logger.info(f"Transaction sent successfully. Hash: {tx_receipt['transactionHash'].hex()}")
+            tx_hash = self._sign_and_send(transaction, private_key)
+            tx_receipt = self._wait_for_receipt(tx_hash, transaction['from'])
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Transaction sent successfully. Hash: %s", tx_receipt['transactionHash'].hex())
             return tx_receipt
         except InvalidAddress as e:
             logger.error(f"Invalid address in transaction: {e}")
@@ -66,8 +355,125 @@ class BlockchainManager:
             logger.error(f"Error sending transaction: {e}")
             raise
 
-# Global instance of BlockchainManager
-blockchain_manager = BlockchainManager()
+    def submit_transaction(self, transaction, private_key):
+        if not self.pipelined:
+            return self.send_transaction(transaction, private_key)['transactionHash']
+
+        sender = transaction['from']
+        self._wait_for_capacity(sender, 1)
+
+        tx_hash = None
+        try:
+            tx_hash = self._sign_and_send(transaction, private_key)
+        except InvalidAddress as e:
+            logger.error(f"Invalid address in transaction: {e}")
+            raise
+        except ContractLogicError as e:
+            logger.error(f"Contract logic error: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error submitting transaction: {e}")
+            raise
+        finally:
+            self._release_capacity({sender: 1}, [(sender, tx_hash)] if tx_hash else [])
+        return tx_hash
+
+    def submit_transactions(self, transactions: list[tuple[dict, str]], sent: list | None = None):
+        # Batch form of submit_transaction for (transaction, private_key) pairs, signed together.
+        # The hashes go to `sent` as the node accepts them, a caller passing it still sees the
+        # ones sent before a failure.
+        tx_hashes = [] if sent is None else sent
+        if not transactions:
+            return tx_hashes
+
+        counts = defaultdict(int)
+        if self.pipelined:
+            for transaction, _ in transactions:
+                counts[transaction['from']] += 1
+            # In a fixed order, like the nonces: a batch holds the slots it reserved while it waits
+            # for the next sender's, concurrent batches reserving in other orders could deadlock
+            for sender, count in sorted(counts.items()):
+                self._wait_for_capacity(sender, count)
+
+        try:
+            self._sign_and_send_many(transactions, tx_hashes)
+        except InvalidAddress as e:
+            logger.error(f"Invalid address in transaction: {e}")
+            raise
+        except ContractLogicError as e:
+            logger.error(f"Contract logic error: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error submitting transactions: {e}")
+            raise
+        finally:
+            # Transactions sent before a failure are still waited for by collect_receipts
+            if self.pipelined:
+                self._release_capacity(counts, [(transaction['from'], tx_hash) for tx_hash, (transaction, _) in zip(tx_hashes, transactions)])
+
+        if not self.pipelined:
+            for tx_hash, (transaction, _) in zip(tx_hashes, transactions):
+                self._wait_for_receipt(tx_hash, transaction['from'])
+        return tx_hashes
+
+    def _wait_for_capacity(self, sender, count):
+        # Waits on the oldest receipts until `count` more transactions fit in the window, and
+        # reserves their slots under the same lock, until _release_capacity
+        limit = max(self.max_in_flight - count, 0)
+        while True:
+            # Several threads may submit for the same account, only the bookkeeping is locked
+            with self._in_flight_lock:
+                in_flight = self._in_flight[sender]
+                if len(in_flight) + self._reserved[sender] <= limit:
+                    self._reserved[sender] += count
+                    return
+                if not in_flight:
+                    # The window is held by other threads' sends, wait for them to land in it
+                    self._capacity_released.wait()
+                    continue
+                oldest = in_flight.popleft()
+            self._receipts.append(self._wait_for_receipt(oldest, sender))
+
+    def _release_capacity(self, counts, sent):
+        # Swaps the reserved slots for the (sender, tx_hash) pairs actually sent
+        with self._in_flight_lock:
+            for sender, tx_hash in sent:
+                self._in_flight[sender].append(tx_hash)
+            for sender, count in counts.items():
+                self._reserved[sender] -= count
+            self._capacity_released.notify_all()
+
+    def collect_receipts(self):
+        receipts, self._receipts = self._receipts, []
+        for sender, in_flight in self._in_flight.items():
+            while in_flight:
+                receipts.append(self._wait_for_receipt(in_flight.popleft(), sender))
+
+        failed = [receipt['transactionHash'].hex() for receipt in receipts if receipt['status'] == 0]
+        if failed:
+            logger.error(f"{len(failed)} pipelined transactions reverted: {', '.join(failed)}")
+            raise Exception(f"Pipelined transactions reverted: {', '.join(failed)}")
+
+        logger.debug("Collected %d transaction receipts", len(receipts))
+        return receipts
+
+_blockchain_manager = None
+_blockchain_manager_lock = threading.Lock()
+
+def get_blockchain_manager() -> BlockchainManager:
+    # The shared manager, created on first use
+    global _blockchain_manager
+    if _blockchain_manager is None:
+        with _blockchain_manager_lock:
+            if _blockchain_manager is None:
+                _blockchain_manager = BlockchainManager()
+    return _blockchain_manager
+
+def __getattr__(name):
+    # `from models.blockchain import blockchain_manager` keeps working, creating the manager then
+    if name == 'blockchain_manager':
+        return get_blockchain_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Constants
 AUTHORIZER_ADDRESS = "0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266"
@@ -0,0 +1,308 @@
+import os
+import json
+import random
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from .ledger import get_ledger, set_ledger
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Concurrent balance reads while reconciling with the ledger
+READ_WORKERS = 16
+
+class CheckpointError(Exception):
+    pass
+
+class JournaledLedger:
+    # Wraps the ledger of a checkpointed run. Every settlement write is appended to the step
+    # journal with the token balance changes it makes, and the expected balances are kept up
+    # to date. Writes that already landed before a restart are answered from the journal
+    # instead of being sent again. Everything else goes straight to the wrapped ledger.
+    def __init__(self, ledger, journal_path: str):
+        self.ledger = ledger
+        self.journal_path = journal_path
+        self.balances = defaultdict(int)
+        # Step being settled, set by the Checkpoint
+        self.step = 0
+        # (step, key) of landed writes not yet replayed, with their transaction hashes
+        self._landed = defaultdict(list)
+        self._lock = threading.Lock()
+        self._file = open(journal_path, 'a')
+        # A write landed through the resent transaction when the journaled one ran out of gas
+        ledger.follow_resends(self._resent)
+
+    def __getattr__(self, name):
+        return getattr(self.ledger, name)
+
+    def produce_energy(self, producer, line, amount: int):
+        return self._write('produce_energy', (producer.account.address, line.account.address, amount),
+                           [(line.account.address, amount)],
+                           lambda: self.ledger.produce_energy(producer, line, amount))
+
+    def transmit_energy(self, line, to: str, amount: int):
+        return self._write('transmit_energy', (line.account.address, to, amount),
+                           [(line.account.address, -amount), (to, amount)],
+                           lambda: self.ledger.transmit_energy(line, to, amount))
+
+    def distribute_energy(self, substation, consumer, amount: int):
+        return self._write('distribute_energy', (substation.account.address, consumer.account.address, amount),
+                           [(substation.account.address, -amount), (consumer.account.address, amount)],
+                           lambda: self.ledger.distribute_energy(substation, consumer, amount))
+
+    def consume_energy(self, consumer, amount: int):
+        return self._write('consume_energy', (consumer.account.address, amount),
+                           [(consumer.account.address, -amount)],
+                           lambda: self.ledger.consume_energy(consumer, amount))
+
+    def produce_energy_batch(self, lines: list[str], amounts: list[int]):
+        return self._write('produce_energy_batch', (lines, amounts), _batch_deltas('produce_energy_batch', (lines, amounts)),
+                           lambda: self.ledger.produce_energy_batch(lines, amounts))
+
+    def transmit_energy_batch(self, lines: list[str], to: str, amounts: list[int]):
+        return self._write('transmit_energy_batch', (lines, to, amounts), _batch_deltas('transmit_energy_batch', (lines, to, amounts)),
+                           lambda: self.ledger.transmit_energy_batch(lines, to, amounts))
+
+    def distribute_energy_batch(self, substation, consumers: list[str], amounts: list[int]):
+        return self._write('distribute_energy_batch', (substation.account.address, consumers, amounts),
+                           _batch_deltas('distribute_energy_batch', (substation, consumers, amounts)),
+                           lambda: self.ledger.distribute_energy_batch(substation, consumers, amounts))
+
+    def consume_energy_batch(self, consumers: list[str], amounts: list[int]):
+        return self._write('consume_energy_batch', (consumers, amounts), _batch_deltas('consume_energy_batch', (consumers, amounts)),
+                           lambda: self.ledger.consume_energy_batch(consumers, amounts))
+
+    def settle_batch(self, writes: list[tuple]):
+        # Writes that landed before a restart are answered from the journal, the rest are sent
+        # in one submission and journaled one by one, also those sent before a failure
+        results = [None] * len(writes)
+        unsent = []
+        for i, (name, args) in enumerate(writes):
+            results[i] = self._landed_write(name, _journal_key(name, args))
+            if results[i] is None:
+                unsent.append(i)
+        if unsent:
+            sent = []
+            try:
+                self.ledger.settle_batch([writes[i] for i in unsent], sent)
+            finally:
+                for i, tx_hashes in zip(unsent, sent):
+                    name, args = writes[i]
+                    self._journal(_journal_key(name, args), _batch_deltas(name, args), tx_hashes)
+                    results[i] = tx_hashes
+        return results
+
+    def _write(self, name, args, deltas, send):
+        # A step replays the same writes, so name and arguments identify the ones already landed
+        key = f"{name}{args!r}"
+        tx_hashes = self._landed_write(name, key)
+        if tx_hashes is not None:
+            return tx_hashes if name.endswith('_batch') else tx_hashes[0]
+
+        result = send()
+        self._journal(key, deltas, result if name.endswith('_batch') else [result])
+        return result
+
+    def _landed_write(self, name, key):
+        with self._lock:
+            landed = self._landed.get((self.step, key))
+            if not landed:
+                return None
+            logger.debug("Skipped %s of step %d, landed before the restart", name, self.step + 1)
+            return [bytes.fromhex(tx_hash) for tx_hash in landed.pop()]
+
+    def _journal(self, key, deltas, tx_hashes):
+        entry = {'step': self.step, 'key': key, 'tx': [bytes(tx_hash).hex() for tx_hash in tx_hashes], 'deltas': deltas}
+        with self._lock:
+            for address, amount in deltas:
+                self.balances[address] += amount
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def _resent(self, tx_hash, resent_hash):
+        with self._lock:
+            self._file.write(json.dumps({'step': self.step, 'resent': bytes(tx_hash).hex(), 'tx': bytes(resent_hash).hex()}) + '\n')
+            self._file.flush()
+
+    def truncate(self):
+        with self._lock:
+            self._file.close()
+            self._file = open(self.journal_path, 'w')
+            self._landed.clear()
+
+    def close(self):
+        self.ledger.follow_resends(None)
+        self._file.close()
+
+class Checkpoint:
+    # Saves a finished step to `path`: the step count, the random generator states and the
+    # token balance every participant should hold, as compact JSON with zero balances left
+    # out. The writes of the steps since then are in the journal next to it. restore() checks
+    # which journaled transactions landed, compares the expected balances with the ledger and
+    # has the simulator continue after the last saved step, skipping the writes that landed.
+    def __init__(self, path: str, every: int = 1, max_workers: int = READ_WORKERS):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.every = every
+        self.max_workers = max_workers
+        self.ledger = None
+
+    def restore(self, simulator):
+        ledger = get_ledger()
+        if isinstance(ledger, JournaledLedger):
+            # Restoring again in the same process, e.g. after a failed step
+            ledger.close()
+            ledger = ledger.ledger
+        self.ledger = JournaledLedger(ledger, self.journal_path)
+        set_ledger(self.ledger)
+        addresses = _addresses(simulator.substations)
+
+        try:
+            if not os.path.exists(self.path):
+                balances = self._read_balances(addresses)
+                self.ledger.balances.update((address, balance) for address, balance in balances.items() if balance)
+                self.save(simulator)
+                logger.info(f"Checkpointing to {self.path} every {self.every} steps")
+                return 0
+
+            with open(self.path) as file:
+                state = json.load(file)
+            landed = self._landed_writes(state['step'])
+            expected = defaultdict(int, state['balances'])
+            for entry in landed:
+                for address, amount in entry['deltas']:
+                    expected[address] += amount
+
+            balances = self._read_balances(addresses | expected.keys())
+            mismatched = [address for address, balance in balances.items() if balance != expected[address]]
+            if mismatched:
+                raise CheckpointError(f"Ledger balances of {len(mismatched)} accounts differ from the checkpoint, "
+                                      f"e.g. {mismatched[0]} holds {balances[mismatched[0]]} instead of {expected[mismatched[0]]}")
+
+            self.ledger.balances.update(expected)
+            for entry in landed:
+                self.ledger._landed[(entry['step'], entry['key'])].append(entry['tx'])
+            self._restore_random_state(simulator, state['random'])
+            # Drops whatever a failed step left allocated
+            if simulator.arrays:
+                simulator.arrays.reset()
+            for substation in simulator.substations:
+                substation.reset()
+            simulator.step = state['step']
+            logger.info(f"Resuming after step {state['step']} from {self.path}, {len(landed)} landed writes will not be sent again")
+            return state['step']
+        except Exception as e:
+            logger.error(f"Error restoring checkpoint {self.path}: {e}")
+            raise
+
+    def _landed_writes(self, step):
+        # Journaled writes of the unsaved steps whose transactions all made it on-chain. A write
+        # without a receipt is sent again, so none may still be waiting to be mined.
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        resent = {entry['resent']: entry['tx'] for entry in entries if 'resent' in entry}
+        entries = [_follow_resends(entry, resent) for entry in entries if 'key' in entry and entry['step'] >= step]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            statuses = list(executor.map(lambda entry: [self.ledger.transaction_status(bytes.fromhex(tx_hash)) for tx_hash in entry['tx']], entries))
+            unmined = [tx_hash for entry, status in zip(entries, statuses) for tx_hash, landed in zip(entry['tx'], status) if landed is None]
+            pending = [tx_hash for tx_hash, known in zip(unmined, executor.map(lambda tx_hash: self.ledger.transaction_pending(bytes.fromhex(tx_hash)), unmined)) if known]
+        if pending:
+            raise CheckpointError(f"{len(pending)} journaled transactions, e.g. 0x{pending[0]}, are still pending. "
+                                  f"Resume once they are mined or dropped, replaying them could apply them twice")
+
+        landed = []
+        for entry, status in zip(entries, statuses):
+            if all(status):
+                landed.append(entry)
+            elif any(status):
+                raise CheckpointError(f"Only part of {entry['key'][:80]} landed in step {entry['step'] + 1}, it cannot be replayed")
+        return landed
+
+    def _read_balances(self, addresses):
+        addresses = list(addresses)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(addresses, executor.map(self.ledger.balance_of, addresses)))
+
+    def begin_step(self, step):
+        self.ledger.step = step
+
+    def commit(self, simulator):
+        # Called once the step's writes are flushed
+        if simulator.step % self.every == 0:
+            with metrics.time('checkpoint_seconds'):
+                self.save(simulator)
+
+    def save(self, simulator):
+        state = {
+            'step': simulator.step,
+            'random': self._random_state(simulator),
+            'balances': {address: balance for address, balance in self.ledger.balances.items() if balance},
+        }
+        # Replaced in one rename, so a crash leaves either the old or the new checkpoint
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump(state, file, separators=(',', ':'))
+        os.replace(self.path + '.tmp', self.path)
+        self.ledger.truncate()
+        logger.debug("Checkpoint saved after step %d", simulator.step)
+
+    def _random_state(self, simulator):
+        version, internal_state, gauss_next = random.getstate()
+        return {
+            'python': [version, list(internal_state), gauss_next],
+            'numpy': simulator.arrays.rng.bit_generator.state if simulator.arrays else None,
+        }
+
+    def _restore_random_state(self, simulator, state):
+        version, internal_state, gauss_next = state['python']
+        random.setstate((version, tuple(internal_state), gauss_next))
+        if simulator.arrays and state['numpy']:
+            simulator.arrays.rng.bit_generator.state = state['numpy']
+
+    def close(self):
+        if self.ledger:
+            self.ledger.close()
+
+def _follow_resends(entry, resent):
+    # The entry with every transaction replaced by the last one it was resent as
+    tx_hashes = []
+    for tx_hash in entry['tx']:
+        while tx_hash in resent:
+            tx_hash = resent[tx_hash]
+        tx_hashes.append(tx_hash)
+    return {**entry, 'tx': tx_hashes}
+
+def _journal_key(name, args):
+    # As _write keys a batch write, with the sending substation by its address
+    if name == 'distribute_energy_batch':
+        substation, consumers, amounts = args
+        args = (substation.account.address, consumers, amounts)
+    return f"{name}{args!r}"
+
+def _batch_deltas(name, args):
+    # Token balance changes of a batch write
+    if name == 'produce_energy_batch':
+        lines, amounts = args
+        return list(zip(lines, amounts))
+    if name == 'transmit_energy_batch':
+        lines, to, amounts = args
+        return [*((line, -amount) for line, amount in zip(lines, amounts)), (to, sum(amounts))]
+    if name == 'distribute_energy_batch':
+        substation, consumers, amounts = args
+        return [(substation.account.address, -sum(amounts)), *zip(consumers, amounts)]
+    if name == 'consume_energy_batch':
+        consumers, amounts = args
+        return [(consumer, -amount) for consumer, amount in zip(consumers, amounts)]
+    raise ValueError(f"Unknown batch write {name}")
+
+def _addresses(substations):
+    addresses = set()
+    for substation in substations:
+        addresses.add(substation.account.address)
+        addresses.update(line.account.address for _, line in substation.connected_producers)
+        addresses.update(consumer.account.address for consumer in substation.connected_consumers)
+    return addresses
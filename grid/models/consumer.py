@@ -1,10 +1,14 @@
+import math
 import random
 import logging
-from .blockchain import blockchain_manager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from .ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
 class Consumer:
+    __slots__ = ('name', 'substations', 'min_demand', 'max_demand', 'time_period', 'private_key', '_arrays', '_index',
+                 '_current_demand', '_share', '_account')
+
     def __init__(self, name: str, min_demand: float, max_demand: float, account: str, time_period: int = 1):
         self.name = name
         self.substations = set()
@@ -12,19 +16,45 @@ class Consumer:
         self.max_demand = max_demand
         self.time_period = time_period
         self.private_key = account
+        self._arrays = None
+        self._index = None
+        # This step's demand split between the substations, cleared whenever the demand is set
+        self._share = None
         self.current_demand = None
-        self.account = blockchain_manager.get_account(account)
+        self._account = None
+
+    @property
+    def account(self):
+        if self._account is None:
+            self._account = get_ledger().get_account(self.private_key)
+        return self._account
+
+    def bind_arrays(self, arrays, index: int):
+        # Once bound, the demand is read from and written to the GridArrays state
+        self._arrays = arrays
+        self._index = index
+
+    @property
+    def current_demand(self):
+        if self._arrays is not None:
+            demand = self._arrays.demand[self._index]
+            return None if math.isnan(demand) else float(demand)
+        return self._current_demand
+
+    @current_demand.setter
+    def current_demand(self, value):
+        self._share = None
+        if self._arrays is not None:
+            self._arrays.demand[self._index] = math.nan if value is None else value
+        else:
+            self._current_demand = value
 
     def authorize(self):
         try:
-            consumer_contract = blockchain_manager.contracts['CONSUMER']
-            contract_function = consumer_contract.functions.addAuthorizedManager(self.account.address)
-            tx_params = blockchain_manager.get_transaction_params(AUTHORIZER_ADDRESS)
-            tx_params = contract_function.build_transaction(tx_params)
-            receipt = blockchain_manager.send_transaction(tx_params, AUTHORIZER_PRIVATE_KEY)
+            tx_hash = get_ledger().authorize('CONSUMER', self.account.address)
             
-            if receipt:
-                logger.info(f"{self.name} authorized as consumer. Transaction hash: {receipt['transactionHash'].hex()}")
+            if tx_hash:
+                logger.info(f"{self.name} authorized as consumer. Transaction hash: {tx_hash.hex()}")
                 self._approve_token_transfer()
             else:
                 raise Exception(f"Failed to authorize {self.name} as consumer")
@@ -34,14 +64,9 @@ class Consumer:
 
     def _approve_token_transfer(self):
         try:
-            energy_token_contract = blockchain_manager.contracts['ENERGY_TOKEN']
-            consumer_contract = blockchain_manager.contracts['CONSUMER']
-            tx = energy_token_contract.functions.approve(consumer_contract.address, 1_000_000_000_000_000).build_transaction(
-                blockchain_manager.get_transaction_params(self.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, self.private_key)
-            if receipt:
-                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().approve(self, 'CONSUMER')
+            if tx_hash:
+                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {tx_hash.hex()}")
             else:
                 raise Exception("Failed to approve token transfer")
         except Exception as e:
@@ -53,7 +78,8 @@ class Consumer:
 
     def connect_to_substation(self, substation):
         self.substations.add(substation)
-        logger.info(f"{self.name} connected to substation {substation.name}")
+        self._share = None
+        logger.debug("%s connected to substation %s", self.name, substation.name)
 
     @property
     def quantity_of_substations(self):
@@ -63,9 +89,15 @@ class Consumer:
         return round(random.uniform(self.min_demand, self.max_demand) * self.time_period)
 
     def get_demand(self) -> float:
-        if self.current_demand is None:
-            self.current_demand = self._get_new_demand()
-        return self.current_demand / len(self.substations) if self.substations else self.current_demand
+        # GridArrays may change a bound consumer's demand directly, so only unbound shares are kept
+        if self._share is not None and self._arrays is None:
+            return self._share
+        demand = self.current_demand
+        if demand is None:
+            demand = self.current_demand = self._get_new_demand()
+        self._share = demand / len(self.substations) if self.substations else demand
+        return self._share
 
     def consume_power(self, received: int):
-        logger.info(f"{self.name} received {received} of {self.get_demand()} Wh")
\ No newline at end of file
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s received %s of %s Wh", self.name, received, self.get_demand())
\ No newline at end of file
@@ -0,0 +1,143 @@
+import csv
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Steps of demand generated or read from disk at a time
+CHUNK_STEPS = 256
+
+# Relative residential load per hour of the day, averaging 1
+DAILY_CURVE = np.array([
+    0.55, 0.5, 0.48, 0.47, 0.5, 0.6, 0.85, 1.1, 1.1, 1.0, 0.95, 0.95,
+    1.0, 0.95, 0.9, 0.95, 1.1, 1.35, 1.6, 1.65, 1.5, 1.25, 0.95, 0.7,
+])
+DAILY_CURVE = DAILY_CURVE / DAILY_CURVE.mean()
+
+class FlatProfile:
+    def factors(self, start_step: int, count: int) -> np.ndarray:
+        return np.ones(count)
+
+class DailyProfile:
+    # Scales demand by a 24 hour load curve, linearly interpolated, each step lasting
+    # `step_hours` from `start_hour` on
+    def __init__(self, step_hours: float, curve=DAILY_CURVE, start_hour: float = 0):
+        self.step_hours = step_hours
+        self.curve = np.asarray(curve, dtype=float)
+        self.start_hour = start_hour
+
+    def factors(self, start_step: int, count: int) -> np.ndarray:
+        hours = (self.start_hour + (start_step + np.arange(count)) * self.step_hours) % 24
+        positions = hours * len(self.curve) / 24
+        return np.interp(positions, np.arange(len(self.curve) + 1), np.append(self.curve, self.curve[0]))
+
+class RandomDemand:
+    # Uniform demand between each consumer's min and max, times the profile. Every consumer
+    # draws from its own Philox stream keyed by the seed and its name, so its demand does not
+    # depend on the other consumers or their order. Philox is counter based: a window starting
+    # at step s jumps straight to the s-th draw, so the chunk size does not change the values.
+    def __init__(self, seed: int, profile=None):
+        self.seed = seed
+        self.profile = profile or FlatProfile()
+        self._bit_generator = np.random.Philox(0)
+        self._generator = np.random.Generator(self._bit_generator)
+
+    def window(self, consumers: list, start_step: int, count: int) -> np.ndarray:
+        # A Philox counter value yields four draws, one draw is used per step
+        skip = start_step % 4
+        state = self._bit_generator.state
+        state['state']['counter'] = np.array([start_step // 4, 0, 0, 0], dtype=np.uint64)
+        state['buffer_pos'] = 4
+        uniforms = np.empty((len(consumers), skip + count))
+        for i, consumer in enumerate(consumers):
+            state['state']['key'] = np.array([self.seed, zlib.crc32(consumer.name.encode())], dtype=np.uint64)
+            self._bit_generator.state = state
+            self._generator.random(out=uniforms[i])
+        uniforms = uniforms[:, skip:].T
+
+        min_demand = np.array([consumer.min_demand for consumer in consumers], dtype=float)
+        max_demand = np.array([consumer.max_demand for consumer in consumers], dtype=float)
+        time_period = np.array([consumer.time_period for consumer in consumers], dtype=float)
+        factors = self.profile.factors(start_step, count)[:, None]
+        return np.round((min_demand + uniforms * (max_demand - min_demand)) * factors * time_period)
+
+class CsvReplayDemand:
+    # Replays recorded smart-meter readings: one row per step, a first timestamp column and
+    # one column of Wh per consumer name. Rows are read a chunk at a time as the run advances.
+    def __init__(self, path: str, loop: bool = False):
+        self.path = path
+        self.loop = loop
+        self._file = None
+        self._reader = None
+        self._columns = None
+        self._next_step = 0
+
+    def _open(self, consumers):
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, newline='')
+        self._reader = csv.reader(self._file)
+        header = next(self._reader)
+        names = {name: column for column, name in enumerate(header)}
+        missing = [consumer.name for consumer in consumers if consumer.name not in names]
+        if missing:
+            raise ValueError(f"{self.path} has no readings for {len(missing)} consumers, e.g. {missing[0]}")
+        self._columns = [names[consumer.name] for consumer in consumers]
+        self._next_step = 0
+
+    def window(self, consumers: list, start_step: int, count: int) -> np.ndarray:
+        # Stops short at the end of the recording, unless looping
+        if self._reader is None or start_step < self._next_step:
+            self._open(consumers)
+        while self._next_step < start_step and self._read_row(consumers) is not None:
+            pass
+
+        rows = []
+        while len(rows) < count:
+            row = self._read_row(consumers)
+            if row is None:
+                break
+            rows.append(row)
+        if not rows:
+            raise ValueError(f"{self.path} has no readings for step {start_step}")
+        return np.array(rows, dtype=float)
+
+    def _read_row(self, consumers):
+        row = next(self._reader, None)
+        if row is None:
+            if not self.loop:
+                return None
+            step = self._next_step
+            self._open(consumers)
+            self._next_step = step
+            row = next(self._reader)
+        self._next_step += 1
+        return [float(row[column]) for column in self._columns]
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._reader = None
+
+class DemandModel:
+    # Serves each step's demand for a bound list of consumers from windows of `chunk_steps`
+    # steps generated or read ahead by the source
+    def __init__(self, source, chunk_steps: int = CHUNK_STEPS):
+        self.source = source
+        self.chunk_steps = chunk_steps
+        self.consumers = []
+        self._window = None
+        self._window_start = 0
+
+    def bind(self, consumers: list):
+        self.consumers = consumers
+        self._window = None
+
+    def demand(self, step: int) -> np.ndarray:
+        if self._window is None or not self._window_start <= step < self._window_start + len(self._window):
+            self._window_start = step
+            self._window = self.source.window(self.consumers, step, self.chunk_steps)
+            logger.debug("Demand for steps %d to %d loaded", step, step + self.chunk_steps - 1)
+        return self._window[step - self._window_start]
@@ -0,0 +1,141 @@
+import logging
+import numpy as np
+from .settlement import Settlement
+
+logger = logging.getLogger(__name__)
+
+class GridArrays:
+    # Array-backed copy of the grid. Supply (producer, line) and demand (consumer) connections
+    # are kept as edge lists grouped by substation, i.e. a sparse substation incidence matrix,
+    # so a whole step of proportional allocation is a handful of vectorized operations.
+    def __init__(self, substations: list, rng: np.random.Generator | None = None):
+        self.substations = substations
+        self.rng = rng or np.random.default_rng()
+
+        self.producers = _unique(producer for substation in substations for producer, _ in substation.connected_producers)
+        self.consumers = _unique(consumer for substation in substations for consumer in substation.connected_consumers)
+        producer_index = {id(producer): i for i, producer in enumerate(self.producers)}
+        consumer_index = {id(consumer): i for i, consumer in enumerate(self.consumers)}
+
+        self.supply_substation = np.array([s for s, substation in enumerate(substations) for _ in substation.connected_producers], dtype=np.intp)
+        self.supply_producer = np.array([producer_index[id(producer)] for substation in substations for producer, _ in substation.connected_producers], dtype=np.intp)
+        self.demand_substation = np.array([s for s, substation in enumerate(substations) for _ in substation.connected_consumers], dtype=np.intp)
+        self.demand_consumer = np.array([consumer_index[id(consumer)] for substation in substations for consumer in substation.connected_consumers], dtype=np.intp)
+        self._supply_offsets = _offsets(self.supply_substation, len(substations))
+        self._demand_offsets = _offsets(self.demand_substation, len(substations))
+
+        self.max_output_for_period = np.array([producer.max_output_for_period for producer in self.producers], dtype=float)
+        self.current_output = np.array([producer.current_output for producer in self.producers], dtype=float)
+        self.min_demand = np.array([consumer.min_demand for consumer in self.consumers], dtype=float)
+        self.max_demand = np.array([consumer.max_demand for consumer in self.consumers], dtype=float)
+        self.time_period = np.array([consumer.time_period for consumer in self.consumers], dtype=float)
+        self.demand = np.array([np.nan if consumer.current_demand is None else consumer.current_demand for consumer in self.consumers], dtype=float)
+        # Matches Consumer.get_demand, which splits a consumer's demand evenly between its substations
+        self.consumer_substations = np.array([max(len(consumer.substations), 1) for consumer in self.consumers], dtype=float)
+
+        self.waves = []
+        for wave in self._build_waves():
+            in_wave = np.zeros(len(substations), dtype=bool)
+            in_wave[wave] = True
+            self.waves.append((in_wave, np.flatnonzero(in_wave[self.supply_substation]), np.flatnonzero(in_wave[self.demand_substation])))
+
+        for i, producer in enumerate(self.producers):
+            producer.bind_arrays(self, i)
+        for i, consumer in enumerate(self.consumers):
+            consumer.bind_arrays(self, i)
+
+    def _build_waves(self):
+        # Substations sharing a producer must be allocated in list order, as in the object model.
+        # Each substation goes one wave after the last earlier substation it shares a producer with.
+        waves = []
+        last_wave = {}
+        for s, substation in enumerate(self.substations):
+            producers = [id(producer) for producer, _ in substation.connected_producers]
+            if len(set(producers)) != len(producers):
+                raise ValueError(f"Substation {substation.name} connects the same producer twice, which GridArrays does not support")
+            wave = max((last_wave[producer] + 1 for producer in producers if producer in last_wave), default=0)
+            for producer in producers:
+                last_wave[producer] = wave
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(s)
+        return waves
+
+    def draw_demand(self):
+        missing = np.isnan(self.demand)
+        if missing.any():
+            drawn = self.rng.uniform(self.min_demand[missing], self.max_demand[missing])
+            self.demand[missing] = np.round(drawn * self.time_period[missing])
+
+    def allocate_power(self) -> list[Settlement | None]:
+        self.draw_demand()
+        substation_count = len(self.substations)
+        total_power = np.zeros(substation_count)
+        total_demand = np.zeros(substation_count)
+        active = np.zeros(substation_count, dtype=bool)
+        supplied = np.zeros(len(self.supply_producer))
+
+        demand = self.demand[self.demand_consumer] / self.consumer_substations[self.demand_consumer]
+
+        for in_wave, supply_edges, demand_edges in self.waves:
+            producers = self.supply_producer[supply_edges]
+            substations = self.supply_substation[supply_edges]
+            available = np.maximum(self.max_output_for_period[producers] - self.current_output[producers], 0)
+
+            capacity = np.bincount(substations, weights=available, minlength=substation_count)
+            wave_demand = np.bincount(self.demand_substation[demand_edges], weights=demand[demand_edges], minlength=substation_count)
+            wave_active = in_wave & (capacity > 0) & (wave_demand > 0)
+
+            edge_active = wave_active[substations]
+            requested = np.divide(available, capacity[substations], out=np.zeros_like(available), where=edge_active) * wave_demand[substations]
+            provided = np.where(edge_active, np.minimum(requested, available), 0)
+
+            self.current_output[producers] += provided
+            supplied[supply_edges] = provided
+            # Whole Wh as settled, as in Substation._generate_and_transmit_power
+            total_power += np.bincount(substations, weights=np.round(provided), minlength=substation_count)
+            total_demand[wave_active] = wave_demand[wave_active]
+            active |= wave_active
+
+        for s in np.flatnonzero(~active):
+            logger.warning("Substation %s has no power capacity or demand available!", self.substations[s].name)
+
+        distributed = np.zeros(len(self.demand_consumer))
+        demand_active = active[self.demand_substation]
+        proportion = np.divide(demand, total_demand[self.demand_substation], out=np.zeros_like(demand), where=demand_active)
+        distributed[demand_active] = np.floor(total_power[self.demand_substation] * proportion)[demand_active]
+
+        return self._settlements(active, np.round(supplied).astype(np.int64), distributed.astype(np.int64), demand)
+
+    def _settlements(self, active, supplied, distributed, demand) -> list[Settlement | None]:
+        supplied = supplied.tolist()
+        distributed = distributed.tolist()
+        demand = demand.tolist()
+        settlements = []
+        for s, substation in enumerate(self.substations):
+            if not active[s]:
+                settlements.append(None)
+                continue
+            settlement = Settlement(substation)
+            start, end = self._supply_offsets[s], self._supply_offsets[s + 1]
+            for (producer, line), amount in zip(substation.connected_producers, supplied[start:end]):
+                settlement.add_generation(producer, line, amount)
+                settlement.add_transmission(line, amount)
+            start, end = self._demand_offsets[s], self._demand_offsets[s + 1]
+            for consumer, amount, consumer_demand in zip(substation.connected_consumers, distributed[start:end], demand[start:end]):
+                settlement.add_distribution(consumer, amount, consumer_demand)
+            settlements.append(settlement)
+        return settlements
+
+    def reset(self):
+        self.current_output[:] = 0
+        self.demand[:] = np.nan
+
+def _unique(items):
+    seen = {}
+    for item in items:
+        seen.setdefault(id(item), item)
+    return list(seen.values())
+
+def _offsets(edge_substation, substation_count):
+    return np.concatenate(([0], np.cumsum(np.bincount(edge_substation, minlength=substation_count)))).tolist()
@@ -1,18 +1,157 @@
-from time import sleep
-from .substation import Substation
+import math
+import logging
+from time import monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor
+from .substation import Substation, settle_batches
+from .grid_arrays import GridArrays
+from .ledger import get_ledger
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 class GridSimulator:
-    def __init__(self, substations:list[Substation]):
+    def __init__(self, substations:list[Substation], parallel: bool = False, max_workers: int | None = None, vectorized: bool = False,
+                 log_every: int = 1, demand=None, checkpoint=None, results=None):
         self.__substations:list[Substation] = substations
+        self.parallel = parallel
+        # One summary record every `log_every` steps replaces the per-flow log lines, 0 disables it
+        self.log_every = log_every
+        self.max_workers = max_workers or max(len(substations), 1)
+        # Vectorized runs allocate the whole grid at once with GridArrays instead of per object
+        self.arrays = GridArrays(substations) if vectorized else None
+        # A DemandModel sets every consumer's demand at the start of a step, otherwise each draws its own
+        self.demand = demand
+        if demand:
+            demand.bind(self.arrays.consumers if self.arrays else
+                        list({id(consumer): consumer for substation in substations for consumer in substation.connected_consumers}.values()))
+        # Steps run so far, across simulate calls
+        self.step = 0
+        self.last_settlements = []
+        # A Checkpoint saves finished steps and, if one was saved before, continues after it
+        self.checkpoint = checkpoint
+        if checkpoint:
+            checkpoint.restore(self)
+        # A ResultStore keeps every step's flows, from a previous run only the steps before the one resumed at
+        self.results = results
+        if results:
+            results.truncate(self.step)
+
+    @property
+    def substations(self) -> list[Substation]:
+        return self.__substations
 
     def simulate(self, steps=1, time=0):
-        for step in range(steps):
-            print(f'Simulated Step {step + 1}')
-            
-            for substation in self.__substations:
-                substation.distribute_power()
+        # `time` is the step period in seconds, each step starts `time` after the previous one
+        executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.parallel else None
+        next_step_at = monotonic()
+        try:
+            for step in range(steps):
+                started_at = monotonic()
+                with metrics.time('step_seconds'):
+                    if self.checkpoint:
+                        self.checkpoint.begin_step(self.step)
+                    if self.demand:
+                        self._set_demand(self.demand.demand(self.step))
+                    settlements = self._step(executor)
+                if self.results:
+                    with metrics.time('results_seconds'):
+                        self.results.append(self.step, settlements)
+                self.last_settlements = settlements
+                self.step += 1
+                metrics.inc('steps_total')
+                if self.checkpoint:
+                    if self.results and self.step % self.checkpoint.every == 0:
+                        # The rows of a saved step must be on disk, a resumed run only settles later steps
+                        self.results.flush()
+                    self.checkpoint.commit(self)
+
+                if self.log_every and self.step % self.log_every == 0 and logger.isEnabledFor(logging.INFO):
+                    self._log_step(self.step - 1, settlements, monotonic() - started_at)
+
+                if time and step + 1 < steps:
+                    next_step_at = wait_for_next_step(self.step - 1, next_step_at + time)
+        finally:
+            if executor:
+                executor.shutdown()
+            if self.results:
+                self.results.flush()
+
+    def _step(self, executor: ThreadPoolExecutor | None):
+        if self.arrays:
+            with metrics.time('allocate_seconds'):
+                settlements = self.arrays.allocate_power()
+            self._settle(settlements, executor)
+        elif executor or all(substation.batch_settlement for substation in self.__substations):
+            # Allocated up front, settlement writes then overlap or go to the ledger together
+            settlements = self._allocate_and_settle(executor)
+        else:
+            settlements = [substation.distribute_power() for substation in self.__substations]
+
+        with metrics.time('flush_seconds'):
+            get_ledger().flush()
 
-                sleep(time)
-            
+        if self.arrays:
+            self.arrays.reset()
+        else:
             for substation in self.__substations:
-                substation.reset()
\ No newline at end of file
+                substation.reset()
+        return settlements
+
+    def _set_demand(self, demand):
+        if self.arrays:
+            self.arrays.demand[:] = demand
+            return
+        # NaN leaves the consumer to draw its own demand, as in GridArrays
+        for consumer, value in zip(self.demand.consumers, demand.tolist()):
+            consumer.current_demand = None if math.isnan(value) else value
+
+    def summarize(self, step, settlements, duration) -> dict:
+        settled = [settlement for settlement in settlements if settlement]
+        return {
+            'step': step + 1,
+            'seconds': round(duration, 6),
+            'substations_settled': len(settled),
+            'generated_wh': sum(amount for settlement in settled for _, _, amount in settlement.generation),
+            'distributed_wh': sum(amount for settlement in settled for _, amount in settlement.distribution),
+        }
+
+    def _log_step(self, step, settlements, duration):
+        log_summary(self.summarize(step, settlements, duration))
+
+    def _allocate_and_settle(self, executor: ThreadPoolExecutor | None):
+        # Allocation runs in substation order so producers shared between substations are
+        # split the same way as in a sequential run; only the chain writes overlap.
+        with metrics.time('allocate_seconds'):
+            settlements = [substation.allocate_power() for substation in self.__substations]
+        self._settle(settlements, executor)
+        return settlements
+
+    def _settle(self, settlements, executor: ThreadPoolExecutor | None):
+        pending = [(substation, settlement) for substation, settlement in zip(self.__substations, settlements) if settlement]
+        if pending and all(substation.batch_settlement for substation, _ in pending):
+            # The whole step goes to the ledger at once, signed as one batch
+            settle_batches(pending)
+            return
+        if not executor:
+            for substation, settlement in pending:
+                substation.settle(settlement)
+            return
+        futures = [executor.submit(substation.settle, settlement) for substation, settlement in pending]
+        for future in futures:
+            future.result()
+
+def wait_for_next_step(step, next_step_at):
+    # Sleeps until `next_step_at` and returns it, or returns now when `step` (counted from 0)
+    # ran past it. Shared by GridSimulator and ShardedSimulator.
+    delay = next_step_at - monotonic()
+    if delay > 0:
+        sleep(delay)
+        return next_step_at
+    if delay < 0:
+        logger.warning(f"Step {step + 1} overran the step period by {-delay:.3f}s")
+    return monotonic()
+
+def log_summary(summary):
+    logger.info("Step %d: %d substations settled, %d Wh generated, %d Wh distributed in %.3fs",
+                summary['step'], summary['substations_settled'], summary['generated_wh'], summary['distributed_wh'], summary['seconds'],
+                extra={'summary': summary})
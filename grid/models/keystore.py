@@ -0,0 +1,46 @@
+import hmac
+import hashlib
+import threading
+
+# Mnemonic of the accounts the local hardhat node funds on start
+HARDHAT_MNEMONIC = 'test test test test test test test test test test test junk'
+ACCOUNT_PATH = "m/44'/60'/0'/0"
+
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+class Keystore:
+    # Deterministic private keys, key i being the BIP44 account m/44'/60'/0'/0/i of the
+    # mnemonic, so with the default mnemonic key i is hardhat's account #i. The parent
+    # node is derived once and each account is one HMAC away from it, derived on first use.
+    def __init__(self, mnemonic=HARDHAT_MNEMONIC, path=ACCOUNT_PATH):
+        self.mnemonic = mnemonic
+        self.path = path
+        self._parent = None
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _parent_node(self):
+        # eth_account and eth_keys take a while to import, and topologies with literal keys never get here
+        from eth_keys import keys
+        from eth_account.hdaccount import seed_from_mnemonic
+        from eth_account.hdaccount.deterministic import Node, derive_child_key
+        with self._lock:
+            if self._parent is None:
+                master = hmac.digest(b'Bitcoin seed', seed_from_mnemonic(self.mnemonic, ''), hashlib.sha512)
+                key, chain_code = master[:32], master[32:]
+                for node in self.path.split('/')[1:]:
+                    key, chain_code = derive_child_key(key, chain_code, Node.decode(node))
+                self._parent = (int.from_bytes(key, 'big'), chain_code, keys.PrivateKey(key).public_key.to_compressed_bytes())
+            return self._parent
+
+    def private_key(self, index: int) -> str:
+        key = self._keys.get(index)
+        if key is None:
+            parent_key, chain_code, parent_point = self._parent_node()
+            child = hmac.digest(chain_code, parent_point + index.to_bytes(4, 'big'), hashlib.sha512)
+            tweak = int.from_bytes(child[:32], 'big')
+            child_key = (tweak + parent_key) % SECP256K1_N
+            if tweak >= SECP256K1_N or child_key == 0:
+                raise ValueError(f"Account {index} of {self.path} is not a valid key")
+            key = self._keys[index] = '0x' + child_key.to_bytes(32, 'big').hex()
+        return key
@@ -0,0 +1,18 @@
+APPROVAL_AMOUNT = 1_000_000_000_000_000
+
+# Entries per batch transaction, keeps a settlement well under the block gas limit
+MAX_BATCH_SIZE = 200
+
+_ledger = None
+
+def get_ledger():
+    # The web3 backend is only imported (and connected) when no other ledger was chosen
+    global _ledger
+    if _ledger is None:
+        from .web3_ledger import Web3Ledger
+        _ledger = Web3Ledger()
+    return _ledger
+
+def set_ledger(ledger):
+    global _ledger
+    _ledger = ledger
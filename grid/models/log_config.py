@@ -0,0 +1,44 @@
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per record, with the fields of a record's `summary` extra merged in
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **getattr(record, 'summary', {}),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def configure_logging(level=logging.INFO, queued=True, structured=False, stream=None):
+    # Replaces the root handlers. When queued, records are only put on a queue by the
+    # logging thread and a QueueListener thread writes them, so slow output never blocks
+    # the simulation. Returns the listener, which is also stopped at exit.
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if structured else logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.setLevel(level)
+
+    if not queued:
+        root.addHandler(handler)
+        return None
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(QueueHandler(records))
+    return listener
@@ -0,0 +1,243 @@
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from .ledger import APPROVAL_AMOUNT
+
+# Stands in for the contract deployer, which every contract authorizes on construction
+AUTHORIZER = 'AUTHORIZER'
+
+CONTRACTS = ('PRODUCER', 'CONSUMER', 'SUBSTATION', 'TRANSMISSION_LINE')
+
+# Contracts whose batches move other participants' tokens, sent by settlement operators only
+SETTLEMENT_CONTRACTS = ('CONSUMER', 'TRANSMISSION_LINE')
+
+class LedgerError(Exception):
+    pass
+
+class InMemoryLedger:
+    # Applies the EnergyToken/Producer/TransmissionLine/Substation/Consumer contract rules
+    # to in-process state. Contract names stand in for the contract addresses.
+    def __init__(self):
+        self.balances = defaultdict(int)
+        self.allowances = defaultdict(int)
+        self.total_supply = 0
+        self.authorized = {contract: {AUTHORIZER} for contract in CONTRACTS}
+        self.settlement_operators = {contract: {AUTHORIZER} for contract in SETTLEMENT_CONTRACTS}
+        self.connected_lines = set()
+        self.registered_consumers = set()
+        self.transaction_count = 0
+        self._journal = None
+        self._lock = threading.RLock()
+
+    def get_account(self, private_key):
+        # Deferred, the import alone costs more than building a small grid
+        from eth_account import Account
+        return Account.from_key(private_key)
+
+    @contextmanager
+    def _transaction(self):
+        # A failed call reverts every balance and allowance change it made, like the EVM
+        with self._lock:
+            self._journal = []
+            try:
+                yield (self.transaction_count + 1).to_bytes(32, 'big')
+            except Exception:
+                for table, key, value in reversed(self._journal):
+                    table[key] = value
+                raise
+            finally:
+                self._journal = None
+            self.transaction_count += 1
+
+    def _set(self, table, key, value):
+        self._journal.append((table, key, table[key]))
+        table[key] = value
+
+    def _require(self, condition, message):
+        if not condition:
+            raise LedgerError(message)
+
+    def _require_authorized(self, contract_name, address):
+        self._require(address in self.authorized[contract_name], "Not authorized")
+
+    def _require_settlement_operator(self, contract_name, address):
+        self._require(address in self.settlement_operators[contract_name], "Not a settlement operator")
+
+    def _mint(self, to, amount):
+        self._set(self.balances, to, self.balances[to] + amount)
+        self._set(self.__dict__, 'total_supply', self.total_supply + amount)
+
+    def _burn(self, owner, amount):
+        self._require(self.balances[owner] >= amount, "ERC20InsufficientBalance")
+        self._set(self.balances, owner, self.balances[owner] - amount)
+        self._set(self.__dict__, 'total_supply', self.total_supply - amount)
+
+    def _transfer_from(self, spender, owner, to, amount):
+        allowance = self.allowances[(owner, spender)]
+        self._require(allowance >= amount, "ERC20InsufficientAllowance")
+        self._set(self.allowances, (owner, spender), allowance - amount)
+        self._require(self.balances[owner] >= amount, "ERC20InsufficientBalance")
+        self._set(self.balances, owner, self.balances[owner] - amount)
+        self._set(self.balances, to, self.balances[to] + amount)
+
+    def authorize(self, contract_name, address):
+        with self._transaction() as tx_hash:
+            self._require_authorized(contract_name, AUTHORIZER)
+            self.authorized[contract_name].add(address)
+            return tx_hash
+
+    def approve(self, participant, contract_name):
+        with self._transaction() as tx_hash:
+            self._set(self.allowances, (participant.account.address, contract_name), APPROVAL_AMOUNT)
+            return tx_hash
+
+    def connect_transmission_line(self, producer, line):
+        with self._transaction() as tx_hash:
+            self._require_authorized('PRODUCER', producer.account.address)
+            self.connected_lines.add(line.account.address)
+            return tx_hash
+
+    def register_consumer(self, consumer):
+        with self._transaction() as tx_hash:
+            self._require_authorized('SUBSTATION', AUTHORIZER)
+            self.registered_consumers.add(consumer.account.address)
+            return tx_hash
+
+    def authorize_batch(self, contract_name, addresses: list[str]):
+        with self._transaction() as tx_hash:
+            self._require_authorized(contract_name, AUTHORIZER)
+            self.authorized[contract_name].update(addresses)
+            return [tx_hash]
+
+    def add_settlement_operators(self, contract_name, addresses: list[str]):
+        # Owner only on chain, the deployer is the owner
+        with self._transaction() as tx_hash:
+            self.settlement_operators[contract_name].update(addresses)
+            return [tx_hash]
+
+    def approve_batch(self, participants: list, contract_name):
+        return [self.approve(participant, contract_name) for participant in participants]
+
+    def connect_transmission_line_batch(self, lines: list[str]):
+        with self._transaction() as tx_hash:
+            self._require_authorized('PRODUCER', AUTHORIZER)
+            self.connected_lines.update(lines)
+            return [tx_hash]
+
+    def register_consumer_batch(self, consumers: list[str]):
+        with self._transaction() as tx_hash:
+            self._require_authorized('SUBSTATION', AUTHORIZER)
+            self.registered_consumers.update(consumers)
+            return [tx_hash]
+
+    def _produce(self, line, amount):
+        self._require(line in self.connected_lines, "TransmissionLine not connected")
+        self._mint(line, amount)
+
+    def _distribute(self, substation, consumer, amount):
+        self._require(consumer in self.registered_consumers, "Consumer not registered")
+        self._transfer_from('SUBSTATION', substation, consumer, amount)
+
+    def _consume(self, consumer, amount):
+        self._require(self.balances[consumer] >= amount, "Insufficient energy tokens")
+        self._transfer_from('CONSUMER', consumer, 'CONSUMER', amount)
+
+    def produce_energy(self, producer, line, amount: int):
+        with self._transaction() as tx_hash:
+            self._require_authorized('PRODUCER', producer.account.address)
+            self._produce(line.account.address, amount)
+            return tx_hash
+
+    def transmit_energy(self, line, to: str, amount: int):
+        with self._transaction() as tx_hash:
+            self._require_authorized('TRANSMISSION_LINE', line.account.address)
+            self._transfer_from('TRANSMISSION_LINE', line.account.address, to, amount)
+            return tx_hash
+
+    def distribute_energy(self, substation, consumer, amount: int):
+        with self._transaction() as tx_hash:
+            self._require_authorized('SUBSTATION', substation.account.address)
+            self._distribute(substation.account.address, consumer.account.address, amount)
+            return tx_hash
+
+    def consume_energy(self, consumer, amount: int):
+        with self._transaction() as tx_hash:
+            self._require_authorized('CONSUMER', consumer.account.address)
+            self._consume(consumer.account.address, amount)
+            self._burn('CONSUMER', amount)
+            return tx_hash
+
+    def produce_energy_batch(self, lines: list[str], amounts: list[int]):
+        with self._transaction() as tx_hash:
+            self._require_authorized('PRODUCER', AUTHORIZER)
+            self._require(len(lines) == len(amounts), "Length mismatch")
+            for line, amount in zip(lines, amounts):
+                self._produce(line, amount)
+            return [tx_hash]
+
+    def transmit_energy_batch(self, lines: list[str], to: str, amounts: list[int]):
+        with self._transaction() as tx_hash:
+            self._require_settlement_operator('TRANSMISSION_LINE', AUTHORIZER)
+            self._require(len(lines) == len(amounts), "Length mismatch")
+            for line, amount in zip(lines, amounts):
+                self._require(line in self.authorized['TRANSMISSION_LINE'], "Line not authorized")
+                self._transfer_from('TRANSMISSION_LINE', line, to, amount)
+            return [tx_hash]
+
+    def distribute_energy_batch(self, substation, consumers: list[str], amounts: list[int]):
+        with self._transaction() as tx_hash:
+            self._require_authorized('SUBSTATION', substation.account.address)
+            self._require(len(consumers) == len(amounts), "Length mismatch")
+            for consumer, amount in zip(consumers, amounts):
+                self._distribute(substation.account.address, consumer, amount)
+            return [tx_hash]
+
+    def consume_energy_batch(self, consumers: list[str], amounts: list[int]):
+        with self._transaction() as tx_hash:
+            self._require_settlement_operator('CONSUMER', AUTHORIZER)
+            self._require(len(consumers) == len(amounts), "Length mismatch")
+            for consumer, amount in zip(consumers, amounts):
+                self._require(consumer in self.authorized['CONSUMER'], "Consumer not authorized")
+                self._consume(consumer, amount)
+            self._burn('CONSUMER', sum(amounts))
+            return [tx_hash]
+
+    def settle_batch(self, writes: list[tuple], sent: list | None = None):
+        # (batch method name, args) writes, applied in order as separate transactions, with the
+        # hashes of each appended to `sent` as it is applied
+        results = [] if sent is None else sent
+        for name, args in writes:
+            results.append(getattr(self, name)(*args))
+        return results
+
+    def is_authorized(self, contract_name, address: str) -> bool:
+        return address in self.authorized[contract_name]
+
+    def is_settlement_operator(self, contract_name, address: str) -> bool:
+        return address in self.settlement_operators[contract_name]
+
+    def allowance(self, address: str, contract_name) -> int:
+        return self.allowances[(address, contract_name)]
+
+    def is_line_connected(self, address: str) -> bool:
+        return address in self.connected_lines
+
+    def is_consumer_registered(self, address: str) -> bool:
+        return address in self.registered_consumers
+
+    def balance_of(self, address: str) -> int:
+        return self.balances[address]
+
+    def transaction_status(self, tx_hash) -> bool | None:
+        # Calls apply or revert before returning, so every hash handed out was applied
+        return True if 0 < int.from_bytes(tx_hash, 'big') <= self.transaction_count else None
+
+    def follow_resends(self, listener):
+        # Nothing is ever sent again
+        pass
+
+    def transaction_pending(self, tx_hash) -> bool:
+        return False
+
+    def flush(self):
+        return []
@@ -0,0 +1,160 @@
+import bisect
+import logging
+import threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+GAS_BUCKETS = (25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000, 30_000_000)
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, perf_counter() - self.started_at, **self.labels)
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class MetricsRegistry:
+    # Counters and histograms keyed by name and labels. Disabled, every call returns after
+    # one attribute check, so instrumented hot paths keep their speed.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def set_buckets(self, name, buckets):
+        self._buckets[name] = tuple(buckets)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self._buckets.get(name, SECONDS_BUCKETS))
+            histogram.observe(value)
+
+    def time(self, name, **labels):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            file.write(self.render())
+        logger.info(f"Metrics written to {path}")
+
+    def serve(self, port, host='127.0.0.1'):
+        # Serves render() on GET /metrics from a daemon thread, returns the server to shut down
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics served on http://{host}:{server.server_port}/metrics")
+        return server
+
+    def rpc_middleware(self, make_request, web3):
+        # web3 middleware counting and timing every JSON-RPC request by method
+        def record(method, params):
+            if not self.enabled:
+                return make_request(method, params)
+            started_at = perf_counter()
+            try:
+                return make_request(method, params)
+            finally:
+                self.inc('rpc_requests_total', method=method)
+                self.observe('rpc_request_seconds', perf_counter() - started_at, method=method)
+        return record
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+metrics = MetricsRegistry()
+metrics.set_buckets('gas_used', GAS_BUCKETS)
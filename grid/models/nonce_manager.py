@@ -0,0 +1,49 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+NONCE_ERRORS = ('nonce too low', 'nonce has already been used')
+
+def is_nonce_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+class NonceManager:
+    def __init__(self, web3):
+        self.web3 = web3
+        self._nonces = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _account_lock(self, address) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(address, threading.Lock())
+
+    @contextmanager
+    def reserve(self, address):
+        # The account stays locked until the transaction using the nonce has been handed
+        # to the node, so concurrent senders on one account never reuse or skip a nonce.
+        with self.reserve_many(address, 1) as nonce:
+            yield nonce
+
+    @contextmanager
+    def reserve_many(self, address, count: int):
+        # Yields the first of `count` consecutive nonces
+        with self._account_lock(address):
+            nonce = self._nonces.get(address)
+            if nonce is None:
+                nonce = self.web3.eth.get_transaction_count(address, 'pending')
+                logger.info(f"Nonce for {address} synced from node: {nonce}")
+            try:
+                yield nonce
+            except Exception:
+                self._nonces.pop(address, None)
+                raise
+            self._nonces[address] = nonce + count
+
+    def resync(self, address):
+        with self._account_lock(address):
+            self._nonces.pop(address, None)
+        logger.warning(f"Nonce for {address} will be resynced from node")
@@ -0,0 +1,69 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .ledger import get_ledger, APPROVAL_AMOUNT
+
+logger = logging.getLogger(__name__)
+
+# Concurrent ledger reads while checking what is already on-chain
+READ_WORKERS = 16
+
+# Participants approving the contract for less than this are approved again
+MIN_ALLOWANCE = APPROVAL_AMOUNT // 2
+
+def onboard(substations: list, max_workers=READ_WORKERS):
+    # Authorizes, approves, connects and registers every participant of the topology in
+    # batch transactions. The ledger is read first, so participants that are already
+    # onboarded are skipped and running this again after a restart sends nothing.
+    ledger = get_ledger()
+    producers = _unique(producer for substation in substations for producer, _ in substation.connected_producers)
+    lines = _unique(line for substation in substations for _, line in substation.connected_producers)
+    consumers = _unique(consumer for substation in substations for consumer in substation.connected_consumers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def missing(participants, check):
+                return [participant for participant, done in zip(participants, executor.map(check, participants)) if not done]
+
+            roles = [
+                ('PRODUCER', producers, False),
+                ('SUBSTATION', substations, True),
+                ('TRANSMISSION_LINE', lines, True),
+                ('CONSUMER', consumers, True),
+            ]
+            unauthorized = {
+                contract_name: missing(participants, lambda p, c=contract_name: ledger.is_authorized(c, p.account.address))
+                for contract_name, participants, _ in roles
+            }
+            unapproved = {
+                contract_name: missing(participants, lambda p, c=contract_name: ledger.allowance(p.account.address, c) >= MIN_ALLOWANCE)
+                for contract_name, participants, approves in roles if approves
+            }
+            unconnected = missing(lines, lambda line: ledger.is_line_connected(line.account.address))
+            unregistered = missing(consumers, lambda consumer: ledger.is_consumer_registered(consumer.account.address))
+
+        tx_hashes = []
+        for contract_name, participants in unauthorized.items():
+            if participants:
+                tx_hashes += ledger.authorize_batch(contract_name, [participant.account.address for participant in participants])
+        for contract_name, participants in unapproved.items():
+            if participants:
+                tx_hashes += ledger.approve_batch(participants, contract_name)
+        if unconnected:
+            tx_hashes += ledger.connect_transmission_line_batch([line.account.address for line in unconnected])
+        if unregistered:
+            tx_hashes += ledger.register_consumer_batch([consumer.account.address for consumer in unregistered])
+        ledger.flush()
+
+        pending = sum(map(len, unauthorized.values())) + sum(map(len, unapproved.values())) + len(unconnected) + len(unregistered)
+        logger.info(f"Onboarded {len(producers)} producers, {len(lines)} lines, {len(substations)} substations and {len(consumers)} consumers: "
+                    f"{pending} pending steps sent in {len(tx_hashes)} transactions")
+        return tx_hashes
+    except Exception as e:
+        logger.error(f"Error onboarding grid participants: {e}")
+        raise
+
+def _unique(items):
+    seen = {}
+    for item in items:
+        seen.setdefault(id(item), item)
+    return list(seen.values())
@@ -1,36 +1,77 @@
 import logging
-from .blockchain import blockchain_manager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from .ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
 class PowerPlant:
+    __slots__ = ('name', '_max_output', '_time_period', 'max_output_for_period', '_arrays', '_index', '_current_output',
+                 'private_key', '_account')
+
     def __init__(self, name: str, max_output: int, account: str, time_period: int = 1):
         self.name = name
-        self.max_output = max_output
+        self._max_output = max_output
         self.time_period = time_period
+        self._arrays = None
+        self._index = None
         self.current_output = 0
         self.private_key = account
-        self.account = blockchain_manager.get_account(account)
+        self._account = None
+
+    @property
+    def account(self):
+        # Derived from the key on first use, so building a large grid costs no EC math
+        if self._account is None:
+            self._account = get_ledger().get_account(self.private_key)
+        return self._account
+
+    def bind_arrays(self, arrays, index: int):
+        # Once bound, the output is read from and written to the GridArrays state
+        self._arrays = arrays
+        self._index = index
+
+    @property
+    def current_output(self):
+        if self._arrays is not None:
+            return float(self._arrays.current_output[self._index])
+        return self._current_output
+
+    @current_output.setter
+    def current_output(self, value):
+        if self._arrays is not None:
+            self._arrays.current_output[self._index] = value
+        else:
+            self._current_output = value
 
     def authorize(self):
         try:
-            producer_contract = blockchain_manager.contracts['PRODUCER']
-            contract_function = producer_contract.functions.addAuthorizedProducer(self.account.address)
-            tx_params = blockchain_manager.get_transaction_params(AUTHORIZER_ADDRESS)
-            tx_params = contract_function.build_transaction(tx_params)
-            receipt = blockchain_manager.send_transaction(tx_params, AUTHORIZER_PRIVATE_KEY)
+            tx_hash = get_ledger().authorize('PRODUCER', self.account.address)
             
-            if receipt:
-                logger.info(f"{self.name} authorized as producer. Transaction hash: {receipt['transactionHash'].hex()}")
+            if tx_hash:
+                logger.info(f"{self.name} authorized as producer. Transaction hash: {tx_hash.hex()}")
             else:
                 raise Exception(f"Failed to authorize {self.name} as producer")
         except Exception as e:
             logger.error(f"Error in authorizing producer: {e}")
             raise
 
+    # max_output_for_period is read on every allocation, so it is kept up to date here instead
     @property
-    def max_output_for_period(self):
-        return round(self.max_output * self.time_period)
+    def max_output(self):
+        return self._max_output
+
+    @max_output.setter
+    def max_output(self, value):
+        self._max_output = value
+        self.max_output_for_period = round(value * self._time_period)
+
+    @property
+    def time_period(self):
+        return self._time_period
+
+    @time_period.setter
+    def time_period(self, value):
+        self._time_period = value
+        self.max_output_for_period = round(self._max_output * value)
 
     @property
     def available_output(self):
@@ -38,10 +79,10 @@ class PowerPlant:
 
     def reset(self):
         self.current_output = 0
-        logger.info(f"{self.name} output reset to 0")
+        logger.debug("%s output reset to 0", self.name)
 
     def request_power(self, requested_output: int):
         provided_power = min(requested_output, self.available_output)
         self.current_output += provided_power
-        logger.info(f'Producer {self.name} generated {provided_power} Wh')
+        logger.debug("Producer %s generated %s Wh", self.name, provided_power)
         return provided_power
\ No newline at end of file
@@ -0,0 +1,219 @@
+import json
+import logging
+import threading
+from time import monotonic
+from collections import deque
+from concurrent.futures import Future
+from web3._utils.method_formatters import receipt_formatter
+from web3.exceptions import MethodUnavailable, TimeExhausted, TransactionNotFound
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_TIMEOUT = 120
+POLL_INTERVAL = 0.1
+
+# Blocks whose transactions are kept, for transactions tracked after their block was read
+RECENT_BLOCKS = 64
+
+class _Pending:
+    __slots__ = ('future', 'deadline', 'raw_transaction', 'resubmits')
+
+    def __init__(self, future, deadline, raw_transaction):
+        self.future = future
+        self.deadline = deadline
+        self.raw_transaction = raw_transaction
+        self.resubmits = 0
+
+class ReceiptTracker:
+    # Resolves receipts from the new blocks instead of polling every transaction hash. One
+    # thread follows the chain head, through a newHeads subscription on `ws_url` or else by
+    # polling eth_blockNumber while anything is pending, and reads each new block once: all
+    # its receipts with eth_getBlockReceipts, or its hashes and then just the tracked receipts
+    # on nodes without it. Transactions not mined after `timeout` are passed to `resubmit`
+    # (tx_hash, raw_transaction), which returns the hash to wait for instead, or None to fail
+    # the wait with TimeExhausted. Transactions are best tracked as they are sent: one tracked
+    # after RECENT_BLOCKS later blocks were read is only found by the lookup at its timeout.
+    def __init__(self, web3, ws_url: str | None = None, poll_interval: float = POLL_INTERVAL, timeout: float = RECEIPT_TIMEOUT,
+                 resubmit=None, max_resubmits: int = 1):
+        self.web3 = web3
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.resubmit = resubmit
+        self.max_resubmits = max_resubmits
+        self._pending = {}
+        # Hashes of the last RECENT_BLOCKS blocks read, with their receipts when the block's were read
+        self._recent = deque()
+        self._recent_receipts = {}
+        self._last_block = None
+        self._head = None
+        self._subscribed = False
+        # Until the node answers that it has no eth_getBlockReceipts
+        self._block_receipts = True
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return self
+        self._last_block = self._head = self.web3.eth.block_number
+        if self.ws_url:
+            self._subscribed = True
+            self._threads.append(threading.Thread(target=self._follow_heads, name='receipt-heads', daemon=True))
+        self._threads.append(threading.Thread(target=self._run, name='receipt-tracker', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Receipt tracker following blocks from {self._last_block} {'over ' + self.ws_url if self.ws_url else 'by polling'}")
+        return self
+
+    def track(self, tx_hash, raw_transaction: bytes | None = None) -> Future:
+        # The future resolves with the receipt once a block including the transaction is read
+        key = bytes(tx_hash)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry:
+                return entry.future
+            future = Future()
+            mined = key in self._recent_receipts
+            receipt = self._recent_receipts.get(key)
+            if not mined:
+                self._pending[key] = _Pending(future, monotonic() + self.timeout, raw_transaction)
+        if mined:
+            # Its block was read before it was tracked
+            try:
+                future.set_result(receipt or self.web3.eth.get_transaction_receipt(tx_hash))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            self._wakeup.set()
+        return future
+
+    def wait(self, tx_hash, raw_transaction: bytes | None = None):
+        if not self._threads:
+            self.start()
+        return self.track(tx_hash, raw_transaction).result()
+
+    def _follow_heads(self):
+        from websockets.sync.client import connect
+        try:
+            with connect(self.ws_url) as connection:
+                connection.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+                response = json.loads(connection.recv())
+                if 'error' in response:
+                    raise Exception(response['error'].get('message', response['error']))
+                while not self._stopped.is_set():
+                    try:
+                        message = json.loads(connection.recv(timeout=1))
+                    except TimeoutError:
+                        continue
+                    self._head = int(message['params']['result']['number'], 16)
+                    self._wakeup.set()
+        except Exception as e:
+            if not self._stopped.is_set():
+                logger.warning(f"newHeads subscription on {self.ws_url} failed, polling for blocks instead: {e}")
+        finally:
+            self._subscribed = False
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # Idle until something is tracked, the head thread wakes it for every block
+            self._wakeup.wait(self.poll_interval if self._pending else None)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                head = self._head if self._subscribed else self.web3.eth.block_number
+                # Every block since the last one read, a skipped block would leave its
+                # transactions to the direct lookup after the timeout
+                for number in range(self._last_block + 1, head + 1):
+                    self._read_block(number)
+                    self._last_block = number
+            except Exception as e:
+                logger.warning(f"Error reading new blocks after {self._last_block}: {e}")
+            self._expire()
+
+    def _read_block(self, number):
+        receipts = self._get_block_receipts(number)
+        if receipts is not None:
+            by_hash = {bytes(receipt['transactionHash']): receipt for receipt in receipts}
+        else:
+            by_hash = dict.fromkeys(bytes(tx_hash) for tx_hash in self.web3.eth.get_block(number)['transactions'])
+
+        with self._lock:
+            self._recent.append(list(by_hash))
+            self._recent_receipts.update(by_hash)
+            while len(self._recent) > RECENT_BLOCKS:
+                for tx_hash in self._recent.popleft():
+                    self._recent_receipts.pop(tx_hash, None)
+            mined = [(tx_hash, self._pending.pop(tx_hash)) for tx_hash in by_hash if tx_hash in self._pending]
+
+        for tx_hash, entry in mined:
+            try:
+                entry.future.set_result(by_hash[tx_hash] or self.web3.eth.get_transaction_receipt(tx_hash))
+            except Exception as e:
+                entry.future.set_exception(e)
+        if mined:
+            logger.debug("Block %d resolved %d receipts", number, len(mined))
+
+    def _get_block_receipts(self, number):
+        if not self._block_receipts:
+            return None
+        try:
+            receipts = self.web3.manager.request_blocking('eth_getBlockReceipts', [hex(number)])
+        except (MethodUnavailable, ValueError) as e:
+            error = e.args[0] if e.args else None
+            if not isinstance(e, MethodUnavailable) and not (isinstance(error, dict) and error.get('code') == -32601):
+                raise
+            logger.info(f"Node has no eth_getBlockReceipts, reading receipts per transaction: {e}")
+            self._block_receipts = False
+            return None
+        return [receipt_formatter(receipt) for receipt in receipts]
+
+    def _expire(self):
+        now = monotonic()
+        with self._lock:
+            expired = [(tx_hash, entry) for tx_hash, entry in self._pending.items() if entry.deadline <= now]
+        for tx_hash, entry in expired:
+            # Looked up once directly, in case its block was skipped
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                receipt = None
+            except Exception as e:
+                logger.warning(f"Error looking up receipt of {tx_hash.hex()}: {e}")
+                continue
+            with self._lock:
+                self._pending.pop(tx_hash, None)
+            if receipt:
+                entry.future.set_result(receipt)
+                continue
+
+            new_hash = None
+            if self.resubmit and entry.resubmits < self.max_resubmits:
+                try:
+                    new_hash = self.resubmit(tx_hash, entry.raw_transaction)
+                except Exception as e:
+                    logger.error(f"Error resubmitting {tx_hash.hex()}: {e}")
+            if new_hash:
+                metrics.inc('receipt_resubmits_total')
+                entry.resubmits += 1
+                entry.deadline = now + self.timeout
+                with self._lock:
+                    self._pending[bytes(new_hash)] = entry
+            else:
+                entry.future.set_exception(TimeExhausted(f"Transaction {tx_hash.hex()} is not in the chain after {self.timeout} seconds"))
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for tx_hash, entry in pending.items():
+            entry.future.set_exception(TimeExhausted(f"Receipt tracker closed before {tx_hash.hex()} was mined"))
@@ -0,0 +1,238 @@
+import os
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows gathered in memory before they are appended to the column files
+BUFFER_ROWS = 1 << 16
+
+KINDS = ('generation', 'transmission', 'distribution')
+GENERATION, TRANSMISSION, DISTRIBUTION = range(len(KINDS))
+
+# One file of raw little-endian values per column, <column>.bin
+COLUMNS = {
+    'step': np.dtype('<i4'),
+    'substation': np.dtype('<i4'),
+    'participant': np.dtype('<i4'),
+    'kind': np.dtype('i1'),
+    'amount': np.dtype('<i8'),
+    'demand': np.dtype('<f8'),
+}
+
+class ResultStore:
+    # Appends the settled flows of every step to column files in the `path` directory: one
+    # row per generation, transmission and distribution with its step, substation,
+    # participant, Wh and, for distributions, the consumer's share of the demand. Rows are
+    # gathered in arrays of `buffer_rows` and appended when these are full and on flush().
+    # The rows refer to substations and participants by index, their names are in meta.json.
+    def __init__(self, path: str, buffer_rows: int = BUFFER_ROWS):
+        self.path = path
+        self.buffer_rows = buffer_rows
+        os.makedirs(path, exist_ok=True)
+        meta = _read_meta(path)
+        self.substations = meta['substations']
+        self.participants = [tuple(participant) for participant in meta['participants']]
+        self._substation_index = {name: i for i, name in enumerate(self.substations)}
+        self._participant_index = {participant: i for i, participant in enumerate(self.participants)}
+        self._meta_changed = False
+        # Indices by object as well, for building the layouts
+        self._indices = {}
+        self._layouts = {}
+        self._buffer = {name: np.empty(buffer_rows, dtype) for name, dtype in COLUMNS.items()}
+        self._rows = 0
+        # A write cut short leaves columns of different lengths, the shortest decides
+        self._truncate_rows(_row_count(path))
+
+    def append(self, step: int, settlements: list):
+        substations, participants, kinds, amounts, demands = [], [], [], [], []
+        for settlement in settlements:
+            if not settlement:
+                continue
+            layout = self._layout(settlement)
+            substations.append(layout[0])
+            participants.append(layout[1])
+            kinds.append(layout[2])
+            amounts.append(np.array([amount for (_, _, generated), (_, transmitted) in zip(settlement.generation, settlement.transmission)
+                                     for amount in (generated, transmitted)] + [amount for _, amount in settlement.distribution],
+                                    dtype=COLUMNS['amount']))
+            demands.append(layout[3])
+            demands.append(np.array(settlement.demand, dtype=COLUMNS['demand']))
+
+        if not amounts:
+            return
+        count = sum(map(len, amounts))
+        self._write({
+            'step': np.full(count, step, dtype=COLUMNS['step']),
+            'substation': np.concatenate(substations),
+            'participant': np.concatenate(participants),
+            'kind': np.concatenate(kinds),
+            'amount': np.concatenate(amounts),
+            'demand': np.concatenate(demands),
+        })
+
+    def _layout(self, settlement):
+        # A substation settles its producers and consumers in the same order every step, so
+        # the substation, participant and kind columns of its rows are only built once
+        supply, distribution = len(settlement.generation), len(settlement.distribution)
+        layout = self._layouts.get(id(settlement.substation))
+        if layout is None or layout[4] != (supply, distribution):
+            participants = [index for producer, line, _ in settlement.generation
+                            for index in (self._index('producer', producer), self._index('line', line))]
+            participants += [self._index('consumer', consumer) for consumer, _ in settlement.distribution]
+            layout = self._layouts[id(settlement.substation)] = (
+                np.full(len(participants), self._index('substation', settlement.substation), dtype=COLUMNS['substation']),
+                np.array(participants, dtype=COLUMNS['participant']),
+                np.array([GENERATION, TRANSMISSION] * supply + [DISTRIBUTION] * distribution, dtype=COLUMNS['kind']),
+                np.full(2 * supply, np.nan, dtype=COLUMNS['demand']),
+                (supply, distribution),
+            )
+        return layout
+
+    def _index(self, role, participant):
+        index = self._indices.get((role, id(participant)))
+        if index is None:
+            if role == 'substation':
+                index = self._substation_index.get(participant.name)
+                if index is None:
+                    index = self._substation_index[participant.name] = len(self.substations)
+                    self.substations.append(participant.name)
+                    self._meta_changed = True
+            else:
+                index = self._participant_index.get((role, participant.name))
+                if index is None:
+                    index = self._participant_index[(role, participant.name)] = len(self.participants)
+                    self.participants.append((role, participant.name))
+                    self._meta_changed = True
+            self._indices[(role, id(participant))] = index
+        return index
+
+    def _write(self, columns: dict):
+        count = len(columns['step'])
+        written = 0
+        while written < count:
+            rows = min(self.buffer_rows - self._rows, count - written)
+            for name, values in columns.items():
+                self._buffer[name][self._rows:self._rows + rows] = values[written:written + rows]
+            self._rows += rows
+            written += rows
+            if self._rows == self.buffer_rows:
+                self.flush()
+
+    def flush(self):
+        # Names first, so no row on disk refers to a participant meta.json does not have
+        if self._meta_changed:
+            _write_meta(self.path, self.substations, self.participants)
+            self._meta_changed = False
+        if not self._rows:
+            return
+        for name in COLUMNS:
+            with open(_column_path(self.path, name), 'ab') as file:
+                file.write(self._buffer[name][:self._rows].tobytes())
+        logger.debug("%d result rows appended to %s", self._rows, self.path)
+        self._rows = 0
+
+    def truncate(self, step: int):
+        # Drops the rows of `step` and later, e.g. of steps a resumed run settles again
+        self.flush()
+        rows = _row_count(self.path)
+        if rows:
+            steps = np.memmap(_column_path(self.path, 'step'), COLUMNS['step'], mode='r', shape=(rows,))
+            rows = int(np.searchsorted(steps, step, side='left'))
+            del steps
+        self._truncate_rows(rows)
+
+    def _truncate_rows(self, rows):
+        for name, dtype in COLUMNS.items():
+            column_path = _column_path(self.path, name)
+            if os.path.exists(column_path) and os.path.getsize(column_path) > rows * dtype.itemsize:
+                os.truncate(column_path, rows * dtype.itemsize)
+
+    def close(self):
+        self.flush()
+
+class ResultReader:
+    # Queries a ResultStore directory. The columns are memory-mapped: a step range is a slice
+    # of every column, i.e. views of the files, and only the pages touched are read. Steps are
+    # stored in order, so the range is found by binary search.
+    def __init__(self, path: str):
+        self.path = path
+        meta = _read_meta(path)
+        self.substations = meta['substations']
+        self.participants = [tuple(participant) for participant in meta['participants']]
+        rows = _row_count(path)
+        self.columns = {
+            name: np.memmap(_column_path(path, name), dtype, mode='r', shape=(rows,)) if rows else np.empty(0, dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+    def __len__(self):
+        return len(self.columns['step'])
+
+    def _rows(self, start, stop):
+        steps = self.columns['step']
+        first = 0 if start is None else int(np.searchsorted(steps, start, side='left'))
+        last = len(steps) if stop is None else int(np.searchsorted(steps, stop, side='left'))
+        return slice(first, last)
+
+    def steps(self, start: int | None = None, stop: int | None = None) -> dict[str, np.ndarray]:
+        # Rows of steps start to stop - 1, counted from 0, without copying
+        rows = self._rows(start, stop)
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def participant(self, name: str, start: int | None = None, stop: int | None = None, role: str | None = None) -> dict[str, np.ndarray]:
+        # Rows of every participant called `name`, or only the one of `role`
+        indices = [i for i, (participant_role, participant_name) in enumerate(self.participants)
+                   if participant_name == name and role in (None, participant_role)]
+        if not indices:
+            raise KeyError(f"No participant {name!r} in {self.path}")
+        return self._select('participant', indices, start, stop)
+
+    def substation(self, name: str, start: int | None = None, stop: int | None = None) -> dict[str, np.ndarray]:
+        if name not in self.substations:
+            raise KeyError(f"No substation {name!r} in {self.path}")
+        return self._select('substation', [self.substations.index(name)], start, stop)
+
+    def _select(self, column, indices, start, stop):
+        rows = self.steps(start, stop)
+        matches = np.flatnonzero(np.isin(rows[column], indices))
+        return {name: values[matches] for name, values in rows.items()}
+
+    def step_totals(self, kind: str, start: int | None = None, stop: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        # Steps and the Wh of `kind` ('generation', 'transmission' or 'distribution') settled in each
+        rows = self.steps(start, stop)
+        selected = rows['kind'] == KINDS.index(kind)
+        steps, amounts = rows['step'][selected], rows['amount'][selected]
+        if not len(steps):
+            return steps, amounts
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(steps)) + 1))
+        return steps[starts], np.add.reduceat(amounts, starts)
+
+def _column_path(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+def _row_count(path):
+    sizes = [os.path.getsize(_column_path(path, name)) // dtype.itemsize if os.path.exists(_column_path(path, name)) else 0
+             for name, dtype in COLUMNS.items()]
+    return min(sizes)
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'substations': [], 'participants': []}
+
+def _write_meta(path, substations, participants):
+    meta = {
+        'columns': {name: dtype.str for name, dtype in COLUMNS.items()},
+        'kinds': KINDS,
+        'substations': substations,
+        'participants': participants,
+    }
+    # Replaced in one rename, like the checkpoint
+    meta_path = os.path.join(path, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as file:
+        json.dump(meta, file, separators=(',', ':'))
+    os.replace(meta_path + '.tmp', meta_path)
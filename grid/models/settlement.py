@@ -0,0 +1,22 @@
+import math
+
+class Settlement:
+    # Energy flows of one Substation.distribute_power round, in the order they happened
+    def __init__(self, substation):
+        self.substation = substation
+        self.generation = []
+        self.transmission = []
+        self.distribution = []
+        # Each consumer's share of the demand, in the order of distribution
+        self.demand = []
+
+    def add_generation(self, producer, line, amount: int):
+        self.generation.append((producer, line, amount))
+
+    def add_transmission(self, line, amount: int):
+        self.transmission.append((line, amount))
+
+    def add_distribution(self, consumer, amount: int, demand: float = math.nan):
+        self.distribution.append((consumer, amount))
+        self.demand.append(demand)
+
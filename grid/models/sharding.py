@@ -0,0 +1,306 @@
+import heapq
+import random
+import logging
+import threading
+import multiprocessing
+from time import monotonic
+import numpy as np
+from .consumer import Consumer
+from .keystore import Keystore
+from .ledger import get_ledger, set_ledger
+from .onboarding import onboard
+from .log_config import configure_logging
+from .grid_simulator import GridSimulator, log_summary, wait_for_next_step
+from .topology import FIRST_ACCOUNT, assign_keys, build_topology
+
+logger = logging.getLogger(__name__)
+
+# Contracts whose settlement batches a shard operator sends, as an authorized account on the
+# first and as a settlement operator on the others
+OPERATOR_CONTRACTS = ('PRODUCER',)
+SETTLEMENT_CONTRACTS = ('TRANSMISSION_LINE', 'CONSUMER')
+
+def partition_topology(spec: dict, shards: int) -> tuple[list[dict], dict[str, int]]:
+    # Splits a topology spec into at most `shards` specs. Substations sharing a producer are
+    # allocated in order against its remaining output, so they stay together: the pieces are
+    # the connected components of the substation-producer graph, packed largest first into
+    # the lightest shard by participant count. Keys are assigned first, so every participant
+    # keeps its account. Also returns the consumers connected in more than one shard, with
+    # their total number of substations.
+    spec = assign_keys(spec)
+    substations = spec['substations']
+
+    parent = list(range(len(substations)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_substation = {}
+    for s, substation in enumerate(substations):
+        for producer, _ in substation.get('producers', []):
+            other = first_substation.setdefault(producer, s)
+            parent[find(s)] = find(other)
+
+    components = {}
+    for s in range(len(substations)):
+        components.setdefault(find(s), []).append(s)
+
+    def weight(component):
+        return sum(len(substations[s].get('producers', [])) + len(substations[s].get('consumers', [])) for s in component)
+
+    loads = [(0, shard) for shard in range(min(shards, len(components)))]
+    assigned = [[] for _ in loads]
+    for component in sorted(components.values(), key=weight, reverse=True):
+        load, shard = heapq.heappop(loads)
+        assigned[shard].extend(component)
+        heapq.heappush(loads, (load + weight(component), shard))
+
+    consumer_shards = {}
+    consumer_substations = {}
+    for shard, members in enumerate(assigned):
+        for s in members:
+            for consumer in substations[s].get('consumers', []):
+                consumer_shards.setdefault(consumer, set()).add(shard)
+                consumer_substations[consumer] = consumer_substations.get(consumer, 0) + 1
+    shared = {consumer: consumer_substations[consumer] for consumer, in_shards in consumer_shards.items() if len(in_shards) > 1}
+
+    shard_specs = []
+    for members in assigned:
+        # Substations keep their order, which decides who draws first on a shared producer
+        members = sorted(members)
+        shard_substations = [substations[s] for s in members]
+        producers = {producer for substation in shard_substations for producer, _ in substation.get('producers', [])}
+        lines = {line for substation in shard_substations for _, line in substation.get('producers', [])}
+        consumers = {consumer for substation in shard_substations for consumer in substation.get('consumers', [])}
+        shard_specs.append({
+            **spec,
+            'producers': [entry for entry in spec['producers'] if entry['name'] in producers],
+            'consumers': [entry for entry in spec['consumers'] if entry['name'] in consumers],
+            'lines': [entry for entry in spec['lines'] if entry['name'] in lines],
+            'substations': shard_substations,
+        })
+    return shard_specs, shared
+
+def operator_keys(spec: dict, count: int, keystore: Keystore | None = None) -> list[str]:
+    # The keystore accounts right after the topology's own
+    keystore = keystore or Keystore()
+    spec = assign_keys(spec)
+    used = [entry['key'] for kind in ('producers', 'consumers', 'lines', 'substations') for entry in spec.get(kind, []) if isinstance(entry['key'], int)]
+    first = max(used, default=FIRST_ACCOUNT - 1) + 1
+    return [keystore.private_key(index) for index in range(first, first + count)]
+
+def authorize_operators(addresses: list[str]):
+    ledger = get_ledger()
+    for contract_name in OPERATOR_CONTRACTS:
+        missing = [address for address in addresses if not ledger.is_authorized(contract_name, address)]
+        if missing:
+            ledger.authorize_batch(contract_name, missing)
+    for contract_name in SETTLEMENT_CONTRACTS:
+        missing = [address for address in addresses if not ledger.is_settlement_operator(contract_name, address)]
+        if missing:
+            ledger.add_settlement_operators(contract_name, missing)
+    ledger.flush()
+
+class ShardedSimulator:
+    # Runs each shard of a topology in its own forked process, with its own GridSimulator,
+    # ledger connection and, on web3, its own operator account and nonces. Steps are in
+    # lockstep: the coordinator sends every shard the demand of the consumers it shares with
+    # other shards, scaled to the shard's part of their substations, and merges the step
+    # summaries the shards send back.
+    def __init__(self, spec: dict, shards: int, ledger: str = 'memory', batch_settlement: bool = True, vectorized: bool = False,
+                 demand=None, log_every: int = 1, pipelined: bool = True, max_in_flight: int | None = None):
+        self.shard_specs, self.shared = partition_topology(spec, shards)
+        if self.shared and not batch_settlement:
+            # Per-flow consumption is sent from the consumer's account, which two processes would share
+            raise ValueError(f"{len(self.shared)} consumers span several shards, which needs batch settlement")
+
+        self.ledger = ledger
+        self.batch_settlement = batch_settlement
+        self.vectorized = vectorized
+        self.demand = demand
+        self.log_every = log_every
+        self.pipelined = pipelined
+        self.max_in_flight = max_in_flight
+        self.step = 0
+        self.totals = {'substations_settled': 0, 'generated_wh': 0, 'distributed_wh': 0}
+
+        # Demand of the shared consumers is drawn here, each shard gets its part
+        consumer_specs = {entry['name']: entry for entry in assign_keys(spec)['consumers']}
+        self._shared_consumers = [
+            Consumer(name, consumer_specs[name]['min_demand'], consumer_specs[name]['max_demand'], None,
+                     consumer_specs[name].get('time_period', spec.get('time_period', 1)))
+            for name in self.shared
+        ]
+        self._shard_counts = [
+            {name: count for name in self.shared if (count := sum(name in substation.get('consumers', []) for substation in shard_spec['substations']))}
+            for shard_spec in self.shard_specs
+        ]
+        self._keys = operator_keys(spec, len(self.shard_specs)) if ledger == 'web3' else [None] * len(self.shard_specs)
+        self._processes = []
+        self._connections = []
+        self._begun = False
+
+    def start(self):
+        # Forks the workers, which wait for begin(). Forked, like the signing pool, so main.py
+        # is not re-run in them, and so to be called before the process starts any thread: the
+        # logging listener, the signing pool and the receipt tracker hold locks that a fork
+        # copies in whatever state they are in.
+        if self._processes:
+            return self
+        if threading.active_count() > 1:
+            logger.warning(f"Forking shards with {threading.active_count() - 1} other threads running, start them after the shards")
+
+        context = multiprocessing.get_context('fork')
+        for shard, (shard_spec, key) in enumerate(zip(self.shard_specs, self._keys)):
+            connection, worker_connection = context.Pipe()
+            options = {
+                'ledger': self.ledger,
+                'operator_key': key,
+                'batch_settlement': self.batch_settlement,
+                'vectorized': self.vectorized,
+                'pipelined': self.pipelined,
+                'max_in_flight': self.max_in_flight,
+            }
+            process = context.Process(target=_run_shard, args=(shard, shard_spec, self.demand, options, worker_connection),
+                                      name=f"shard-{shard}", daemon=True)
+            process.start()
+            worker_connection.close()
+            self._processes.append(process)
+            self._connections.append(connection)
+        return self
+
+    def begin(self):
+        # Once the grid is onboarded: authorizes the shard operators and has the workers build
+        # their part of the grid, logging at the coordinator's level
+        if self._begun:
+            return self
+        self.start()
+        if self.ledger == 'web3':
+            authorize_operators([get_ledger().get_account(key).address for key in self._keys])
+        if self.demand:
+            self.demand.bind(self._shared_consumers)
+
+        for connection in self._connections:
+            connection.send(logging.getLogger().level)
+        for shard, connection in enumerate(self._connections):
+            self._receive(shard, connection)
+        self._begun = True
+        logger.info(f"Started {len(self._processes)} shards with {len(self.shared)} shared consumers")
+        return self
+
+    def simulate(self, steps=1, time=0):
+        self.begin()
+        next_step_at = monotonic()
+        for step in range(steps):
+            started_at = monotonic()
+            shared_demand = self._shared_demand()
+            for connection, counts in zip(self._connections, self._shard_counts):
+                connection.send({name: shared_demand[name] * count / self.shared[name] for name, count in counts.items()})
+            summaries = [self._receive(shard, connection) for shard, connection in enumerate(self._connections)]
+            self.step += 1
+
+            summary = {
+                'step': self.step,
+                'seconds': round(monotonic() - started_at, 6),
+                **{field: sum(shard_summary[field] for shard_summary in summaries) for field in self.totals},
+                'shard_seconds': [shard_summary['seconds'] for shard_summary in summaries],
+            }
+            for field in self.totals:
+                self.totals[field] += summary[field]
+            if self.log_every and self.step % self.log_every == 0 and logger.isEnabledFor(logging.INFO):
+                log_summary(summary)
+
+            if time and step + 1 < steps:
+                next_step_at = wait_for_next_step(self.step - 1, next_step_at + time)
+
+    def _shared_demand(self):
+        if self.demand:
+            return dict(zip(self.shared, self.demand.demand(self.step).tolist()))
+        demand = {}
+        for consumer in self._shared_consumers:
+            demand[consumer.name] = consumer.get_demand()
+            consumer.reset()
+        return demand
+
+    def _receive(self, shard, connection):
+        message = connection.recv()
+        if isinstance(message, tuple) and message[0] == 'error':
+            logger.error(f"Shard {shard} failed: {message[1]}")
+            self.close()
+            raise Exception(f"Shard {shard} failed: {message[1]}")
+        return message
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        self._connections, self._processes = [], []
+        self._begun = False
+
+def _run_shard(shard, shard_spec, demand, options, connection):
+    # Worker process: waits for the coordinator's log level, builds its part of the grid, then
+    # runs one step per message
+    try:
+        log_level = connection.recv()
+        if log_level is None:
+            return
+        configure_logging(log_level, queued=False)
+        # Forked workers inherit the coordinator's generator state, consumers without a demand model would draw alike
+        random.seed()
+        if options['ledger'] == 'web3':
+            from .blockchain import BlockchainManager
+            from .web3_ledger import Web3Ledger
+            manager = BlockchainManager(pipelined=options['pipelined'])
+            if options['max_in_flight']:
+                manager.max_in_flight = options['max_in_flight']
+            set_ledger(Web3Ledger(manager, operator=(manager.get_account(options['operator_key']).address, options['operator_key'])))
+        else:
+            from .memory_ledger import InMemoryLedger
+            set_ledger(InMemoryLedger())
+
+        substations = build_topology(shard_spec, batch_settlement=options['batch_settlement'])
+        if options['ledger'] != 'web3':
+            # Every shard keeps a ledger of its own, a chain is onboarded by the coordinator before begin()
+            onboard(substations)
+        simulator = GridSimulator(substations, vectorized=options['vectorized'], demand=_ShardDemand(demand), log_every=0)
+        connection.send('ready')
+
+        while True:
+            shared_demand = connection.recv()
+            if shared_demand is None:
+                break
+            simulator.demand.shared = shared_demand
+            started_at = monotonic()
+            simulator.simulate(steps=1)
+            connection.send(simulator.summarize(simulator.step - 1, simulator.last_settlements, monotonic() - started_at))
+    except Exception as e:
+        logger.error(f"Error in shard {shard}: {e}")
+        connection.send(('error', repr(e)))
+    finally:
+        connection.close()
+
+class _ShardDemand:
+    # A shard's demand: its own model's, or NaN for consumers drawing their own, with the
+    # consumers shared with other shards set from the coordinator's values
+    def __init__(self, model):
+        self.model = model
+        self.shared = {}
+        self.consumers = []
+
+    def bind(self, consumers):
+        self.consumers = consumers
+        self._positions = {consumer.name: i for i, consumer in enumerate(consumers)}
+        if self.model:
+            self.model.bind(consumers)
+
+    def demand(self, step):
+        demand = self.model.demand(step).copy() if self.model else np.full(len(self.consumers), np.nan)
+        for name, value in self.shared.items():
+            demand[self._positions[name]] = value
+        return demand
@@ -0,0 +1,58 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from eth_account import Account
+from eth_keys.backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Below this many transactions the pool round trip costs more than signing in-process
+MIN_POOL_BATCH = 8
+
+def sign_transaction(transaction: dict, private_key: str) -> bytes:
+    return Account.sign_transaction(transaction, private_key).rawTransaction
+
+def _sign_chunk(items):
+    return [sign_transaction(transaction, private_key) for transaction, private_key in items]
+
+def native_signer_available() -> bool:
+    # eth_keys signs through libsecp256k1 when coincurve is installed, else in pure Python
+    return type(get_backend()).__name__ == 'CoinCurveECCBackend'
+
+class TransactionSigner:
+    # Signs prepared transactions for the BlockchainManager. Batches are spread over a
+    # process pool, since ECDSA and RLP encoding hold the GIL. With the native backend a
+    # signature takes microseconds, so by default the pool is only used without it.
+    def __init__(self, workers: int | None = None, min_pool_batch=MIN_POOL_BATCH):
+        if workers is None:
+            workers = 0 if native_signer_available() else os.cpu_count() or 1
+        self.workers = workers
+        self.min_pool_batch = min_pool_batch
+        self._pool = None
+
+    def start(self):
+        # Workers are forked, so main.py, which has no __main__ guard, is not re-run in them.
+        # Starting before the simulation's thread pools keeps their locks out of the children.
+        if self.workers and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            # The executor forks its workers on the first submit, so do that now
+            self._pool.submit(int).result()
+            logger.info(f"Signing pool started with {self.workers} workers")
+        return self
+
+    def sign(self, transaction: dict, private_key: str) -> bytes:
+        return sign_transaction(transaction, private_key)
+
+    def sign_many(self, items: list[tuple[dict, str]]) -> list[bytes]:
+        if not self.workers or len(items) < self.min_pool_batch:
+            return _sign_chunk(items)
+        self.start()
+        chunk_size = -(-len(items) // self.workers)
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        return [raw for chunk in self._pool.map(_sign_chunk, chunks) for raw in chunk]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
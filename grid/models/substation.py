@@ -2,29 +2,40 @@ import math
 import logging
 from .consumer import Consumer
 from .power_plant import PowerPlant
+from .settlement import Settlement
 from .transmission_line import TransmissionLine
-from .blockchain import blockchain_manager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from .ledger import get_ledger
+from .metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class Substation:
-    def __init__(self, name: str, account: str):
+    __slots__ = ('name', 'connected_producers', 'connected_consumers', 'batch_settlement', '_account', 'private_key',
+                 '_demands', '_total_demand')
+
+    def __init__(self, name: str, account: str, batch_settlement: bool = False):
         self.name = name
         self.connected_producers = []
         self.connected_consumers = []
-        self.account = blockchain_manager.get_account(account)
+        self.batch_settlement = batch_settlement
+        self._account = None
         self.private_key = account
+        # Consumer shares of this step's demand and their sum, computed once and cleared by reset()
+        self._demands = None
+        self._total_demand = None
+
+    @property
+    def account(self):
+        if self._account is None:
+            self._account = get_ledger().get_account(self.private_key)
+        return self._account
 
     def authorize(self):
         try:
-            substation_contract = blockchain_manager.contracts['SUBSTATION']
-            contract_function = substation_contract.functions.addAuthorizedOperator(self.account.address)
-            tx_params = blockchain_manager.get_transaction_params(AUTHORIZER_ADDRESS)
-            tx_params = contract_function.build_transaction(tx_params)
-            receipt = blockchain_manager.send_transaction(tx_params, AUTHORIZER_PRIVATE_KEY)
+            tx_hash = get_ledger().authorize('SUBSTATION', self.account.address)
             
-            if receipt:
-                logger.info(f"{self.name} authorized as a substation. Transaction hash: {receipt['transactionHash'].hex()}")
+            if tx_hash:
+                logger.info(f"{self.name} authorized as a substation. Transaction hash: {tx_hash.hex()}")
                 self._approve_token_transfer()
             else:
                 raise Exception(f"Failed to authorize {self.name} as a substation")
@@ -34,14 +45,9 @@ class Substation:
 
     def _approve_token_transfer(self):
         try:
-            energy_token_contract = blockchain_manager.contracts['ENERGY_TOKEN']
-            substation_contract = blockchain_manager.contracts['SUBSTATION']
-            tx = energy_token_contract.functions.approve(substation_contract.address, 1_000_000_000_000_000).build_transaction(
-                blockchain_manager.get_transaction_params(self.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, self.private_key)
-            if receipt:
-                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().approve(self, 'SUBSTATION')
+            if tx_hash:
+                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {tx_hash.hex()}")
             else:
                 raise Exception("Failed to approve token transfer")
         except Exception as e:
@@ -50,15 +56,11 @@ class Substation:
 
     def connect_producer(self, producer: PowerPlant, transmission_line: TransmissionLine):
         try:
-            producer_contract = blockchain_manager.contracts['PRODUCER']
-            tx = producer_contract.functions.connectTransmissionLine(transmission_line.account.address).build_transaction(
-                blockchain_manager.get_transaction_params(producer.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, producer.private_key)
-
-            if receipt:
-                logger.info(f"Transmission line connected to producer {producer.name}. Transaction hash: {receipt['transactionHash'].hex()}")
-                self.connected_producers.append((producer, transmission_line))
+            tx_hash = get_ledger().connect_transmission_line(producer, transmission_line)
+
+            if tx_hash:
+                logger.info(f"Transmission line connected to producer {producer.name}. Transaction hash: {tx_hash.hex()}")
+                self.attach_producer(producer, transmission_line)
             else:
                 raise Exception("Failed to connect transmission line")
         except Exception as e:
@@ -67,65 +69,140 @@ class Substation:
 
     def connect_consumer(self, consumer: Consumer):
         try:
-            substation_contract = blockchain_manager.contracts['SUBSTATION']
-            contract_function = substation_contract.functions.registerConsumer(consumer.account.address)
-            tx_params = blockchain_manager.get_transaction_params(AUTHORIZER_ADDRESS)
-            tx_params = contract_function.build_transaction(tx_params)
-            receipt = blockchain_manager.send_transaction(tx_params, AUTHORIZER_PRIVATE_KEY)
+            tx_hash = get_ledger().register_consumer(consumer)
             
-            if receipt:
-                logger.info(f"Consumer {consumer.name} registered with {self.name}. Transaction hash: {receipt['transactionHash'].hex()}")
-                consumer.connect_to_substation(self)
-                self.connected_consumers.append(consumer)
+            if tx_hash:
+                logger.info(f"Consumer {consumer.name} registered with {self.name}. Transaction hash: {tx_hash.hex()}")
+                self.attach_consumer(consumer)
             else:
                 raise Exception(f"Failed to register consumer {consumer.name}")
         except Exception as e:
             logger.error(f"Error connecting consumer to substation: {e}")
             raise
 
+    # attach_* only wire the topology in memory, the ledger side is left to onboard()
+    def attach_producer(self, producer: PowerPlant, transmission_line: TransmissionLine):
+        self.connected_producers.append((producer, transmission_line))
+
+    def attach_consumer(self, consumer: Consumer):
+        consumer.connect_to_substation(self)
+        self.connected_consumers.append(consumer)
+        self._demands = self._total_demand = None
+
+    def _load_demands(self):
+        self._demands = [consumer.get_demand() for consumer in self.connected_consumers]
+        self._total_demand = sum(self._demands)
+
+    @property
+    def demands(self) -> list[float]:
+        if self._demands is None:
+            self._load_demands()
+        return self._demands
+
+    @property
+    def total_demand(self) -> float:
+        if self._total_demand is None:
+            self._load_demands()
+        return self._total_demand
+
     def reset(self):
+        self._demands = self._total_demand = None
         for producer, _ in self.connected_producers:
             producer.reset()
         for consumer in self.connected_consumers:
             consumer.reset()
-        logger.info(f"Substation {self.name} reset all connected producers and consumers")
+        logger.debug("Substation %s reset all connected producers and consumers", self.name)
 
     def distribute_power(self):
-        logger.info(f"Substation {self.name} started power distribution")
+        with metrics.time('allocate_seconds'):
+            settlement = self.allocate_power()
+        if settlement:
+            self.settle(settlement)
+        return settlement
 
+    def allocate_power(self) -> Settlement | None:
+        logger.debug("Substation %s started power distribution", self.name)
+
+        # Not kept like the demand: producers shared with substations allocated earlier in the step have less left
         available_capacity = sum(producer.available_output for producer, _ in self.connected_producers)
         if available_capacity == 0:
-            logger.warning("No power capacity available!")
-            return
+            logger.warning("Substation %s has no power capacity available!", self.name)
+            return None
 
-        total_demand = sum(consumer.get_demand() for consumer in self.connected_consumers)
+        total_demand = self.total_demand
         if total_demand == 0:
-            logger.warning("No power demand!")
-            return
-        
-        total_power = self._generate_and_transmit_power(available_capacity, total_demand)
-        self._distribute_to_consumers(total_power, total_demand)
+            logger.warning("Substation %s has no power demand!", self.name)
+            return None
+
+        settlement = Settlement(self)
+        total_power = self._generate_and_transmit_power(available_capacity, total_demand, settlement)
+        self._distribute_to_consumers(total_power, total_demand, settlement)
+        return settlement
 
-    def _generate_and_transmit_power(self, available_capacity, total_demand):
+    def _generate_and_transmit_power(self, available_capacity, total_demand, settlement: Settlement):
         total_power = 0
         for producer, line in self.connected_producers:
             proportional_request = (producer.available_output / available_capacity) * total_demand
             generated_power = producer.request_power(proportional_request)
-            self._record_power_generation(producer, line, generated_power)
-            transmitted_power = line.transmit(generated_power)
-            self._record_power_transmission(line, transmitted_power)
+            settlement.add_generation(producer, line, round(generated_power))
+            transmitted_power = round(line.transmit(generated_power))
+            settlement.add_transmission(line, transmitted_power)
+            # Consumers are paid out of the whole Wh the substation receives, rounding the flows
+            # up could otherwise hand out more than the transfers brought in
             total_power += transmitted_power
         return total_power
 
+    def _distribute_to_consumers(self, total_power: float, total_demand: float, settlement: Settlement):
+        for consumer, demand in zip(self.connected_consumers, self.demands):
+            proportion = demand / total_demand
+            energy_distributed = math.floor(total_power * proportion)
+            settlement.add_distribution(consumer, energy_distributed, demand)
+            consumer.consume_power(energy_distributed)
+
+    def settle(self, settlement: Settlement):
+        with metrics.time('settle_seconds', mode='batch' if self.batch_settlement else 'per_flow'):
+            self._settle(settlement)
+        metrics.inc('settled_flows_total', len(settlement.generation) + len(settlement.transmission) + 2 * len(settlement.distribution))
+
+    def _settle(self, settlement: Settlement):
+        if self.batch_settlement:
+            self._record_settlement(settlement)
+            return
+
+        for (producer, line, generated_power), (_, transmitted_power) in zip(settlement.generation, settlement.transmission):
+            self._record_power_generation(producer, line, generated_power)
+            self._record_power_transmission(line, transmitted_power)
+        for consumer, energy_distributed in settlement.distribution:
+            self._record_energy_distribution(consumer, energy_distributed)
+            self._record_energy_consumption(consumer, energy_distributed)
+
+    def _record_settlement(self, settlement: Settlement):
+        try:
+            tx_hashes = get_ledger().settle_batch(self.settlement_writes(settlement))
+            logger.debug("Settlement recorded for %s. %d lines and %d consumers in %d transactions",
+                         self.name, len(settlement.generation), len(settlement.distribution), sum(map(len, tx_hashes)))
+        except Exception as e:
+            logger.error(f"Error in recording settlement: {e}")
+            raise
+
+    def settlement_writes(self, settlement: Settlement) -> list[tuple]:
+        # The ledger batch writes settling `settlement`, in the order they must land
+        lines = [line.account.address for _, line, _ in settlement.generation]
+        consumers = [consumer.account.address for consumer, _ in settlement.distribution]
+        distributed = [amount for _, amount in settlement.distribution]
+        return [
+            ('produce_energy_batch', (lines, [amount for _, _, amount in settlement.generation])),
+            ('transmit_energy_batch', (lines, self.account.address, [amount for _, amount in settlement.transmission])),
+            ('distribute_energy_batch', (self, consumers, distributed)),
+            ('consume_energy_batch', (consumers, distributed)),
+        ]
+
     def _record_power_generation(self, producer: PowerPlant, line: TransmissionLine, generated_power: int):
         try:
-            producer_contract = blockchain_manager.contracts['PRODUCER']
-            tx = producer_contract.functions.produceEnergy(line.account.address, round(generated_power)).build_transaction(
-                blockchain_manager.get_transaction_params(producer.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, producer.private_key)
-            if receipt:
-                logger.info(f"Power generation recorded for {producer.name}. Amount: {generated_power} Wh. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().produce_energy(producer, line, round(generated_power))
+            if tx_hash:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Power generation recorded for %s. Amount: %s Wh. Transaction hash: %s", producer.name, generated_power, tx_hash.hex())
             else:
                 raise Exception("Failed to record power generation")
         except Exception as e:
@@ -134,36 +211,22 @@ class Substation:
 
     def _record_power_transmission(self, line: TransmissionLine, transmitted_power: int):
         try:
-            transmission_line_contract = blockchain_manager.contracts['TRANSMISSION_LINE']
-            tx = transmission_line_contract.functions.transmitEnergy(self.account.address, round(transmitted_power)).build_transaction(
-                blockchain_manager.get_transaction_params(line.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, line.private_key)
-            if receipt:
-                logger.info(f"Power transmission recorded for {line.name}. Amount: {transmitted_power} Wh. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().transmit_energy(line, self.account.address, round(transmitted_power))
+            if tx_hash:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Power transmission recorded for %s. Amount: %s Wh. Transaction hash: %s", line.name, transmitted_power, tx_hash.hex())
             else:
                 raise Exception("Failed to record power transmission")
         except Exception as e:
             logger.error(f"Error in recording power transmission: {e}")
             raise
 
-    def _distribute_to_consumers(self, total_power: float, total_demand: float):
-        for consumer in self.connected_consumers:
-            proportion = consumer.get_demand() / total_demand
-            energy_distributed = math.floor(total_power * proportion)
-            self._record_energy_distribution(consumer, energy_distributed)
-            self._record_energy_consumption(consumer, energy_distributed)
-            consumer.consume_power(energy_distributed)
-
     def _record_energy_distribution(self, consumer: Consumer, energy_distributed: int):
         try:
-            substation_contract = blockchain_manager.contracts['SUBSTATION']
-            tx = substation_contract.functions.distributeEnergy(consumer.account.address, round(energy_distributed)).build_transaction(
-                blockchain_manager.get_transaction_params(self.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, self.private_key)
-            if receipt:
-                logger.info(f"Energy distribution recorded for {consumer.name}. Amount: {energy_distributed} Wh. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().distribute_energy(self, consumer, round(energy_distributed))
+            if tx_hash:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Energy distribution recorded for %s. Amount: %s Wh. Transaction hash: %s", consumer.name, energy_distributed, tx_hash.hex())
             else:
                 raise Exception("Failed to record energy distribution")
         except Exception as e:
@@ -172,15 +235,25 @@ class Substation:
 
     def _record_energy_consumption(self, consumer: Consumer, energy_consumed: int):
         try:
-            consumer_contract = blockchain_manager.contracts['CONSUMER']
-            tx = consumer_contract.functions.consumeEnergy(round(energy_consumed)).build_transaction(
-                blockchain_manager.get_transaction_params(consumer.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, consumer.private_key)
-            if receipt:
-                logger.info(f"Energy consumption recorded for {consumer.name}. Amount: {energy_consumed} Wh. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().consume_energy(consumer, round(energy_consumed))
+            if tx_hash:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Energy consumption recorded for %s. Amount: %s Wh. Transaction hash: %s", consumer.name, energy_consumed, tx_hash.hex())
             else:
                 raise Exception("Failed to record energy consumption")
         except Exception as e:
             logger.error(f"Error in recording energy consumption: {e}")
-            raise
\ No newline at end of file
+            raise
+
+
+def settle_batches(pending: list[tuple[Substation, Settlement]]):
+    # Settles several batch-settling substations with one ledger submission, in their order
+    try:
+        with metrics.time('settle_seconds', mode='batch'):
+            tx_hashes = get_ledger().settle_batch([write for substation, settlement in pending for write in substation.settlement_writes(settlement)])
+        metrics.inc('settled_flows_total', sum(len(settlement.generation) + len(settlement.transmission) + 2 * len(settlement.distribution)
+                                               for _, settlement in pending))
+        logger.debug("Settlement recorded for %d substations in %d transactions", len(pending), sum(map(len, tx_hashes)))
+    except Exception as e:
+        logger.error(f"Error in recording settlements: {e}")
+        raise
@@ -0,0 +1,171 @@
+import os
+import csv
+import json
+import logging
+import numpy as np
+from .consumer import Consumer
+from .keystore import Keystore
+from .substation import Substation
+from .power_plant import PowerPlant
+from .transmission_line import TransmissionLine
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+# Keystore account of the first participant, account 0 being the contract deployer
+FIRST_ACCOUNT = 1
+
+# A topology spec is a dict:
+#   time_period: default period of every producer and consumer
+#   producers:   [{name, max_output, key?, time_period?}]
+#   consumers:   [{name, min_demand, max_demand, key?, time_period?}]
+#   lines:       [{name, key?}]
+#   substations: [{name, key?, producers: [[producer, line]], consumers: [consumer]}]
+# A key is a private key or a keystore account index. Participants without one get the
+# next keystore accounts, producers first, then consumers, lines and substations.
+
+def load_topology(path: str) -> dict:
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='') as file:
+        if extension == '.json':
+            return json.load(file)
+        if extension in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ImportError("PyYAML is required to load YAML topologies")
+            return yaml.safe_load(file)
+        if extension == '.csv':
+            return _spec_from_edges(csv.DictReader(file))
+    raise ValueError(f"Unsupported topology format: {path}")
+
+def save_topology(spec: dict, path: str):
+    with open(path, 'w') as file:
+        json.dump(spec, file, indent=2)
+
+def _spec_from_edges(rows) -> dict:
+    # CSV edge lists hold one row per connection: a producer row names the producer, the line
+    # and max_output, a consumer row the consumer with its demand range. Participants on
+    # several rows take their values from the first one. The optional key, line_key and
+    # substation_key columns hold the keys of the row's participant, line and substation.
+    spec = {'producers': [], 'consumers': [], 'lines': [], 'substations': []}
+    seen = {kind: {} for kind in spec}
+    for row in rows:
+        substation = seen['substations'].get(row['substation'])
+        if substation is None:
+            substation = seen['substations'][row['substation']] = _keyed({'name': row['substation'], 'producers': [], 'consumers': []}, row.get('substation_key'))
+            spec['substations'].append(substation)
+
+        if row['kind'] == 'producer':
+            if row['name'] not in seen['producers']:
+                seen['producers'][row['name']] = _keyed({'name': row['name'], 'max_output': float(row['max_output'])}, row.get('key'))
+                spec['producers'].append(seen['producers'][row['name']])
+            if row['line'] not in seen['lines']:
+                seen['lines'][row['line']] = _keyed({'name': row['line']}, row.get('line_key'))
+                spec['lines'].append(seen['lines'][row['line']])
+            substation['producers'].append([row['name'], row['line']])
+        elif row['kind'] == 'consumer':
+            if row['name'] not in seen['consumers']:
+                seen['consumers'][row['name']] = _keyed({'name': row['name'], 'min_demand': float(row['min_demand']), 'max_demand': float(row['max_demand'])}, row.get('key'))
+                spec['consumers'].append(seen['consumers'][row['name']])
+            substation['consumers'].append(row['name'])
+        else:
+            raise ValueError(f"Unknown connection kind {row['kind']!r} for {row['name']}")
+    return spec
+
+def _keyed(entry: dict, key: str | None) -> dict:
+    # A keystore account index or a private key, an empty cell leaves the key to assign_keys
+    if key:
+        entry['key'] = int(key) if key.isdigit() else key
+    return entry
+
+def assign_keys(spec: dict) -> dict:
+    # Copy of the spec with every participant's key filled in, in the order build_topology uses
+    next_account = FIRST_ACCOUNT
+
+    def keyed(entries):
+        nonlocal next_account
+        result = []
+        for entry in entries:
+            if entry.get('key') is None:
+                entry, next_account = {**entry, 'key': next_account}, next_account + 1
+            result.append(entry)
+        return result
+
+    return {
+        **spec,
+        'producers': keyed(spec.get('producers', [])),
+        'consumers': keyed(spec.get('consumers', [])),
+        'lines': keyed(spec.get('lines', [])),
+        'substations': keyed(spec['substations']),
+    }
+
+def build_topology(spec: dict, keystore: Keystore | None = None, batch_settlement=False) -> list[Substation]:
+    # Only builds the object graph: keys are derived from the keystore, accounts on first
+    # use, and nothing is sent to the ledger until onboard() runs
+    keystore = keystore or Keystore()
+    spec = assign_keys(spec)
+    time_period = spec.get('time_period', 1)
+
+    def key(entry):
+        value = entry['key']
+        return keystore.private_key(value) if isinstance(value, int) else value
+
+    producers = {
+        entry['name']: PowerPlant(entry['name'], entry['max_output'], key(entry), entry.get('time_period', time_period))
+        for entry in spec.get('producers', [])
+    }
+    consumers = {
+        entry['name']: Consumer(entry['name'], entry['min_demand'], entry['max_demand'], key(entry), entry.get('time_period', time_period))
+        for entry in spec.get('consumers', [])
+    }
+    lines = {entry['name']: TransmissionLine(entry['name'], key(entry)) for entry in spec.get('lines', [])}
+
+    substations = []
+    for entry in spec['substations']:
+        substation = Substation(entry['name'], key(entry), batch_settlement=batch_settlement)
+        for producer, line in entry.get('producers', []):
+            substation.attach_producer(producers[producer], lines[line])
+        for consumer in entry.get('consumers', []):
+            substation.attach_consumer(consumers[consumer])
+        substations.append(substation)
+
+    logger.info(f"Built topology with {len(producers)} producers, {len(lines)} lines, {len(substations)} substations and {len(consumers)} consumers")
+    return substations
+
+def generate_topology(substations: int, consumers_per_substation: int, producers_per_substation=2, shared_producers=0.5,
+                      shared_consumers=0.05, capacity_margin=1.2, time_period=1, seed=None) -> dict:
+    # Synthetic grid: every substation is fed by its own producers plus, with probability
+    # shared_producers, one of the previous substation's, like Plant B in main.py. A
+    # shared_consumers fraction of consumers is also fed by the next substation. Producer
+    # capacity covers the expected demand times capacity_margin.
+    rng = np.random.default_rng(seed)
+    spec = {'time_period': time_period, 'producers': [], 'consumers': [], 'lines': [], 'substations': []}
+
+    for s in range(substations):
+        substation = {'name': f"Substation {s}", 'producers': [], 'consumers': []}
+        spec['substations'].append(substation)
+
+        # Mostly households, with a few factories an order of magnitude larger
+        min_demands = rng.choice([50, 500], size=consumers_per_substation, p=[0.95, 0.05]) * 1_000_000
+        for c, min_demand in enumerate(min_demands.tolist()):
+            spec['consumers'].append({'name': f"Consumer {s}-{c}", 'min_demand': min_demand, 'max_demand': 2 * min_demand})
+            substation['consumers'].append(f"Consumer {s}-{c}")
+
+        for p in range(producers_per_substation):
+            name = f"Plant {s}-{p}"
+            spec['producers'].append({'name': name, 'max_output': round(capacity_margin * 1.5 * min_demands.sum() / producers_per_substation)})
+            spec['lines'].append({'name': f"Line {name}"})
+            substation['producers'].append([name, f"Line {name}"])
+
+    if substations > 1:
+        own_consumers = [list(substation['consumers']) for substation in spec['substations']]
+        for s, substation in enumerate(spec['substations']):
+            if s and producers_per_substation and rng.random() < shared_producers:
+                substation['producers'].append(spec['substations'][s - 1]['producers'][0])
+            next_substation = spec['substations'][(s + 1) % substations]
+            next_substation['consumers'] += [consumer for consumer in own_consumers[s] if rng.random() < shared_consumers]
+
+    return spec
@@ -1,24 +1,28 @@
 import logging
-from .blockchain import blockchain_manager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from .ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
 class TransmissionLine:
+    __slots__ = ('name', '_account', 'private_key')
+
     def __init__(self, name: str, account: str):
         self.name = name
-        self.account = blockchain_manager.get_account(account)
+        self._account = None
         self.private_key = account
 
+    @property
+    def account(self):
+        if self._account is None:
+            self._account = get_ledger().get_account(self.private_key)
+        return self._account
+
     def authorize(self):
         try:
-            transmission_line_contract = blockchain_manager.contracts['TRANSMISSION_LINE']
-            contract_function = transmission_line_contract.functions.addAuthorizedOperator(self.account.address)
-            tx_params = blockchain_manager.get_transaction_params(AUTHORIZER_ADDRESS)
-            tx_params = contract_function.build_transaction(tx_params)
-            receipt = blockchain_manager.send_transaction(tx_params, AUTHORIZER_PRIVATE_KEY)
+            tx_hash = get_ledger().authorize('TRANSMISSION_LINE', self.account.address)
             
-            if receipt:
-                logger.info(f"{self.name} authorized as a transmission line. Transaction hash: {receipt['transactionHash'].hex()}")
+            if tx_hash:
+                logger.info(f"{self.name} authorized as a transmission line. Transaction hash: {tx_hash.hex()}")
                 self._approve_token_transfer()
             else:
                 raise Exception(f"Failed to authorize {self.name} as a transmission line")
@@ -28,14 +32,9 @@ class TransmissionLine:
 
     def _approve_token_transfer(self):
         try:
-            energy_token_contract = blockchain_manager.contracts['ENERGY_TOKEN']
-            transmission_line_contract = blockchain_manager.contracts['TRANSMISSION_LINE']
-            tx = energy_token_contract.functions.approve(transmission_line_contract.address, 1_000_000_000_000_000).build_transaction(
-                blockchain_manager.get_transaction_params(self.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, self.private_key)
-            if receipt:
-                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().approve(self, 'TRANSMISSION_LINE')
+            if tx_hash:
+                logger.info(f"Token transfer approved for {self.name}. Transaction hash: {tx_hash.hex()}")
             else:
                 raise Exception("Failed to approve token transfer")
         except Exception as e:
@@ -43,18 +42,15 @@ class TransmissionLine:
             raise
 
     def transmit(self, transmitted_power: int):
-        logger.info(f"{self.name} transmitted {transmitted_power} Wh")
+        logger.debug("%s transmitted %s Wh", self.name, transmitted_power)
         return transmitted_power
 
     def record_transmission(self, substation_address: str, transmitted_power: int):
         try:
-            transmission_line_contract = blockchain_manager.contracts['TRANSMISSION_LINE']
-            tx = transmission_line_contract.functions.transmitEnergy(substation_address, round(transmitted_power)).build_transaction(
-                blockchain_manager.get_transaction_params(self.account.address)
-            )
-            receipt = blockchain_manager.send_transaction(tx, self.private_key)
-            if receipt:
-                logger.info(f"{self.name} recorded transmission of {transmitted_power} Wh to substation. Transaction hash: {receipt['transactionHash'].hex()}")
+            tx_hash = get_ledger().transmit_energy(self, substation_address, round(transmitted_power))
+            if tx_hash:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("%s recorded transmission of %s Wh to substation. Transaction hash: %s", self.name, transmitted_power, tx_hash.hex())
             else:
                 raise Exception("Failed to record power transmission")
         except Exception as e:
@@ -0,0 +1,243 @@
+import logging
+from web3.exceptions import TransactionNotFound
+from .ledger import APPROVAL_AMOUNT, MAX_BATCH_SIZE
+from .blockchain import BlockchainManager, get_blockchain_manager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+
+logger = logging.getLogger(__name__)
+
+AUTHORIZE_FUNCTIONS = {
+    'PRODUCER': 'addAuthorizedProducer',
+    'CONSUMER': 'addAuthorizedManager',
+    'SUBSTATION': 'addAuthorizedOperator',
+    'TRANSMISSION_LINE': 'addAuthorizedOperator',
+}
+
+AUTHORIZE_BATCH_FUNCTIONS = {
+    'PRODUCER': 'addAuthorizedProducers',
+    'CONSUMER': 'addAuthorizedManagers',
+    'SUBSTATION': 'addAuthorizedOperators',
+    'TRANSMISSION_LINE': 'addAuthorizedOperators',
+}
+
+AUTHORIZED_MAPPINGS = {
+    'PRODUCER': 'authorizedProducers',
+    'CONSUMER': 'authorizedManagers',
+    'SUBSTATION': 'authorizedOperators',
+    'TRANSMISSION_LINE': 'authorizedOperators',
+}
+
+class Web3Ledger:
+    def __init__(self, manager: BlockchainManager = None, operator: tuple[str, str] | None = None):
+        self.manager = manager or get_blockchain_manager()
+        # (address, private key) sending the settlement batches, an account authorized on the
+        # Producer contract and a settlement operator of the TransmissionLine and Consumer
+        # contracts. Each shard has its own, see sharding.py.
+        self.operator_address, self.operator_key = operator or (AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+
+    def get_account(self, private_key):
+        return self.manager.get_account(private_key)
+
+    # Calls are (contract name, function name, args), built by the manager from cached templates
+    def _build(self, call, sender):
+        contract_name, function_name, args = call
+        return self.manager.build_call(contract_name, function_name, args, sender)
+
+    def _send(self, call, sender, private_key):
+        return self.manager.send_transaction(self._build(call, sender), private_key)['transactionHash']
+
+    def _submit(self, call, sender, private_key):
+        return self.manager.submit_transaction(self._build(call, sender), private_key)
+
+    def _submit_many(self, calls, sent: list | None = None):
+        # (call, sender, private_key) entries, signed as one batch by the manager's signer
+        return self.manager.submit_transactions([
+            (self._build(call, sender), private_key)
+            for call, sender, private_key in calls
+        ], sent)
+
+    def authorize(self, contract_name, address):
+        call = (contract_name, AUTHORIZE_FUNCTIONS[contract_name], (address,))
+        return self._send(call, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+
+    def approve(self, participant, contract_name):
+        spender = self.manager.contracts[contract_name].address
+        call = ('ENERGY_TOKEN', 'approve', (spender, APPROVAL_AMOUNT))
+        return self._send(call, participant.account.address, participant.private_key)
+
+    def connect_transmission_line(self, producer, line):
+        call = ('PRODUCER', 'connectTransmissionLine', (line.account.address,))
+        return self._send(call, producer.account.address, producer.private_key)
+
+    def register_consumer(self, consumer):
+        call = ('SUBSTATION', 'registerConsumer', (consumer.account.address,))
+        return self._send(call, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+
+    def produce_energy(self, producer, line, amount: int):
+        call = ('PRODUCER', 'produceEnergy', (line.account.address, amount))
+        return self._submit(call, producer.account.address, producer.private_key)
+
+    def transmit_energy(self, line, to: str, amount: int):
+        call = ('TRANSMISSION_LINE', 'transmitEnergy', (to, amount))
+        return self._submit(call, line.account.address, line.private_key)
+
+    def distribute_energy(self, substation, consumer, amount: int):
+        call = ('SUBSTATION', 'distributeEnergy', (consumer.account.address, amount))
+        return self._submit(call, substation.account.address, substation.private_key)
+
+    def consume_energy(self, consumer, amount: int):
+        call = ('CONSUMER', 'consumeEnergy', (amount,))
+        return self._submit(call, consumer.account.address, consumer.private_key)
+
+    def produce_energy_batch(self, lines: list[str], amounts: list[int]):
+        return self._submit_many(self._produce_calls(lines, amounts))
+
+    def transmit_energy_batch(self, lines: list[str], to: str, amounts: list[int]):
+        return self._submit_many(self._transmit_calls(lines, to, amounts))
+
+    def distribute_energy_batch(self, substation, consumers: list[str], amounts: list[int]):
+        return self._submit_many(self._distribute_calls(substation, consumers, amounts))
+
+    def consume_energy_batch(self, consumers: list[str], amounts: list[int]):
+        return self._submit_many(self._consume_calls(consumers, amounts))
+
+    def settle_batch(self, writes: list[tuple], sent: list | None = None):
+        # (batch method name, args) writes, e.g. a step's settlements, sent in one submission so
+        # the signer signs them together. Returns the transaction hashes of each write, also
+        # appended to `sent` for every write sent in full before a failure. A call without a
+        # cached gas limit is estimated against the current state, where the tokens the earlier
+        # writes move do not exist yet: those are sent and mined first.
+        builders = {
+            'produce_energy_batch': self._produce_calls,
+            'transmit_energy_batch': self._transmit_calls,
+            'distribute_energy_batch': self._distribute_calls,
+            'consume_energy_batch': self._consume_calls,
+        }
+        results = [] if sent is None else sent
+        transactions, counts = [], []
+        for name, args in writes:
+            calls = builders[name](*args)
+            if transactions and not all(self.manager.has_gas_limit(*call) for call, _, _ in calls):
+                self._submit_writes(transactions, counts, results)
+                self.flush()
+                transactions, counts = [], []
+            transactions += [(self._build(call, sender), private_key) for call, sender, private_key in calls]
+            counts.append(len(calls))
+        self._submit_writes(transactions, counts, results)
+        return results
+
+    def _submit_writes(self, transactions, counts, results):
+        # Sends the transactions of writes of `counts` transactions each, appending the hashes
+        # of every write sent in full to `results`
+        tx_hashes = []
+        try:
+            self.manager.submit_transactions(transactions, tx_hashes)
+        finally:
+            start = 0
+            for count in counts:
+                if start + count > len(tx_hashes):
+                    break
+                results.append(tx_hashes[start:start + count])
+                start += count
+
+    def _produce_calls(self, lines, amounts):
+        return [
+            (('PRODUCER', 'produceEnergyBatch', (lines[batch], amounts[batch])), self.operator_address, self.operator_key)
+            for batch in _batches(lines)
+        ]
+
+    def _transmit_calls(self, lines, to, amounts):
+        return [
+            (('TRANSMISSION_LINE', 'transmitEnergyBatch', (lines[batch], to, amounts[batch])), self.operator_address, self.operator_key)
+            for batch in _batches(lines)
+        ]
+
+    def _distribute_calls(self, substation, consumers, amounts):
+        return [
+            (('SUBSTATION', 'distributeEnergyBatch', (consumers[batch], amounts[batch])), substation.account.address, substation.private_key)
+            for batch in _batches(consumers)
+        ]
+
+    def _consume_calls(self, consumers, amounts):
+        return [
+            (('CONSUMER', 'consumeEnergyBatch', (consumers[batch], amounts[batch])), self.operator_address, self.operator_key)
+            for batch in _batches(consumers)
+        ]
+
+    def authorize_batch(self, contract_name, addresses: list[str]):
+        return self._submit_many([
+            ((contract_name, AUTHORIZE_BATCH_FUNCTIONS[contract_name], (addresses[batch],)), AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+            for batch in _batches(addresses)
+        ])
+
+    def add_settlement_operators(self, contract_name, addresses: list[str]):
+        # Only the owner, the deployer, adds settlement operators
+        return self._submit_many([
+            ((contract_name, 'addSettlementOperators', (addresses[batch],)), AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+            for batch in _batches(addresses)
+        ])
+
+    def approve_batch(self, participants: list, contract_name):
+        # Every participant approves from its own account, the approvals are still signed together
+        spender = self.manager.contracts[contract_name].address
+        return self._submit_many([
+            (('ENERGY_TOKEN', 'approve', (spender, APPROVAL_AMOUNT)), participant.account.address, participant.private_key)
+            for participant in participants
+        ])
+
+    def connect_transmission_line_batch(self, lines: list[str]):
+        return self._submit_many([
+            (('PRODUCER', 'connectTransmissionLines', (lines[batch],)), AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+            for batch in _batches(lines)
+        ])
+
+    def register_consumer_batch(self, consumers: list[str]):
+        return self._submit_many([
+            (('SUBSTATION', 'registerConsumers', (consumers[batch],)), AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY)
+            for batch in _batches(consumers)
+        ])
+
+    def is_authorized(self, contract_name, address: str) -> bool:
+        return getattr(self.manager.contracts[contract_name].functions, AUTHORIZED_MAPPINGS[contract_name])(address).call()
+
+    def is_settlement_operator(self, contract_name, address: str) -> bool:
+        return self.manager.contracts[contract_name].functions.settlementOperators(address).call()
+
+    def allowance(self, address: str, contract_name) -> int:
+        spender = self.manager.contracts[contract_name].address
+        return self.manager.contracts['ENERGY_TOKEN'].functions.allowance(address, spender).call()
+
+    def is_line_connected(self, address: str) -> bool:
+        return self.manager.contracts['PRODUCER'].functions.connectedTransmissionLines(address).call()
+
+    def is_consumer_registered(self, address: str) -> bool:
+        return self.manager.contracts['SUBSTATION'].functions.registeredConsumers(address).call()
+
+    def balance_of(self, address: str) -> int:
+        return self.manager.contracts['ENERGY_TOKEN'].functions.balanceOf(address).call()
+
+    def transaction_status(self, tx_hash) -> bool | None:
+        # True once mined successfully, False if it reverted, None if the node has no receipt
+        try:
+            return self.manager.web3.eth.get_transaction_receipt(tx_hash)['status'] == 1
+        except TransactionNotFound:
+            return None
+
+    def follow_resends(self, listener):
+        # listener(tx_hash, resent_hash) for transactions the manager sends again
+        self.manager.resend_listener = listener
+
+    def transaction_pending(self, tx_hash) -> bool:
+        # Known to the node without a receipt: in its pool, or mined since the receipt was looked up
+        try:
+            self.manager.web3.eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+
+    def flush(self):
+        if self.manager.pipelined:
+            return self.manager.collect_receipts()
+        return []
+
+def _batches(addresses):
+    return [slice(start, start + MAX_BATCH_SIZE) for start in range(0, len(addresses), MAX_BATCH_SIZE)]
@@ -1,141 +1,193 @@
 import json
 import logging
-from datetime import datetime
 from web3 import Web3
-from models.blockchain import blockchain_manager
+from hexbytes import HexBytes
+from eth_utils import function_abi_to_4byte_selector
+from eth_utils.abi import collapse_if_tuple
+from models.blockchain import get_blockchain_manager
+from models.log_config import configure_logging
+from block_fetcher import BlockFetcher
+from log_fetcher import LogFetcher, TRANSFER_TOPIC
+from transaction_index import TransactionIndex
+from report_writers import REPORT_WRITERS, HtmlReportWriter, write_report
+
+# Blocks fetched between index commits
+COMMIT_INTERVAL = 100
+# 'blocks' decodes contract calls from full blocks, 'logs' indexes EnergyToken Transfer events
+REPORT_SOURCE = 'blocks'
+INDEX_PATHS = {'blocks': 'transactions.db', 'logs': 'transfers.db'}
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+# Output formats written by the report, any of 'html', 'csv' and 'jsonl'
+REPORT_FORMATS = ('html', 'csv', 'jsonl')
+# Transactions per HTML page, None keeps the whole report in one page
+HTML_PAGE_SIZE = 10_000
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class TransactionAnalyzer:
-    def __init__(self):
-        self.web3 = blockchain_manager.web3
-        self.contracts = blockchain_manager.contracts
+    def __init__(self, index_path=None, source=REPORT_SOURCE):
+        manager = get_blockchain_manager()
+        self.web3 = manager.web3
+        self.source = source
+        self.contracts = manager.contracts
+        self.contracts_by_address = {contract.address: contract for contract in self.contracts.values()}
+        self.functions_by_address = {address: self._function_selectors(contract) for address, contract in self.contracts_by_address.items()}
+        self.index = TransactionIndex(index_path or INDEX_PATHS[source])
+        self.fetcher = BlockFetcher(self.web3)
+        self.log_fetcher = LogFetcher(self.web3, self.contracts['ENERGY_TOKEN'].address, [TRANSFER_TOPIC])
+
+    def _function_selectors(self, contract):
+        # 4-byte method id -> (name, argument names, argument types), parsed from the ABI once
+        selectors = {}
+        for fn_abi in contract.abi:
+            if fn_abi.get('type') == 'function':
+                inputs = fn_abi.get('inputs', [])
+                selectors[function_abi_to_4byte_selector(fn_abi)] = (
+                    fn_abi['name'],
+                    [arg['name'] for arg in inputs],
+                    [collapse_if_tuple(arg) for arg in inputs],
+                )
+        return selectors
 
     def decode_transaction(self, contract, tx):
         try:
-            func_obj, func_params = contract.decode_function_input(tx['input'])
-            return func_obj.fn_name, func_params
+            data = HexBytes(tx['input'])
+            func_name, arg_names, arg_types = self.functions_by_address[contract.address][bytes(data[:4])]
+            return func_name, dict(zip(arg_names, self.web3.codec.decode(arg_types, data[4:])))
         except Exception as e:
             logger.error(f"Error decoding transaction: {e}")
             return None, None
 
     def get_relevant_transactions(self):
-        relevant_txs = []
+        return list(self.iter_relevant_transactions())
+
+    def iter_relevant_transactions(self):
+        self.update_index()
+        return self.index.transactions()
+
+    def update_index(self):
         try:
             latest_block = self.web3.eth.get_block('latest')['number']
-            
-            for block_number in range(latest_block + 1):
-                block = self.web3.eth.get_block(block_number, full_transactions=True)
-                for tx in block['transactions']:
-                    if tx['to'] in [self.contracts['PRODUCER'].address, self.contracts['ENERGY_TOKEN'].address, self.contracts['TRANSMISSION_LINE'].address, self.contracts['SUBSTATION'].address, self.contracts['CONSUMER'].address]:
-                        func_name, func_params = self.decode_transaction(self.get_contract_for_address(tx['to']), tx)
-
-                        if func_name:
-                            logger.info(f"Found relevant transaction: {func_name}")
-
-                            amount = func_params.get('amount', func_params.get('value', 0))
-                            relevant_txs.append({
-                                'transactionHash': tx['hash'],
-                                'blockNumber': block_number,
-                                'from': tx['from'],
-                                'to': tx['to'],
-                                'function': func_name,
-                                'amount': amount,
-                                'timestamp': block['timestamp']
-                            })
-            return relevant_txs
+            first_block = self._find_resume_block(latest_block)
+
+            if self.source == 'logs':
+                self._index_logs(first_block, latest_block)
+            else:
+                self._index_blocks(first_block, latest_block)
+            self.index.commit()
+
+            logger.info(f"Transaction index updated from block {first_block} to {latest_block}")
         except Exception as e:
             logger.error(f"Error getting relevant transactions: {e}")
             raise
 
+    def _index_blocks(self, first_block, last_block):
+        for block in self.fetcher.blocks(first_block, last_block):
+            block_number = block['number']
+            self.index.add_block(block_number, block['hash'].hex(), self._decode_block(block))
+            if (block_number - first_block + 1) % COMMIT_INTERVAL == 0:
+                self.index.commit()
+
+    def _index_logs(self, first_block, last_block):
+        # Only blocks holding transfers are read, for their timestamp. The end of each range is
+        # recorded too, so the resume point and reorg check advance over empty ranges.
+        for start, end, logs in self.log_fetcher.ranges(first_block, last_block):
+            logs_by_block = {}
+            for log in logs:
+                logs_by_block.setdefault(log['blockNumber'], []).append(log)
+
+            for block_number, block_logs in logs_by_block.items():
+                timestamp = self.web3.eth.get_block(block_number)['timestamp']
+                self.index.add_block(block_number, block_logs[0]['blockHash'].hex(), [self._decode_transfer(log, timestamp) for log in block_logs])
+            if end not in logs_by_block:
+                self.index.add_block(end, self.web3.eth.get_block(end)['hash'].hex(), [])
+            self.index.commit()
+            logger.info(f"Indexed {len(logs)} transfers from blocks {start} to {end}")
+
+    def _decode_transfer(self, log, timestamp):
+        sender = Web3.to_checksum_address(log['topics'][1][-20:])
+        recipient = Web3.to_checksum_address(log['topics'][2][-20:])
+        if sender == ZERO_ADDRESS:
+            function = 'mint'
+        elif recipient == ZERO_ADDRESS:
+            function = 'burn'
+        else:
+            function = 'transfer'
+
+        return {
+            'transactionHash': log['transactionHash'].hex(),
+            'blockNumber': log['blockNumber'],
+            'transactionIndex': log['logIndex'],
+            'from': sender,
+            'to': recipient,
+            'function': function,
+            'amount': int.from_bytes(HexBytes(log['data']), 'big'),
+            'timestamp': timestamp,
+        }
+
+    def _find_resume_block(self, latest_block):
+        # Walk back over the recently indexed blocks until one still matches the chain
+        recent_blocks = self.index.recent_blocks()
+        for number, block_hash in recent_blocks:
+            block = self.web3.eth.get_block(number) if number <= latest_block else None
+            if block and block['hash'].hex() == block_hash:
+                if number < recent_blocks[0][0]:
+                    self.index.rollback(number + 1)
+                return number + 1
+
+        if recent_blocks:
+            logger.warning("Indexed blocks no longer match the chain, rebuilding the transaction index")
+            self.index.rollback(0)
+        return 0
+
+    def _decode_block(self, block):
+        relevant_txs = []
+        for tx in block['transactions']:
+            contract = self.contracts_by_address.get(tx['to'])
+            if contract:
+                func_name, func_params = self.decode_transaction(contract, tx)
+
+                if func_name:
+                    logger.info(f"Found relevant transaction: {func_name}")
+
+                    amount = func_params.get('amount', func_params.get('value', sum(func_params.get('amounts', []))))
+                    relevant_txs.append({
+                        'transactionHash': tx['hash'].hex(),
+                        'blockNumber': block['number'],
+                        'transactionIndex': tx['transactionIndex'],
+                        'from': tx['from'],
+                        'to': tx['to'],
+                        'function': func_name,
+                        'amount': amount,
+                        'timestamp': block['timestamp']
+                    })
+        return relevant_txs
+
     def get_contract_for_address(self, address):
-        for contract in self.contracts.values():
-            if contract.address == address:
-                return contract
-        return None
-
-    def generate_html_table(self, transactions):
-        html = """
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Blockchain Transactions</title>
-            <style>
-                table {
-                    border-collapse: collapse;
-                    width: 100%;
-                }
-                th, td {
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                    text-align: left;
-                }
-                th {
-                    background-color: #f2f2f2;
-                }
-                tr:nth-child(even) {
-                    background-color: #f9f9f9;
-                }
-            </style>
-        </head>
-        <body>
-            <h1>Blockchain Transactions</h1>
-            <table>
-                <tr>
-                    <th>Transaction Hash</th>
-                    <th>Block Number</th>
-                    <th>From</th>
-                    <th>To</th>
-                    <th>Function</th>
-                    <th>Amount</th>
-                    <th>Timestamp</th>
-                </tr>
-        """
-
-        for tx in transactions:
-            timestamp = datetime.fromtimestamp(tx['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-            amount = self.web3.from_wei(tx['amount'], 'ether')  # Convert from wei to ether for readability
-            html += f"""
-                <tr>
-                    <td>{tx['transactionHash'].hex()}</td>
-                    <td>{tx['blockNumber']}</td>
-                    <td>{tx['from']}</td>
-                    <td>{tx['to']}</td>
-                    <td>{tx['function']}</td>
-                    <td>{amount} EnergyTokens</td>
-                    <td>{timestamp}</td>
-                </tr>
-            """
-
-        html += """
-            </table>
-        </body>
-        </html>
-        """
-
-        return html
-
-    def analyze_and_generate_report(self):
+        return self.contracts_by_address.get(address)
+
+    def create_writers(self, formats, html_page_size=None):
+        writers = []
+        for report_format in formats:
+            if report_format == 'html':
+                writers.append(HtmlReportWriter(page_size=html_page_size))
+            else:
+                writers.append(REPORT_WRITERS[report_format]())
+        return writers
+
+    def analyze_and_generate_report(self, formats=REPORT_FORMATS, html_page_size=HTML_PAGE_SIZE):
         try:
             if not self.web3.is_connected():
                 raise Exception("Not connected to Ethereum node")
 
-            transactions = self.get_relevant_transactions()
-            html_content = self.generate_html_table(transactions)
-
-            with open('blockchain_transactions.html', 'w') as f:
-                f.write(html_content)
-
-            logger.info("HTML file generated: blockchain_transactions.html")
+            transactions = self.iter_relevant_transactions()
+            write_report(transactions, self.create_writers(formats, html_page_size))
         except Exception as e:
             logger.error(f"Error in analyzing and generating report: {e}")
             raise
 
 def main():
+    configure_logging(logging.INFO, queued=False)
     try:
         analyzer = TransactionAnalyzer()
         analyzer.analyze_and_generate_report()
@@ -0,0 +1,184 @@
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# Rows are written through a large file buffer, so output goes to disk in chunks
+WRITE_BUFFER = 1 << 20
+
+HTML_HEADER = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Blockchain Transactions</title>
+    <style>
+        table {
+            border-collapse: collapse;
+            width: 100%;
+        }
+        th, td {
+            border: 1px solid #ddd;
+            padding: 8px;
+            text-align: left;
+        }
+        th {
+            background-color: #f2f2f2;
+        }
+        tr:nth-child(even) {
+            background-color: #f9f9f9;
+        }
+    </style>
+</head>
+<body>
+    <h1>Blockchain Transactions</h1>
+    <table>
+        <tr>
+            <th>Transaction Hash</th>
+            <th>Block Number</th>
+            <th>From</th>
+            <th>To</th>
+            <th>Function</th>
+            <th>Amount</th>
+            <th>Timestamp</th>
+        </tr>
+"""
+
+HTML_ROW = """
+        <tr>
+            <td>{hash}</td>
+            <td>{block}</td>
+            <td>{sender}</td>
+            <td>{recipient}</td>
+            <td>{function}</td>
+            <td>{amount} EnergyTokens</td>
+            <td>{timestamp}</td>
+        </tr>
+"""
+
+HTML_FOOTER = """
+    </table>
+    {navigation}
+</body>
+</html>
+"""
+
+def _format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+class HtmlReportWriter:
+    # Writes one HTML page, or a page every `page_size` transactions linked to each other
+    def __init__(self, path='blockchain_transactions.html', page_size=None):
+        self.path = path
+        self.page_size = page_size
+        self.paths = []
+        self._file = None
+        self._rows = 0
+
+    def _page_path(self, page):
+        if page == 0:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return f"{root}-{page + 1}{extension}"
+
+    def _open_page(self):
+        self.paths.append(self._page_path(len(self.paths)))
+        self._file = open(self.paths[-1], 'w', buffering=WRITE_BUFFER)
+        self._file.write(HTML_HEADER)
+        self._rows = 0
+
+    def _close_page(self, has_next):
+        page = len(self.paths) - 1
+        links = []
+        if page > 0:
+            links.append(f'<a href="{os.path.basename(self._page_path(page - 1))}">Previous</a>')
+        if has_next:
+            links.append(f'<a href="{os.path.basename(self._page_path(page + 1))}">Next</a>')
+        self._file.write(HTML_FOOTER.format(navigation=' '.join(links)))
+        self._file.close()
+
+    def write(self, tx):
+        if self._file is None:
+            self._open_page()
+        elif self.page_size and self._rows >= self.page_size:
+            self._close_page(has_next=True)
+            self._open_page()
+
+        self._file.write(HTML_ROW.format(
+            hash=tx['transactionHash'],
+            block=tx['blockNumber'],
+            sender=tx['from'],
+            recipient=tx['to'],
+            function=tx['function'],
+            amount=Web3.from_wei(tx['amount'], 'ether'),  # Convert from wei to ether for readability
+            timestamp=_format_timestamp(tx['timestamp']),
+        ))
+        self._rows += 1
+
+    def close(self):
+        if self._file is None:
+            self._open_page()
+        self._close_page(has_next=False)
+
+class CsvReportWriter:
+    FIELDS = ['transaction_hash', 'block_number', 'from', 'to', 'function', 'amount', 'timestamp']
+
+    def __init__(self, path='blockchain_transactions.csv'):
+        self.paths = [path]
+        self._file = open(path, 'w', newline='', buffering=WRITE_BUFFER)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.FIELDS)
+
+    def write(self, tx):
+        self._writer.writerow([
+            tx['transactionHash'], tx['blockNumber'], tx['from'], tx['to'], tx['function'], tx['amount'], tx['timestamp'],
+        ])
+
+    def close(self):
+        self._file.close()
+
+class JsonLinesReportWriter:
+    def __init__(self, path='blockchain_transactions.jsonl'):
+        self.paths = [path]
+        self._file = open(path, 'w', buffering=WRITE_BUFFER)
+
+    def write(self, tx):
+        self._file.write(json.dumps({
+            'transaction_hash': tx['transactionHash'],
+            'block_number': tx['blockNumber'],
+            'from': tx['from'],
+            'to': tx['to'],
+            'function': tx['function'],
+            'amount': str(tx['amount']),
+            'timestamp': tx['timestamp'],
+        }))
+        self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+REPORT_WRITERS = {
+    'html': HtmlReportWriter,
+    'csv': CsvReportWriter,
+    'jsonl': JsonLinesReportWriter,
+}
+
+def write_report(transactions, writers):
+    # Streams the transactions once through every writer, never holding them all in memory
+    count = 0
+    try:
+        for tx in transactions:
+            for writer in writers:
+                writer.write(tx)
+            count += 1
+    finally:
+        for writer in writers:
+            writer.close()
+    for writer in writers:
+        logger.info(f"Report written with {count} transactions: {', '.join(writer.paths)}")
+    return count
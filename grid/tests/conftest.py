@@ -0,0 +1,34 @@
+import pytest
+from dev_node import DevNode
+from models.ledger import set_ledger
+from models.memory_ledger import InMemoryLedger
+from models.onboarding import onboard
+from models.topology import build_topology
+
+@pytest.fixture
+def dev_node():
+    # Starts DevNodes with the given options, stopped after the test
+    nodes = []
+
+    def start(websocket=False, **options):
+        node = DevNode(**options).start(websocket)
+        nodes.append(node)
+        return node
+
+    yield start
+    for node in nodes:
+        node.stop()
+
+@pytest.fixture
+def memory_grid():
+    # Builds and onboards a topology spec on a fresh InMemoryLedger, which stays the ledger
+    # until the next call, and returns both
+    def build(spec, batch_settlement=True):
+        ledger = InMemoryLedger()
+        set_ledger(ledger)
+        substations = build_topology(spec, batch_settlement=batch_settlement)
+        onboard(substations)
+        return ledger, substations
+
+    yield build
+    set_ledger(None)
@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import rlp
+from eth_account import Account
+from eth_utils import keccak
+
+# Stands in for the local Hardhat node in the tests: accepts signed legacy transactions, mines
+# them on send (automine) or every `interval` seconds, and answers the JSON-RPC methods the
+# BlockchainManager and ReceiptTracker use, over HTTP and, for newHeads, over a websocket.
+
+METHOD_NOT_FOUND = -32601
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class DevNode:
+    def __init__(self, automine=True, interval=0.05, block_receipts=True):
+        self.automine = automine
+        self.interval = interval
+        # Without it the node answers eth_getBlockReceipts with "method not found", like older nodes
+        self.block_receipts = block_receipts
+        self.blocks = [[]]
+        self.pool = []
+        self.transactions = {}
+        self.receipts = {}
+        self.nonces = {}
+        # Hashes dropped on their next send, as a node evicting them from its pool would
+        self.drop = set()
+        # Send number (from 1) -> error message returned for that eth_sendRawTransaction
+        self.send_errors = {}
+        self.sends = 0
+        # Transactions sent with a lower gas limit run out of gas
+        self.gas_needed = None
+        # Called with the eth_estimateGas transaction, returns its gas or raises RpcError like a reverting call
+        self.estimate_gas = None
+        self.calls = {}
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._stopped = threading.Event()
+        self._servers = []
+        self.url = None
+        self.ws_url = None
+
+    def start(self, websocket=False):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self._servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{server.server_port}"
+        if websocket:
+            from websockets.sync.server import serve
+            ws_server = serve(self._serve_subscription, '127.0.0.1', 0)
+            self._servers.append(ws_server)
+            threading.Thread(target=ws_server.serve_forever, daemon=True).start()
+            self.ws_url = f"ws://127.0.0.1:{ws_server.socket.getsockname()[1]}"
+        if not self.automine:
+            threading.Thread(target=self._mine_every_interval, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        for server in self._servers:
+            server.shutdown()
+
+    def mine(self):
+        with self._lock:
+            transactions, self.pool = self.pool, []
+            number = len(self.blocks)
+            for index, tx_hash in enumerate(transactions):
+                transaction = self.transactions[tx_hash]
+                failed = self.gas_needed is not None and transaction['gas'] < self.gas_needed
+                gas_used = transaction['gas'] if failed else min(transaction['gas'], 21000)
+                self.receipts[tx_hash] = {
+                    'transactionHash': tx_hash, 'blockNumber': hex(number), 'blockHash': '0x' + f"{number:064x}",
+                    'transactionIndex': hex(index), 'from': transaction['from'], 'to': transaction['to'],
+                    'gasUsed': hex(gas_used), 'cumulativeGasUsed': hex(gas_used), 'effectiveGasPrice': '0x1',
+                    'status': '0x0' if failed else '0x1', 'logs': [], 'logsBloom': '0x' + '00' * 256,
+                    'contractAddress': None, 'type': '0x0',
+                }
+                transaction['blockNumber'] = number
+            self.blocks.append(transactions)
+            subscribers = list(self._subscribers)
+        for send in subscribers:
+            try:
+                send(json.dumps({'jsonrpc': '2.0', 'method': 'eth_subscription',
+                                 'params': {'subscription': '0x1', 'result': {'number': hex(number)}}}))
+            except Exception:
+                pass
+        return number
+
+    def _mine_every_interval(self):
+        while not self._stopped.wait(self.interval):
+            self.mine()
+
+    def handle(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if method == 'eth_chainId':
+                return '0x7a69'
+            if method == 'eth_blockNumber':
+                return hex(len(self.blocks) - 1)
+            if method == 'eth_gasPrice':
+                return '0x1'
+            if method == 'eth_estimateGas':
+                return hex(self.estimate_gas(params[0]) if self.estimate_gas else self.gas_needed or 21000)
+            if method == 'eth_getTransactionCount':
+                return hex(self._transaction_count(params[0], params[1]))
+            if method == 'eth_sendRawTransaction':
+                return self._send_raw_transaction(params[0])
+            if method == 'eth_getTransactionReceipt':
+                return self.receipts.get(params[0])
+            if method == 'eth_getTransactionByHash':
+                return self._transaction(params[0])
+            if method == 'eth_getBlockReceipts' and self.block_receipts:
+                return [self.receipts[tx_hash] for tx_hash in self.blocks[int(params[0], 16)]]
+            if method == 'eth_getBlockByNumber':
+                number = int(params[0], 16)
+                return {
+                    'number': hex(number), 'hash': '0x' + f"{number:064x}", 'parentHash': '0x' + '00' * 32,
+                    'transactions': self.blocks[number], 'timestamp': '0x0', 'gasLimit': '0x0', 'gasUsed': '0x0',
+                    'miner': '0x' + '00' * 20, 'extraData': '0x', 'difficulty': '0x0',
+                }
+        raise RpcError(METHOD_NOT_FOUND, f"Method {method} is not supported")
+
+    def _transaction_count(self, address, block):
+        mined = sum(1 for transaction in self.transactions.values() if transaction['from'] == address and 'blockNumber' in transaction)
+        return self.nonces.get(address, 0) if block == 'pending' else mined
+
+    def _send_raw_transaction(self, raw_transaction):
+        self.sends += 1
+        if self.sends in self.send_errors:
+            raise RpcError(-32000, self.send_errors[self.sends])
+        raw = bytes.fromhex(raw_transaction[2:])
+        tx_hash = '0x' + keccak(raw).hex()
+        if tx_hash in self.drop:
+            self.drop.discard(tx_hash)
+            return tx_hash
+        if tx_hash in self.transactions:
+            raise RpcError(-32000, 'already known')
+
+        nonce, _, gas, to, _, data = rlp.decode(raw)[:6]
+        sender = Account.recover_transaction(raw)
+        nonce = int.from_bytes(nonce, 'big')
+        if nonce < self.nonces.get(sender, 0):
+            raise RpcError(-32000, f"Nonce too low. Expected nonce to be {self.nonces[sender]} but got {nonce}.")
+        self.nonces[sender] = nonce + 1
+        self.transactions[tx_hash] = {'hash': tx_hash, 'from': sender, 'to': '0x' + to.hex(), 'nonce': nonce,
+                                      'gas': int.from_bytes(gas, 'big'), 'input': '0x' + data.hex(), 'raw': raw_transaction}
+        self.pool.append(tx_hash)
+        if self.automine:
+            self.mine()
+        return tx_hash
+
+    def _transaction(self, tx_hash):
+        transaction = self.transactions.get(tx_hash)
+        if transaction is None:
+            return None
+        return {
+            'hash': tx_hash, 'from': transaction['from'], 'to': transaction['to'], 'nonce': hex(transaction['nonce']),
+            'gas': hex(transaction['gas']), 'gasPrice': '0x1', 'value': '0x0', 'input': transaction['input'],
+            'blockNumber': hex(transaction['blockNumber']) if 'blockNumber' in transaction else None,
+            'blockHash': None, 'transactionIndex': None, 'v': '0x1b', 'r': '0x1', 's': '0x1', 'type': '0x0',
+        }
+
+    def _serve_subscription(self, connection):
+        request = json.loads(connection.recv())
+        connection.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': '0x1'}))
+        with self._lock:
+            self._subscribers.append(connection.send)
+        try:
+            for _ in connection:
+                pass
+        except Exception:
+            pass
+
+def _handler(node):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            try:
+                response = {'jsonrpc': '2.0', 'id': request['id'], 'result': node.handle(request['method'], request.get('params', []))}
+            except RpcError as e:
+                response = {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': e.code, 'message': e.message}}
+            body = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,74 @@
+import pytest
+from models.checkpoint import Checkpoint, CheckpointError
+from models.demand import DemandModel, RandomDemand
+from models.grid_simulator import GridSimulator
+from models.topology import generate_topology
+
+SPEC = generate_topology(4, 10, time_period=1, seed=3)
+STEPS = 8
+
+def simulator(substations, path, vectorized=False, every=1):
+    return GridSimulator(substations, vectorized=vectorized, demand=DemandModel(RandomDemand(5)),
+                         checkpoint=Checkpoint(str(path), every=every), log_every=0)
+
+def fail_call(monkeypatch, ledger, name, call):
+    # The `call`-th call of the ledger method raises, as a node dropping the connection would
+    method = getattr(ledger, name)
+    calls = []
+
+    def failing(*args):
+        calls.append(args)
+        if len(calls) == call:
+            raise ConnectionError('node went away')
+        return method(*args)
+    monkeypatch.setattr(ledger, name, failing)
+
+# Batch settlement of the whole step, and per-flow writes from the vectorized path
+@pytest.mark.parametrize('vectorized, every, method, call', [
+    (False, 1, 'distribute_energy_batch', 3),
+    (False, 3, 'distribute_energy_batch', 3),
+    (True, 1, 'consume_energy', 25),
+])
+def test_resumes_a_failed_run_like_a_clean_one(memory_grid, tmp_path, monkeypatch, vectorized, every, method, call):
+    ledger, substations = memory_grid(SPEC, batch_settlement=not vectorized)
+    simulator(substations, tmp_path / 'clean', vectorized, every).simulate(steps=STEPS)
+    clean = dict(ledger.balances), ledger.total_supply
+
+    ledger, substations = memory_grid(SPEC, batch_settlement=not vectorized)
+    run = simulator(substations, tmp_path / 'run', vectorized, every)
+    run.simulate(steps=4)
+    fail_call(monkeypatch, ledger, method, call)
+    with pytest.raises(ConnectionError):
+        run.simulate(steps=STEPS - 4)
+    monkeypatch.undo()
+
+    resumed = simulator(substations, tmp_path / 'run', vectorized, every)
+    assert resumed.step == 4 - 4 % every
+    resumed.simulate(steps=STEPS - resumed.step)
+    assert (dict(ledger.balances), ledger.total_supply) == clean
+
+def test_writes_that_landed_are_not_sent_again(memory_grid, tmp_path):
+    ledger, substations = memory_grid(SPEC)
+    simulator(substations, tmp_path / 'run', every=2).simulate(steps=3)
+    sent = ledger.transaction_count, dict(ledger.balances)
+
+    resumed = simulator(substations, tmp_path / 'run', every=2)
+    assert resumed.step == 2
+    resumed.simulate(steps=1)
+    assert (ledger.transaction_count, dict(ledger.balances)) == sent
+
+def test_refuses_to_resume_on_different_balances(memory_grid, tmp_path):
+    ledger, substations = memory_grid(SPEC)
+    simulator(substations, tmp_path / 'run').simulate(steps=2)
+    ledger.balances[substations[0].connected_consumers[0].account.address] += 1
+    with pytest.raises(CheckpointError, match="differ from the checkpoint"):
+        simulator(substations, tmp_path / 'run')
+
+def test_refuses_to_resume_while_a_journaled_transaction_is_pending(memory_grid, tmp_path, monkeypatch):
+    ledger, substations = memory_grid(SPEC)
+    simulator(substations, tmp_path / 'run', every=10).simulate(steps=3)
+    last = ledger.transaction_count
+    monkeypatch.setattr(ledger, 'transaction_status', lambda tx_hash: None if int.from_bytes(tx_hash, 'big') == last else True)
+    monkeypatch.setattr(ledger, 'transaction_pending', lambda tx_hash: True)
+    with pytest.raises(CheckpointError, match="still pending"):
+        simulator(substations, tmp_path / 'run', every=10)
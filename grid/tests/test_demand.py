@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from models.consumer import Consumer
+from models.demand import DAILY_CURVE, CsvReplayDemand, DailyProfile, DemandModel, RandomDemand
+
+def consumers(count=5):
+    return [Consumer(f"Consumer {i}", 10 * i, 10 * i + 50, None, 1 + i % 2) for i in range(count)]
+
+def steps(model, consumers, first, last):
+    model.bind(consumers)
+    return np.array([model.demand(step) for step in range(first, last)])
+
+def test_same_seed_same_demand():
+    grid = consumers()
+    assert np.array_equal(steps(DemandModel(RandomDemand(7)), grid, 0, 20), steps(DemandModel(RandomDemand(7)), grid, 0, 20))
+    assert not np.array_equal(steps(DemandModel(RandomDemand(7)), grid, 0, 20), steps(DemandModel(RandomDemand(8)), grid, 0, 20))
+
+def test_chunk_size_and_first_step_do_not_change_the_demand():
+    grid = consumers()
+    expected = steps(DemandModel(RandomDemand(7)), grid, 0, 40)
+    assert np.array_equal(steps(DemandModel(RandomDemand(7), chunk_steps=3), grid, 0, 40), expected)
+    # As after resuming from a checkpoint
+    assert np.array_equal(steps(DemandModel(RandomDemand(7), chunk_steps=5), grid, 13, 40), expected[13:])
+
+def test_demand_follows_the_consumer_not_its_position():
+    grid = consumers()
+    expected = steps(DemandModel(RandomDemand(7)), grid, 0, 10)
+    assert np.array_equal(steps(DemandModel(RandomDemand(7)), grid[::-1], 0, 10), expected[:, ::-1])
+    assert np.array_equal(steps(DemandModel(RandomDemand(7)), grid[:2], 0, 10), expected[:, :2])
+
+def test_demand_stays_within_each_consumers_range():
+    grid = consumers()
+    demand = steps(DemandModel(RandomDemand(7)), grid, 0, 200)
+    low = np.array([consumer.min_demand * consumer.time_period for consumer in grid])
+    high = np.array([consumer.max_demand * consumer.time_period for consumer in grid])
+    assert ((demand >= low) & (demand <= high)).all()
+
+def test_daily_profile_follows_the_curve():
+    factors = DailyProfile(step_hours=1).factors(0, 48)
+    assert np.allclose(factors, np.tile(DAILY_CURVE, 2))
+    assert np.allclose(DailyProfile(step_hours=0.5).factors(1, 1), (DAILY_CURVE[0] + DAILY_CURVE[1]) / 2)
+    assert np.isclose(DailyProfile(step_hours=0.25).factors(0, 96).mean(), 1)
+
+@pytest.fixture
+def readings(tmp_path):
+    path = tmp_path / 'readings.csv'
+    path.write_text('timestamp,Consumer 1,Consumer 0\n' + ''.join(f"t{step},{step},{100 + step}\n" for step in range(5)))
+    return str(path)
+
+def test_replays_readings_by_consumer_name(readings):
+    demand = steps(DemandModel(CsvReplayDemand(readings), chunk_steps=2), consumers(2), 0, 5)
+    assert demand.tolist() == [[100 + step, step] for step in range(5)]
+    with pytest.raises(ValueError, match="no readings for step 5"):
+        CsvReplayDemand(readings).window(consumers(2), 5, 2)
+
+def test_loops_over_the_readings(readings):
+    demand = steps(DemandModel(CsvReplayDemand(readings, loop=True), chunk_steps=3), consumers(2), 3, 12)
+    assert demand[:, 1].tolist() == [step % 5 for step in range(3, 12)]
+
+def test_rejects_consumers_without_readings(readings):
+    with pytest.raises(ValueError, match="no readings for 1 consumers"):
+        CsvReplayDemand(readings).window(consumers(3), 0, 1)
@@ -0,0 +1,38 @@
+import pytest
+from models.demand import DemandModel, RandomDemand
+from models.grid_arrays import GridArrays
+from models.grid_simulator import GridSimulator
+from models.power_plant import PowerPlant
+from models.substation import Substation
+from models.topology import generate_topology
+
+STEPS = 6
+
+def flows(settlements):
+    return [settlement and ([amount for _, _, amount in settlement.generation], [amount for _, amount in settlement.distribution])
+            for settlement in settlements]
+
+def run(memory_grid, spec, seed, vectorized):
+    ledger, substations = memory_grid(spec)
+    simulator = GridSimulator(substations, vectorized=vectorized, demand=DemandModel(RandomDemand(seed)), log_every=0)
+    steps = []
+    for _ in range(STEPS):
+        simulator.simulate(steps=1)
+        steps.append(flows(simulator.last_settlements))
+    return steps, dict(ledger.balances), ledger.total_supply
+
+# Short of capacity, with shared producers and consumers, so allocation order and splits matter
+@pytest.mark.parametrize('seed', range(4))
+def test_allocates_and_settles_like_the_object_model(memory_grid, seed):
+    spec = generate_topology(6, 8, shared_producers=0.8, shared_consumers=0.2, capacity_margin=0.7, seed=seed)
+    objects = run(memory_grid, spec, seed, vectorized=False)
+    arrays = run(memory_grid, spec, seed, vectorized=True)
+    assert arrays == objects
+    assert objects[2] > 0
+
+def test_rejects_a_producer_connected_twice():
+    producer = PowerPlant('Plant', 100, None)
+    substation = Substation('Substation', None)
+    substation.connected_producers += [(producer, None), (producer, None)]
+    with pytest.raises(ValueError, match="connects the same producer twice"):
+        GridArrays([substation])
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+import pytest
+from models.ledger import APPROVAL_AMOUNT
+from models.memory_ledger import AUTHORIZER, InMemoryLedger, LedgerError
+
+def participant(address):
+    return SimpleNamespace(account=SimpleNamespace(address=address))
+
+@pytest.fixture
+def ledger():
+    # Two lines feeding a substation with two consumers, onboarded as onboard() would
+    ledger = InMemoryLedger()
+    ledger.authorize_batch('PRODUCER', ['producer'])
+    ledger.authorize_batch('TRANSMISSION_LINE', ['line-1', 'line-2'])
+    ledger.authorize_batch('SUBSTATION', ['substation'])
+    ledger.authorize_batch('CONSUMER', ['consumer-1', 'consumer-2'])
+    ledger.connect_transmission_line_batch(['line-1', 'line-2'])
+    ledger.register_consumer_batch(['consumer-1', 'consumer-2'])
+    for address, contract_name in [('line-1', 'TRANSMISSION_LINE'), ('line-2', 'TRANSMISSION_LINE'), ('substation', 'SUBSTATION'),
+                                   ('consumer-1', 'CONSUMER'), ('consumer-2', 'CONSUMER')]:
+        ledger.approve(participant(address), contract_name)
+    return ledger
+
+def state(ledger):
+    # Without the zero entries a lookup adds to the defaultdicts
+    nonzero = lambda table: {key: value for key, value in table.items() if value}
+    return nonzero(ledger.balances), nonzero(ledger.allowances), ledger.total_supply, ledger.transaction_count
+
+def test_settles_a_step(ledger):
+    ledger.produce_energy_batch(['line-1', 'line-2'], [70, 30])
+    ledger.transmit_energy_batch(['line-1', 'line-2'], 'substation', [70, 30])
+    ledger.distribute_energy_batch(participant('substation'), ['consumer-1', 'consumer-2'], [60, 40])
+    ledger.consume_energy_batch(['consumer-1', 'consumer-2'], [60, 25])
+
+    assert [ledger.balance_of(address) for address in ('line-1', 'line-2', 'substation', 'consumer-1', 'consumer-2', 'CONSUMER')] == [0, 0, 0, 0, 15, 0]
+    assert ledger.total_supply == 15
+    assert ledger.allowance('substation', 'SUBSTATION') == APPROVAL_AMOUNT - 100
+
+def test_rejects_unconnected_line(ledger):
+    before = state(ledger)
+    with pytest.raises(LedgerError, match="TransmissionLine not connected"):
+        ledger.produce_energy_batch(['line-1', 'line-3'], [10, 10])
+    assert state(ledger) == before
+
+def test_reverts_every_change_of_a_failed_batch(ledger):
+    ledger.produce_energy_batch(['line-1', 'line-2'], [70, 30])
+    before = state(ledger)
+    # The first transfer goes through before the second runs out of balance
+    with pytest.raises(LedgerError, match="ERC20InsufficientBalance"):
+        ledger.transmit_energy_batch(['line-1', 'line-2'], 'substation', [70, 31])
+    assert state(ledger) == before
+
+def test_rejects_more_consumption_than_the_balance(ledger):
+    ledger.produce_energy_batch(['line-1'], [10])
+    ledger.transmit_energy_batch(['line-1'], 'substation', [10])
+    ledger.distribute_energy_batch(participant('substation'), ['consumer-1'], [10])
+    with pytest.raises(LedgerError, match="Insufficient energy tokens"):
+        ledger.consume_energy_batch(['consumer-1'], [11])
+    assert ledger.balance_of('consumer-1') == 10
+
+def test_rejects_unauthorized_senders(ledger):
+    with pytest.raises(LedgerError, match="Not authorized"):
+        ledger.distribute_energy_batch(participant('intruder'), ['consumer-1'], [0])
+    with pytest.raises(LedgerError, match="Consumer not registered"):
+        ledger.distribute_energy_batch(participant('substation'), ['intruder'], [0])
+    with pytest.raises(LedgerError, match="Line not authorized"):
+        ledger.transmit_energy_batch(['intruder'], 'substation', [0])
+
+def test_batches_moving_others_tokens_need_a_settlement_operator(ledger):
+    ledger.settlement_operators['CONSUMER'].discard(AUTHORIZER)
+    with pytest.raises(LedgerError, match="Not a settlement operator"):
+        ledger.consume_energy_batch(['consumer-1'], [0])
+    ledger.add_settlement_operators('CONSUMER', [AUTHORIZER])
+    assert ledger.is_settlement_operator('CONSUMER', AUTHORIZER)
+    ledger.consume_energy_batch(['consumer-1'], [0])
+
+def test_settle_batch_keeps_the_writes_applied_before_a_failure(ledger):
+    sent = []
+    writes = [('produce_energy_batch', (['line-1'], [10])), ('transmit_energy_batch', (['line-1'], 'substation', [11]))]
+    with pytest.raises(LedgerError):
+        ledger.settle_batch(writes, sent)
+    assert len(sent) == 1
+    assert ledger.transaction_status(sent[0][0])
+    assert ledger.balance_of('line-1') == 10
+    assert ledger.transaction_status((ledger.transaction_count + 1).to_bytes(32, 'big')) is None
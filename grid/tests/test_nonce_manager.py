@@ -0,0 +1,126 @@
+import threading
+import pytest
+from eth_account import Account
+from web3 import Web3
+from models.blockchain import BlockchainManager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from models.nonce_manager import NonceManager, is_nonce_error
+
+TRANSFER = {'to': '0x' + '33' * 20, 'value': 0, 'gas': 21000, 'gasPrice': 1, 'chainId': 0x7a69}
+OTHER = Account.from_key('0x' + '11' * 32)
+
+def send_elsewhere(web3, nonce):
+    # A transaction from the same account that the manager does not know about
+    return web3.eth.send_raw_transaction(Account.sign_transaction({**TRANSFER, 'value': 1, 'nonce': nonce}, AUTHORIZER_PRIVATE_KEY).rawTransaction)
+
+@pytest.fixture
+def node(dev_node):
+    return dev_node()
+
+def test_syncs_from_the_node_once(node):
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    for nonce in range(3):
+        send_elsewhere(web3, nonce)
+    nonces = NonceManager(web3)
+
+    with nonces.reserve(AUTHORIZER_ADDRESS) as nonce:
+        assert nonce == 3
+    with nonces.reserve_many(AUTHORIZER_ADDRESS, 5) as nonce:
+        assert nonce == 4
+    with nonces.reserve(AUTHORIZER_ADDRESS) as nonce:
+        assert nonce == 9
+    assert node.calls['eth_getTransactionCount'] == 1
+
+def test_concurrent_reservations_never_share_a_nonce(node):
+    nonces = NonceManager(Web3(Web3.HTTPProvider(node.url)))
+    reserved = []
+
+    def reserve():
+        for _ in range(25):
+            with nonces.reserve(AUTHORIZER_ADDRESS) as nonce:
+                reserved.append(nonce)
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(reserved) == list(range(200))
+
+def test_failed_send_resyncs_from_the_node(node):
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    nonces = NonceManager(web3)
+    with pytest.raises(ValueError):
+        with nonces.reserve(AUTHORIZER_ADDRESS) as nonce:
+            send_elsewhere(web3, nonce)
+            raise ValueError('send failed')
+    with nonces.reserve(AUTHORIZER_ADDRESS) as nonce:
+        assert nonce == 1
+    assert node.calls['eth_getTransactionCount'] == 2
+
+def test_recognizes_nonce_errors():
+    assert is_nonce_error(ValueError({'code': -32000, 'message': 'Nonce too low. Expected nonce to be 2 but got 1.'}))
+    # The node holds this very transaction, its nonce was not stale
+    assert not is_nonce_error(ValueError('already known'))
+    assert not is_nonce_error(ValueError('insufficient funds for gas * price + value'))
+
+def test_manager_resends_after_another_sender_took_the_nonce(node):
+    manager = BlockchainManager(node.url, pipelined=True)
+    transaction = {**TRANSFER, 'from': AUTHORIZER_ADDRESS, 'data': '0x'}
+    manager.submit_transaction(transaction, AUTHORIZER_PRIVATE_KEY)
+    send_elsewhere(manager.web3, 1)
+
+    manager.submit_transaction(transaction, AUTHORIZER_PRIVATE_KEY)
+    assert len(manager.collect_receipts()) == 2
+    assert node.nonces[AUTHORIZER_ADDRESS] == 3
+
+def test_manager_sends_the_rest_of_a_batch_after_a_nonce_error(node):
+    manager = BlockchainManager(node.url, pipelined=True)
+    transaction = {**TRANSFER, 'from': AUTHORIZER_ADDRESS, 'data': '0x'}
+    manager.submit_transaction(transaction, AUTHORIZER_PRIVATE_KEY)
+    # The second transaction of the batch is refused, the first is already in
+    node.send_errors[3] = 'Nonce too low. Expected nonce to be 3 but got 2.'
+
+    sent = manager.submit_transactions([(transaction, AUTHORIZER_PRIVATE_KEY)] * 3)
+    assert len(sent) == 3
+    assert len(manager.collect_receipts()) == 4
+    assert node.nonces[AUTHORIZER_ADDRESS] == 4
+
+def test_manager_keeps_a_transaction_the_node_already_knows(node):
+    manager = BlockchainManager(node.url, pipelined=True)
+    transaction = {**TRANSFER, 'from': AUTHORIZER_ADDRESS, 'data': '0x'}
+    # Synced while the node had nothing from the account, then the same signed transaction
+    # reached the node, e.g. from a send that timed out
+    with manager.nonce_manager.reserve_many(AUTHORIZER_ADDRESS, 0):
+        pass
+    raw_transaction = manager.signer.sign({**transaction, 'nonce': 0}, AUTHORIZER_PRIVATE_KEY)
+    manager.web3.eth.send_raw_transaction(raw_transaction)
+
+    assert manager.submit_transaction(transaction, AUTHORIZER_PRIVATE_KEY) == Web3.keccak(raw_transaction)
+    assert len(manager.collect_receipts()) == 1
+    assert len(node.transactions) == 1
+    assert node.nonces[AUTHORIZER_ADDRESS] == 1
+
+def test_concurrent_batches_reserve_the_window_without_deadlock(node, monkeypatch):
+    manager = BlockchainManager(node.url, pipelined=True, max_in_flight=2)
+    senders = [(AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY), (OTHER.address, OTHER.key)]
+    batches = [[({**TRANSFER, 'from': address, 'data': '0x'}, key) for address, key in order for _ in range(2)]
+               for order in (senders, senders[::-1])]
+
+    # Both batches take their first sender's whole window before either asks for its second
+    reserve = manager._wait_for_capacity
+    first_reserved = threading.Barrier(2, timeout=1)
+    def wait_for_capacity(sender, count):
+        reserve(sender, count)
+        try:
+            first_reserved.wait()
+        except threading.BrokenBarrierError:
+            pass
+    monkeypatch.setattr(manager, '_wait_for_capacity', wait_for_capacity)
+
+    threads = [threading.Thread(target=manager.submit_transactions, args=(batch,), daemon=True) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(manager.collect_receipts()) == 8
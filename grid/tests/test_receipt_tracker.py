@@ -0,0 +1,134 @@
+import time
+import pytest
+from eth_account import Account
+from web3 import Web3
+from web3.exceptions import TimeExhausted
+from models.blockchain import BlockchainManager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from models.receipt_tracker import ReceiptTracker, RECENT_BLOCKS
+
+TRANSFER = {'to': '0x' + '33' * 20, 'value': 0, 'gas': 21000, 'gasPrice': 1, 'chainId': 0x7a69}
+
+def signed(count, first_nonce=0):
+    return [Account.sign_transaction({**TRANSFER, 'nonce': nonce}, AUTHORIZER_PRIVATE_KEY).rawTransaction
+            for nonce in range(first_nonce, first_nonce + count)]
+
+def send_and_track(web3, tracker, raw_transactions):
+    futures = []
+    for raw_transaction in raw_transactions:
+        tx_hash = web3.eth.send_raw_transaction(raw_transaction)
+        futures.append((tx_hash, tracker.track(tx_hash, raw_transaction)))
+    return futures
+
+@pytest.fixture
+def trackers():
+    started = []
+
+    def start(web3, **options):
+        tracker = ReceiptTracker(web3, **options).start()
+        started.append(tracker)
+        return tracker
+
+    yield start
+    for tracker in started:
+        tracker.close()
+
+def test_resolves_receipts_from_block_receipts(dev_node, trackers):
+    node = dev_node(automine=False)
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, poll_interval=0.02)
+
+    for tx_hash, future in send_and_track(web3, tracker, signed(20)):
+        receipt = future.result(timeout=5)
+        assert receipt['transactionHash'] == tx_hash
+        assert receipt['status'] == 1
+    assert node.calls.get('eth_getBlockReceipts')
+    assert not node.calls.get('eth_getTransactionReceipt')
+
+def test_falls_back_to_receipts_per_transaction(dev_node, trackers):
+    node = dev_node(automine=False, block_receipts=False)
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, poll_interval=0.02)
+
+    for tx_hash, future in send_and_track(web3, tracker, signed(10)):
+        assert future.result(timeout=5)['transactionHash'] == tx_hash
+    assert not tracker._block_receipts
+    assert node.calls['eth_getTransactionReceipt'] == 10
+
+def test_follows_new_heads(dev_node, trackers):
+    node = dev_node(websocket=True, automine=False)
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, ws_url=node.ws_url, poll_interval=0.02)
+
+    for tx_hash, future in send_and_track(web3, tracker, signed(10)):
+        assert future.result(timeout=5)['transactionHash'] == tx_hash
+    assert tracker._subscribed
+    # Only read once, when the tracker started
+    assert node.calls['eth_blockNumber'] == 1
+
+def test_resolves_transactions_tracked_after_their_block(dev_node, trackers):
+    node = dev_node()
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, poll_interval=0.02)
+
+    tx_hashes = [web3.eth.send_raw_transaction(raw_transaction) for raw_transaction in signed(10)]
+    time.sleep(0.1)
+    for tx_hash in tx_hashes:
+        assert tracker.track(tx_hash).result(timeout=5)['transactionHash'] == tx_hash
+
+def test_reads_every_block_while_waiting(dev_node, trackers):
+    # More blocks than RECENT_BLOCKS are mined between two polls, the first holds the tracked transaction
+    node = dev_node()
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, poll_interval=1, timeout=30)
+    raw_transactions = signed(RECENT_BLOCKS + 8)
+    tx_hash = Web3.keccak(raw_transactions[0])
+    future = tracker.track(tx_hash)
+    time.sleep(0.1)
+
+    for raw_transaction in raw_transactions:
+        web3.eth.send_raw_transaction(raw_transaction)
+    assert future.result(timeout=5)['transactionHash'] == tx_hash
+
+def test_resubmits_dropped_transaction(dev_node, trackers):
+    node = dev_node()
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    resubmitted = []
+
+    def resubmit(tx_hash, raw_transaction):
+        resubmitted.append(tx_hash)
+        web3.eth.send_raw_transaction(raw_transaction)
+        return tx_hash
+
+    tracker = trackers(web3, poll_interval=0.02, timeout=0.3, resubmit=resubmit)
+    [raw_transaction] = signed(1)
+    node.drop.add(Web3.keccak(raw_transaction).hex())
+
+    [(tx_hash, future)] = send_and_track(web3, tracker, [raw_transaction])
+    assert future.result(timeout=5)['transactionHash'] == tx_hash
+    assert resubmitted == [tx_hash]
+
+def test_times_out_without_resubmit(dev_node, trackers):
+    node = dev_node()
+    web3 = Web3(Web3.HTTPProvider(node.url))
+    tracker = trackers(web3, poll_interval=0.02, timeout=0.3)
+    [raw_transaction] = signed(1)
+    node.drop.add(Web3.keccak(raw_transaction).hex())
+
+    [(_, future)] = send_and_track(web3, tracker, [raw_transaction])
+    with pytest.raises(TimeExhausted):
+        future.result(timeout=5)
+
+def test_manager_collects_large_automined_batch(dev_node):
+    # Every transaction is mined in a block of its own as it is sent
+    node = dev_node()
+    manager = BlockchainManager(node.url, pipelined=True, max_in_flight=4 * RECENT_BLOCKS)
+    manager.receipt_tracker = ReceiptTracker(manager.web3, poll_interval=0.02, timeout=30, resubmit=manager.rebroadcast).start()
+    transaction = {**TRANSFER, 'from': AUTHORIZER_ADDRESS, 'data': '0x'}
+    try:
+        started_at = time.monotonic()
+        manager.submit_transactions([(transaction, AUTHORIZER_PRIVATE_KEY)] * (2 * RECENT_BLOCKS))
+        receipts = manager.collect_receipts()
+        assert len(receipts) == 2 * RECENT_BLOCKS
+        assert time.monotonic() - started_at < 10
+    finally:
+        manager.receipt_tracker.close()
@@ -0,0 +1,89 @@
+import math
+import numpy as np
+import pytest
+from models.checkpoint import Checkpoint
+from models.demand import DemandModel, RandomDemand
+from models.grid_simulator import GridSimulator
+from models.results import KINDS, ResultReader, ResultStore
+from models.topology import generate_topology
+
+SPEC = generate_topology(4, 10, time_period=1, seed=3)
+STEPS = 6
+
+def expected_rows(step, settlements):
+    rows = []
+    for settlement in filter(None, settlements):
+        substation = settlement.substation.name
+        for (producer, line, generated), (_, transmitted) in zip(settlement.generation, settlement.transmission):
+            rows.append((step, substation, ('producer', producer.name), 'generation', generated, None))
+            rows.append((step, substation, ('line', line.name), 'transmission', transmitted, None))
+        for (consumer, amount), demand in zip(settlement.distribution, settlement.demand):
+            rows.append((step, substation, ('consumer', consumer.name), 'distribution', amount, demand))
+    return rows
+
+def stored_rows(reader, start=None, stop=None):
+    columns = {name: values.tolist() for name, values in reader.steps(start, stop).items()}
+    return [(step, reader.substations[substation], tuple(reader.participants[participant]), KINDS[kind], amount, None if math.isnan(demand) else demand)
+            for step, substation, participant, kind, amount, demand in zip(*(columns[name] for name in ('step', 'substation', 'participant', 'kind', 'amount', 'demand')))]
+
+def run(substations, store, steps=STEPS, vectorized=False, checkpoint=None):
+    simulator = GridSimulator(substations, vectorized=vectorized, demand=DemandModel(RandomDemand(2)), log_every=0, results=store, checkpoint=checkpoint)
+    rows = []
+    for _ in range(steps):
+        simulator.simulate(steps=1)
+        rows += expected_rows(simulator.step - 1, simulator.last_settlements)
+    store.close()
+    return rows
+
+def test_round_trips_every_flow(memory_grid, tmp_path):
+    _, substations = memory_grid(SPEC)
+    # A buffer smaller than a step, so rows are appended in several writes
+    rows = run(substations, ResultStore(str(tmp_path), buffer_rows=16))
+    reader = ResultReader(str(tmp_path))
+    assert len(reader) == len(rows)
+    assert stored_rows(reader) == rows
+    assert stored_rows(reader, 2, 4) == [row for row in rows if 2 <= row[0] < 4]
+    assert isinstance(reader.steps(2, 4)['amount'], np.memmap)
+
+def test_queries_participants_substations_and_totals(memory_grid, tmp_path):
+    _, substations = memory_grid(SPEC)
+    rows = run(substations, ResultStore(str(tmp_path)))
+    reader = ResultReader(str(tmp_path))
+
+    consumer = substations[1].connected_consumers[0].name
+    selected = reader.participant(consumer, 1, 5)
+    assert selected['amount'].tolist() == [row[4] for row in rows if row[2] == ('consumer', consumer) and 1 <= row[0] < 5]
+    assert len(reader.substation(substations[0].name)['step']) == sum(row[1] == substations[0].name for row in rows)
+    with pytest.raises(KeyError):
+        reader.participant('Nobody')
+
+    steps, totals = reader.step_totals('distribution')
+    assert steps.tolist() == list(range(STEPS))
+    assert totals.tolist() == [sum(row[4] for row in rows if row[0] == step and row[3] == 'distribution') for step in range(STEPS)]
+
+def test_vectorized_and_object_runs_store_the_same_rows(memory_grid, tmp_path):
+    _, substations = memory_grid(SPEC)
+    run(substations, ResultStore(str(tmp_path / 'objects')))
+    _, substations = memory_grid(SPEC)
+    run(substations, ResultStore(str(tmp_path / 'arrays')), vectorized=True)
+    objects, arrays = ResultReader(str(tmp_path / 'objects')), ResultReader(str(tmp_path / 'arrays'))
+    assert stored_rows(arrays) == stored_rows(objects)
+
+def test_resumed_run_replaces_the_steps_it_settles_again(memory_grid, tmp_path):
+    _, substations = memory_grid(SPEC)
+    rows = run(substations, ResultStore(str(tmp_path / 'clean')), steps=8)
+
+    _, substations = memory_grid(SPEC)
+    run(substations, ResultStore(str(tmp_path / 'run')), steps=5, checkpoint=Checkpoint(str(tmp_path / 'checkpoint'), every=3))
+    # Resumed after step 3, the rows of steps 4 and 5 are dropped and written again
+    run(substations, ResultStore(str(tmp_path / 'run')), steps=5, checkpoint=Checkpoint(str(tmp_path / 'checkpoint'), every=3))
+    assert stored_rows(ResultReader(str(tmp_path / 'run'))) == rows
+
+def test_drops_the_rows_of_a_torn_write(memory_grid, tmp_path):
+    _, substations = memory_grid(SPEC)
+    rows = run(substations, ResultStore(str(tmp_path)), steps=2)
+    with open(tmp_path / 'amount.bin', 'ab') as file:
+        file.write(b'\0' * 12)
+    ResultStore(str(tmp_path)).close()
+    assert stored_rows(ResultReader(str(tmp_path))) == rows
+    assert (tmp_path / 'amount.bin').stat().st_size == 8 * len(rows)
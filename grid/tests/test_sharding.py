@@ -0,0 +1,73 @@
+import pytest
+from models.demand import DemandModel, RandomDemand
+from models.grid_simulator import GridSimulator
+from models.sharding import ShardedSimulator, partition_topology
+from models.topology import assign_keys, generate_topology
+
+STEPS = 4
+
+@pytest.fixture
+def spec():
+    spec = generate_topology(8, 6, shared_producers=0.5, shared_consumers=0.1, time_period=1, seed=3)
+    # Substations 3 to 6 share producers and fill a shard of their own, one of their consumers
+    # is also fed by substation 0
+    spec['substations'][0]['consumers'].append(spec['substations'][3]['consumers'][0])
+    return spec
+
+def producers(substation):
+    return {producer for producer, _ in substation.get('producers', [])}
+
+def test_keeps_substations_sharing_a_producer_together(spec):
+    shard_specs, _ = partition_topology(spec, 3)
+    assert len(shard_specs) == 3
+    shard_of = {substation['name']: shard for shard, shard_spec in enumerate(shard_specs) for substation in shard_spec['substations']}
+    assert sorted(shard_of) == sorted(substation['name'] for substation in spec['substations'])
+    for substation in spec['substations']:
+        for other in spec['substations']:
+            if producers(substation) & producers(other):
+                assert shard_of[substation['name']] == shard_of[other['name']]
+
+def test_shards_keep_their_participants_and_accounts(spec):
+    shard_specs, _ = partition_topology(spec, 3)
+    keys = {entry['name']: entry['key'] for kind in ('producers', 'consumers', 'lines', 'substations') for entry in assign_keys(spec)[kind]}
+    for shard_spec in shard_specs:
+        used = {name for substation in shard_spec['substations'] for name in substation['consumers']}
+        assert {entry['name'] for entry in shard_spec['consumers']} == used
+        assert {entry['name'] for entry in shard_spec['producers']} == set().union(*map(producers, shard_spec['substations']))
+        for kind in ('producers', 'consumers', 'lines', 'substations'):
+            assert all(entry['key'] == keys[entry['name']] for entry in shard_spec[kind])
+
+def test_reports_consumers_in_several_shards(spec):
+    shard_specs, shared = partition_topology(spec, 3)
+    in_shards = {}
+    for shard, shard_spec in enumerate(shard_specs):
+        for substation in shard_spec['substations']:
+            for consumer in substation['consumers']:
+                in_shards.setdefault(consumer, set()).add(shard)
+    substation_counts = {consumer: sum(consumer in substation['consumers'] for substation in spec['substations']) for consumer in in_shards}
+    assert shared
+    assert shared == {consumer: substation_counts[consumer] for consumer, shards in in_shards.items() if len(shards) > 1}
+
+def test_never_makes_more_shards_than_independent_parts(spec):
+    shard_specs, shared = partition_topology(spec, 1)
+    assert len(shard_specs) == 1 and not shared
+    assert len(partition_topology(spec, 100)[0]) <= len(spec['substations'])
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_sharded_run_matches_a_single_process(memory_grid, spec, vectorized):
+    _, substations = memory_grid(spec)
+    simulator = GridSimulator(substations, vectorized=vectorized, demand=DemandModel(RandomDemand(1)), log_every=0)
+    expected = {'generated_wh': 0, 'distributed_wh': 0}
+    for _ in range(STEPS):
+        simulator.simulate(steps=1)
+        summary = simulator.summarize(0, simulator.last_settlements, 0)
+        for field in expected:
+            expected[field] += summary[field]
+
+    sharded = ShardedSimulator(spec, 3, vectorized=vectorized, demand=DemandModel(RandomDemand(1)), log_every=0)
+    try:
+        sharded.simulate(steps=STEPS)
+    finally:
+        sharded.close()
+    assert {field: sharded.totals[field] for field in expected} == expected
+    assert expected['distributed_wh'] > 0
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+from web3 import Web3
+import models.blockchain
+from models.blockchain import BlockchainManager, AUTHORIZER_ADDRESS, AUTHORIZER_PRIVATE_KEY
+from models.web3_ledger import Web3Ledger
+from dev_node import RpcError
+
+def function_abi(name, *types):
+    return {'type': 'function', 'name': name, 'stateMutability': 'nonpayable', 'outputs': [],
+            'inputs': [{'name': f"arg{i}", 'type': arg_type} for i, arg_type in enumerate(types)]}
+
+# The settlement batch functions, in the order a step settles
+SETTLEMENT_FUNCTIONS = {
+    'Producer': ('produceEnergyBatch', 'address[]', 'uint256[]'),
+    'TransmissionLine': ('transmitEnergyBatch', 'address[]', 'address', 'uint256[]'),
+    'Substation': ('distributeEnergyBatch', 'address[]', 'uint256[]'),
+    'Consumer': ('consumeEnergyBatch', 'address[]', 'uint256[]'),
+}
+SELECTORS = [Web3.keccak(text=f"{name}({','.join(types)})")[:4].hex() for name, *types in SETTLEMENT_FUNCTIONS.values()]
+
+LINES = [Web3.to_checksum_address('0x' + f"{i:02x}" * 20) for i in (1, 2)]
+CONSUMERS = [Web3.to_checksum_address('0x' + f"{i:02x}" * 20) for i in (3, 4, 5)]
+SUBSTATION = SimpleNamespace(account=SimpleNamespace(address=AUTHORIZER_ADDRESS), private_key=AUTHORIZER_PRIVATE_KEY)
+
+def step_writes(scale=1):
+    return [
+        ('produce_energy_batch', (LINES, [70 * scale, 30 * scale])),
+        ('transmit_energy_batch', (LINES, AUTHORIZER_ADDRESS, [70 * scale, 30 * scale])),
+        ('distribute_energy_batch', (SUBSTATION, CONSUMERS, [50 * scale, 30 * scale, 20 * scale])),
+        ('consume_energy_batch', (CONSUMERS, [50 * scale, 30 * scale, 20 * scale])),
+    ]
+
+@pytest.fixture
+def node(dev_node, monkeypatch):
+    abis = {contract_name: [function_abi(*function)] for contract_name, function in SETTLEMENT_FUNCTIONS.items()}
+    monkeypatch.setattr(models.blockchain, 'load_abi', lambda contract_name: abis.get(contract_name, []))
+    # Mined on an interval, a write sent is not in the state until the next block
+    node = dev_node(automine=False)
+
+    def estimate_gas(transaction):
+        # Each write moves the tokens the one before it leaves, which the state only holds once
+        # that one is mined: without them transferFrom reverts
+        position = SELECTORS.index(transaction['data'][:10])
+        if position and not any(mined['input'].startswith(SELECTORS[position - 1]) and 'blockNumber' in mined
+                                for mined in node.transactions.values()):
+            raise RpcError(3, 'execution reverted: ERC20InsufficientBalance')
+        return 100000
+    node.estimate_gas = estimate_gas
+    return node
+
+@pytest.mark.parametrize('pipelined', [True, False])
+def test_settles_a_step_before_any_gas_limit_is_cached(node, pipelined):
+    ledger = Web3Ledger(BlockchainManager(node.url, pipelined=pipelined))
+    results = ledger.settle_batch(step_writes())
+    ledger.flush()
+    assert len(results) == 4
+    assert all(ledger.transaction_status(tx_hash) for tx_hashes in results for tx_hash in tx_hashes)
+    assert node.calls['eth_estimateGas'] == 4
+
+    # With every limit cached the next step goes out in one submission, estimating nothing
+    results = ledger.settle_batch(step_writes(scale=2))
+    ledger.flush()
+    assert all(ledger.transaction_status(tx_hash) for tx_hashes in results for tx_hash in tx_hashes)
+    assert node.calls['eth_estimateGas'] == 4
@@ -0,0 +1,79 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent blocks whose hashes are kept to detect reorgs
+REORG_DEPTH = 12
+
+class TransactionIndex:
+    # tx_index is the row's position in its block: the transaction index for decoded
+    # transactions, the log index for Transfer events, which can share a transaction
+    def __init__(self, path='transactions.db'):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                hash TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                tx_index INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                function TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                PRIMARY KEY (hash, tx_index)
+            );
+            CREATE INDEX IF NOT EXISTS transactions_block ON transactions (block_number, tx_index);
+            CREATE TABLE IF NOT EXISTS blocks (
+                number INTEGER PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+        """)
+
+    @property
+    def last_block(self) -> int:
+        (number,) = self.connection.execute("SELECT MAX(number) FROM blocks").fetchone()
+        return -1 if number is None else number
+
+    def recent_blocks(self):
+        return self.connection.execute("SELECT number, hash FROM blocks ORDER BY number DESC").fetchall()
+
+    def rollback(self, block_number: int):
+        with self.connection:
+            self.connection.execute("DELETE FROM transactions WHERE block_number >= ?", (block_number,))
+            self.connection.execute("DELETE FROM blocks WHERE number >= ?", (block_number,))
+        logger.warning(f"Transaction index rolled back to block {block_number}")
+
+    def add_block(self, block_number: int, block_hash: str, transactions: list[dict]):
+        # Rows and the processed-block checkpoint are written together, committed by commit()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (tx['transactionHash'], tx['blockNumber'], tx['transactionIndex'], tx['from'], tx['to'], tx['function'], str(tx['amount']), tx['timestamp'])
+                for tx in transactions
+            ],
+        )
+        self.connection.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)", (block_number, block_hash))
+        self.connection.execute("DELETE FROM blocks WHERE number <= ?", (block_number - REORG_DEPTH,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def transactions(self):
+        cursor = self.connection.execute(
+            "SELECT hash, block_number, tx_index, sender, recipient, function, amount, timestamp FROM transactions ORDER BY block_number, tx_index"
+        )
+        for tx_hash, block_number, tx_index, sender, recipient, function, amount, timestamp in cursor:
+            yield {
+                'transactionHash': tx_hash,
+                'blockNumber': block_number,
+                'transactionIndex': tx_index,
+                'from': sender,
+                'to': recipient,
+                'function': function,
+                'amount': int(amount),
+                'timestamp': timestamp,
+            }
+
+    def close(self):
+        self.connection.close()